@@ -0,0 +1,301 @@
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+WORDS = ('отчёт', 'встреча', 'проект', 'бюджет', 'план', 'звонок', 'покупки', 'идея', 'черновик', 'договор')
+PRIORITIES = ('Высокий', 'Средний', 'Низкий')
+CATEGORIES = tuple(f'категория{i}' for i in range(20))
+MANAGERS = ('notes', 'tasks', 'contacts', 'finance')
+
+
+def parse_sizes(value):
+    sizes = []
+    for part in value.split(','):
+        part = part.strip().lower()
+        multiplier = 1
+        if part.endswith('k'):
+            multiplier, part = 1000, part[:-1]
+        elif part.endswith('m'):
+            multiplier, part = 1000000, part[:-1]
+        sizes.append(int(float(part) * multiplier))
+    return sizes
+
+
+def random_date(rng, base):
+    return base + datetime.timedelta(days=rng.randint(-365, 365))
+
+
+def synthetic_rows(pa, kind, size, rng):
+    base = datetime.datetime(2024, 1, 1)
+    for i in range(1, size + 1):
+        if kind == 'notes':
+            text = ' '.join(rng.choice(WORDS) for _ in range(8))
+            yield pa.Note(i, f'Заметка {i}', text, '01-01-2024 10:00:00').to_row()
+        elif kind == 'tasks':
+            yield pa.Task(
+                i, f'Задача {i}', rng.choice(WORDS), rng.choice(PRIORITIES), random_date(rng, base), rng.random() < 0.2
+            ).to_row()
+        elif kind == 'contacts':
+            yield pa.Contact(i, f'Имя{i} Фамилия{i % 997}', f'+7 9{i:09d}', f'user{i}@example.com').to_row()
+        else:
+            yield pa.FinanceRecord(
+                i, round(rng.uniform(-500, 500), 2), rng.choice(CATEGORIES), random_date(rng, base), rng.choice(WORDS)
+            ).to_row()
+
+
+def manager_class(pa, kind):
+    return {
+        'notes': pa.NoteManager,
+        'tasks': pa.TaskManager,
+        'contacts': pa.ContactManager,
+        'finance': pa.FinanceManager,
+    }[kind]
+
+
+def save_method(manager, kind):
+    names = {'notes': 'save_notes', 'tasks': 'save_tasks', 'contacts': 'save_contacts', 'finance': 'save_records'}
+    return getattr(manager, names[kind])
+
+
+def operations(kind, manager, rng, size, count):
+    # Удаляются разные существующие записи, поэтому удаление идёт последним
+    victims = rng.sample(range(1, size + 1), count)
+    existing = lambda: rng.randint(1, size)
+    if kind == 'notes':
+        return [
+            ('add', lambda i: manager.add_note(f'Новая {i}', 'текст новой заметки')),
+            ('find', lambda i: manager.find_note(existing())),
+            ('edit', lambda i: manager.edit_note(victims[i], {'title': f'Правка {i}'})),
+            ('filter', lambda i: manager.search_notes(rng.choice(WORDS))),
+            ('delete', lambda i: manager.delete_note(victims[i])),
+        ]
+    if kind == 'tasks':
+        return [
+            ('add', lambda i: manager.add_task(f'Новая {i}', 'описание', rng.choice(PRIORITIES), '01-06-2024')),
+            ('find', lambda i: manager.find_task(existing())),
+            ('edit', lambda i: manager.edit_task(victims[i], {'priority': rng.choice(PRIORITIES)})),
+            ('filter', lambda i: manager.filter_tasks(False, rng.choice(PRIORITIES))),
+            ('report', lambda i: manager.next_tasks(10, datetime.date(2024, 1, 1))),
+            ('delete', lambda i: manager.delete_task(victims[i])),
+        ]
+    if kind == 'contacts':
+        return [
+            ('add', lambda i: manager.add_contact(f'Новый{i}', f'+7 8{i:09d}', f'new{i}@example.com')),
+            ('find', lambda i: manager.find_contact(f'Имя{existing()} Фамилия{existing() % 997}')),
+            ('edit', lambda i: manager.edit_contact({'email': f'edit{i}@example.com'}, f'+7 9{victims[i]:09d}')),
+            ('filter', lambda i: manager.search_contacts(f'Имя{existing()}')),
+            ('delete', lambda i: manager.delete_contact(f'+7 9{victims[i]:09d}')),
+        ]
+    return [
+        ('add', lambda i: manager.add_record(round(rng.uniform(-500, 500), 2), rng.choice(CATEGORIES), '15-03-2024', '')),
+        ('find', lambda i: manager.find_record(existing())),
+        ('edit', lambda i: manager.edit_record(victims[i], {'amount': rng.uniform(-500, 500)})),
+        ('filter', lambda i: manager.filter_records(rng.choice(CATEGORIES))),
+        ('report', lambda i: manager.generate_report('01-01-2024', '31-12-2024')),
+        ('delete', lambda i: manager.delete_record(victims[i])),
+    ]
+
+
+def shard_aggregation(pa, kind, manager):
+    # Сводки, которые строятся по диапазонам дат в нескольких процессах
+    if kind == 'finance':
+        records = list(manager.record_list)
+        return lambda workers: pa.aggregate_finance_records(records, workers)
+    if kind == 'tasks':
+        return manager.yearly_summary
+    return None
+
+
+def percentile(timings, fraction):
+    ordered = sorted(timings)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Phase:
+    def __init__(self, results, kind, size, name, trace_memory):
+        self.results = results
+        self.kind = kind
+        self.size = size
+        self.name = name
+        self.trace_memory = trace_memory
+        self.timings = []
+
+    def __enter__(self):
+        if self.trace_memory:
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        total = time.perf_counter() - self.started
+        peak = None
+        if self.trace_memory:
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        if exc_type is not None:
+            return False
+        count = len(self.timings) or 1
+        result = {
+            'manager': self.kind,
+            'size': self.size,
+            'operation': self.name,
+            'count': count,
+            'total_s': total,
+            'per_op_us': total / count * 1e6,
+            'ops_per_s': count / total if total else None,
+            'peak_bytes': peak,
+        }
+        if self.timings:
+            result['p50_us'] = percentile(self.timings, 0.5) * 1e6
+            result['p99_us'] = percentile(self.timings, 0.99) * 1e6
+        self.results.append(result)
+        print(f'{self.kind:>9} {self.size:>9} {self.name:<11} {result["per_op_us"]:>12.1f} мкс/оп')
+        return False
+
+    def repeat(self, function, count):
+        for i in range(count):
+            started = time.perf_counter()
+            function(i)
+            self.timings.append(time.perf_counter() - started)
+
+
+def run_manager(pa, kind, size, args, results, quiet):
+    rng = random.Random(args.seed)
+    workdir = tempfile.mkdtemp(prefix=f'pa-bench-{kind}-', dir=args.workdir)
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        with contextlib.redirect_stdout(quiet):
+            manager = manager_class(pa, kind)()
+            manager.storage.meta['last_id'] = size
+            manager.storage.compact(list(synthetic_rows(pa, kind, size, rng)))
+            manager.storage.close()
+        with Phase(results, kind, size, 'load', args.trace_memory):
+            with contextlib.redirect_stdout(quiet):
+                manager = manager_class(pa, kind)()
+        aggregate = shard_aggregation(pa, kind, manager)
+        workers = args.workers or pa.PARALLEL_WORKERS
+        if aggregate is not None and size >= pa.PARALLEL_THRESHOLD and workers > 1:
+            with Phase(results, kind, size, 'aggregate_serial', args.trace_memory):
+                aggregate(1)
+            with Phase(results, kind, size, 'aggregate_parallel', args.trace_memory):
+                aggregate(workers)
+            serial, parallel = results[-2:]
+            parallel['workers'] = workers
+            parallel['speedup'] = serial['total_s'] / parallel['total_s']
+            print(f'{kind:>9} {size:>9} ускорение на {workers} процессах: {parallel["speedup"]:.2f}x')
+        count = min(args.ops, size)
+        for name, function in operations(kind, manager, rng, size, count):
+            with Phase(results, kind, size, name, args.trace_memory) as phase:
+                with contextlib.redirect_stdout(quiet):
+                    phase.repeat(function, count)
+        with Phase(results, kind, size, 'save', args.trace_memory):
+            with contextlib.redirect_stdout(quiet):
+                save_method(manager, kind)()
+        with Phase(results, kind, size, 'export_csv', args.trace_memory):
+            with contextlib.redirect_stdout(quiet):
+                manager.export_csv('export.csv')
+        manager.storage.close()
+        os.mkdir('import')
+        os.chdir('import')
+        with Phase(results, kind, size, 'import_csv', args.trace_memory):
+            with contextlib.redirect_stdout(quiet):
+                imported = manager_class(pa, kind)()
+                imported.import_csv(os.path.join('..', 'export.csv'))
+        imported.storage.close()
+    finally:
+        os.chdir(cwd)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def compare(results, baseline_filename, tolerance):
+    with open(baseline_filename, 'r', encoding='utf-8') as file:
+        baseline = {
+            (item['manager'], item['size'], item['operation']): item for item in json.load(file)['results']
+        }
+    regressions = []
+    for item in results:
+        previous = baseline.get((item['manager'], item['size'], item['operation']))
+        if previous and item['per_op_us'] > previous['per_op_us'] * (1 + tolerance):
+            regressions.append((item, previous))
+    for item, previous in regressions:
+        print(
+            f'Регрессия: {item["manager"]} {item["size"]} {item["operation"]}: '
+            f'{previous["per_op_us"]:.1f} -> {item["per_op_us"]:.1f} мкс/оп'
+        )
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Нагрузочные замеры менеджеров персонального помощника')
+    parser.add_argument('--sizes', type=parse_sizes, default=parse_sizes('1k,10k'), help='например 1k,100k,10m')
+    parser.add_argument('--managers', default=','.join(MANAGERS))
+    parser.add_argument('--ops', type=int, default=1000, help='число повторов каждой операции')
+    parser.add_argument('--storage', choices=('json', 'sqlite'), default='json')
+    parser.add_argument('--format', choices=('json', 'binary'), default='json', help='формат снимков (PA_FORMAT)')
+    parser.add_argument('--lazy', action='store_true', help='ленивая загрузка снимков (PA_LAZY=1)')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=0, help='процессы для сводок по диапазонам дат (PA_WORKERS)')
+    parser.add_argument('--trace-memory', action='store_true', help='пиковая память каждого этапа через tracemalloc')
+    parser.add_argument('--workdir', default=None)
+    parser.add_argument('--keep', action='store_true', help='не удалять сгенерированные хранилища')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--baseline', help='файл предыдущего запуска для сравнения')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    args = parser.parse_args(argv)
+
+    # Настройки хранилища читаются при импорте модуля
+    os.environ['PA_STORAGE'] = args.storage
+    os.environ['PA_LAZY'] = '1' if args.lazy else '0'
+    os.environ['PA_FORMAT'] = args.format
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import personal_assistant as pa
+
+    if args.workdir:
+        args.workdir = os.path.abspath(args.workdir)
+    output = os.path.abspath(args.output)
+    results = []
+    with open(os.devnull, 'w') as quiet:
+        for kind in args.managers.split(','):
+            for size in args.sizes:
+                run_manager(pa, kind.strip(), size, args, results, quiet)
+
+    report = {
+        'meta': {
+            'started': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'numpy': getattr(pa.load_numpy(), '__version__', None),
+            'storage': args.storage,
+            'format': args.format,
+            'lazy': args.lazy,
+            'ops': args.ops,
+            'seed': args.seed,
+            'workers': args.workers or pa.PARALLEL_WORKERS,
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        },
+        'results': results,
+    }
+    with open(output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=4)
+    print(f'Результаты сохранены в {output}')
+
+    if args.baseline and compare(results, args.baseline, args.tolerance):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
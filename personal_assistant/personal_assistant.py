@@ -1,496 +1,5008 @@
 import datetime
 import json
-import csv
+import argparse
+import atexit
+import bisect
+import contextlib
+import functools
+import heapq
+import io
+import itertools
+import math
+import operator
+import os
+import re
+import struct
+import sys
+import threading
+import time
+from array import array
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+STORAGE_BACKEND = os.environ.get('PA_STORAGE', 'json')
+SQLITE_FILENAME = os.environ.get('PA_SQLITE_FILE', 'assistant.db')
+LAZY_LOADING = os.environ.get('PA_LAZY') == '1'
+WRITE_BATCH_SIZE = int(os.environ.get('PA_WRITE_BATCH', '1'))
+WRITE_DELAY = float(os.environ.get('PA_WRITE_DELAY', '0'))
+METRICS_ENABLED = os.environ.get('PA_METRICS') == '1'
+METRICS_FILENAME = os.environ.get('PA_METRICS_FILE')
+SNAPSHOT_FORMAT = os.environ.get('PA_FORMAT', 'json')
+PARALLEL_LOADING = os.environ.get('PA_PARALLEL') == '1'
+PARALLEL_WORKERS = int(os.environ.get('PA_WORKERS') or os.cpu_count() or 1)
+PARALLEL_THRESHOLD = 200000
+COLUMNAR_THRESHOLD = 10000
+PACK_MAGIC = b'PAPACK1\n'
+
+
+@functools.lru_cache(None)
+def load_numpy():
+    # numpy нужен только векторным расчётам, поэтому импортируется при первом обращении
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+class Metrics:
+    sample_size = 4096
+
+    def __init__(self):
+        self.enabled = False
+        self.timers = {}
+        self.counters = {}
+        self.random = None
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = [0, 0.0, array('d')]
+        timer[0] += 1
+        timer[1] += seconds
+        samples = timer[2]
+        # Для перцентилей хватает равномерной выборки фиксированного размера
+        if len(samples) < self.sample_size:
+            samples.append(seconds)
+        else:
+            if self.random is None:
+                import random
+                self.random = random.Random()
+            position = self.random.randrange(timer[0])
+            if position < self.sample_size:
+                samples[position] = seconds
+
+    def reset(self):
+        self.timers.clear()
+        self.counters.clear()
+
+    def to_dict(self):
+        operations = {}
+        for name, (calls, total, samples) in self.timers.items():
+            ordered = sorted(samples)
+            operations[name] = {
+                'calls': calls,
+                'total_s': total,
+                'p50_s': ordered[int(len(ordered) * 0.5)],
+                'p99_s': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+            }
+        return {'operations': operations, 'counters': dict(self.counters)}
+
+    def to_prometheus(self):
+        data = self.to_dict()
+        lines = ['# TYPE pa_operation_seconds summary']
+        for name, operation in sorted(data['operations'].items()):
+            label = f'operation="{name}"'
+            lines.append(f'pa_operation_seconds{{{label},quantile="0.5"}} {operation["p50_s"]}')
+            lines.append(f'pa_operation_seconds{{{label},quantile="0.99"}} {operation["p99_s"]}')
+            lines.append(f'pa_operation_seconds_sum{{{label}}} {operation["total_s"]}')
+            lines.append(f'pa_operation_seconds_count{{{label}}} {operation["calls"]}')
+        for name, value in sorted(data['counters'].items()):
+            metric = 'pa_' + re.sub(r'\W', '_', name) + '_total'
+            lines.append(f'# TYPE {metric} counter')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filename):
+        # Формат выбирается по расширению: .prom - текст Prometheus, иначе JSON
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            if filename.endswith('.prom'):
+                file.write(self.to_prometheus())
+            else:
+                json.dump(self.to_dict(), file, ensure_ascii=False, indent=4)
+        os.replace(temp_filename, filename)
+
+
+metrics = Metrics()
+
+
+DATE_PATTERN = re.compile(r'(\d{1,2})-(\d{1,2})-(\d{4})(?: (\d{1,2}):(\d{1,2}):(\d{1,2}))?')
+
+
+@functools.lru_cache(4096)
+def parse_date_text(value):
+    # Одни и те же даты приходят снова и снова (фильтры, импорт, пакеты команд), поэтому разбор кешируется;
+    # регулярное выражение заметно быстрее strptime
+    match = DATE_PATTERN.fullmatch(value.strip())
+    if match is None:
+        raise ValueError(f'Некорректная дата {value!r}, ожидается ДД-ММ-ГГГГ')
+    day, month, year, hour, minute, second = (int(part or 0) for part in match.groups())
+    return datetime.datetime(year, month, day, hour, minute, second)
+
+
+def parse_date(value):
+    if isinstance(value, str):
+        return parse_date_text(value)
+    return value
+
+
+def format_date(value):
+    if isinstance(value, int):
+        value = from_ordinal(value)
+    if isinstance(value, datetime.datetime):
+        return value.strftime('%d-%m-%Y')
+    return value
+
+
+def to_ordinal(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, int):
+        return value
+    return parse_date(value).toordinal()
+
+
+def from_ordinal(ordinal):
+    return datetime.datetime.fromordinal(ordinal) if ordinal else None
+
+
+def parse_timestamp(value):
+    # Время хранится в секундах эпохи; старые снимки и CSV содержат строки ДД-ММ-ГГГГ ЧЧ:ММ:СС
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    # Как и parse_date, принимает строку, datetime или date (начало дня)
+    value = parse_date(value)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.combine(value, datetime.time())
+    return int(value.timestamp())
+
+
+def format_timestamp(value):
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(value).strftime('%d-%m-%Y %H:%M:%S')
+
+
+def intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+
+def parse_bool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'yes', 'да')
+    return bool(value)
+
+
+def coerce_row(row, positions, schema):
+    result = []
+    for position, (name, convert) in zip(positions, schema):
+        value = row[position] if position is not None and position < len(row) else None
+        if value is None or (value == '' and convert is not str):
+            result.append(None)
+        else:
+            result.append(convert(value))
+    return result
+
+
+class CsvError(ValueError):
+    def __init__(self, line, error):
+        super().__init__(f'Ошибка в строке {line}: {error}')
+        self.line = line
+
+
+def read_csv_chunks(filename, schema, chunk_size):
+    import csv
+
+    with open(filename, 'r', newline='', encoding='utf-8') as file:
+        reader = csv.reader(file)
+        header = next(reader, [])
+        positions = [header.index(name) if name in header else None for name, convert in schema]
+        while True:
+            chunk = []
+            for row in itertools.islice(reader, chunk_size):
+                try:
+                    chunk.append(coerce_row(row, positions, schema))
+                except ValueError as e:
+                    raise CsvError(reader.line_num, e) from e
+            if not chunk:
+                break
+            yield chunk
+
+
+def import_csv_records(filename, record_class, collection, attach, detach, ids, chunk_size):
+    imported = skipped = 0
+    started = time.perf_counter()
+    error = None
+    try:
+        for chunk in read_csv_chunks(filename, record_class.schema, chunk_size):
+            missing = 0
+            for row in chunk:
+                if row[0] is None:
+                    missing += 1
+                else:
+                    ids.observe(row[0])
+            new_ids = iter(ids.reserve(missing)) if missing else None
+            records = {}
+            for row in chunk:
+                if row[0] is None:
+                    row[0] = next(new_ids)
+                elif row[0] in collection or row[0] in records:
+                    skipped += 1
+                    continue
+                records[row[0]] = record_class.from_row(row)
+            attached = []
+            try:
+                for record in records.values():
+                    attach(record)
+                    attached.append(record)
+            except Exception:
+                # Часть файла применяется целиком или не применяется вовсе;
+                # в памяти держится только текущая часть, а не весь файл
+                for record in reversed(attached):
+                    detach(record)
+                raise
+            imported += len(attached)
+    except CsvError as e:
+        # Строки до ошибочной части остаются и сохраняются вызывающим кодом одним снимком
+        error = e
+    return imported, skipped, time.perf_counter() - started, error
+
+
+def export_csv_records(filename, schema, records, chunk_size):
+    formatters = {parse_date: format_date, parse_timestamp: format_timestamp}
+    positions = [(position, formatters[convert]) for position, (name, convert) in enumerate(schema) if convert in formatters]
+    rows = (record.to_row() for record in records)
+    import csv
+
+    with open(filename, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow([name for name, convert in schema])
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+            for row in chunk:
+                for position, format_value in positions:
+                    row[position] = format_value(row[position])
+            writer.writerows(chunk)
+
+
+def print_import_stats(imported, skipped, elapsed, error=None):
+    rate = imported / elapsed if elapsed > 0 else imported
+    if error is not None:
+        print(f'{error}. Импорт остановлен, записи до этой части файла сохранены: {imported}')
+    else:
+        print(f'Данные успешно импортированы: {imported} записей ({rate:.0f} строк/с)')
+    if skipped:
+        print(f'Пропущено записей с существующим ID: {skipped}')
+
+
+def shard_ranges(days, workers):
+    # Границы диапазонов дат берутся по выборке дней, чтобы строк в каждом диапазоне было примерно поровну;
+    # 0 (нет даты) попадает в первый диапазон
+    step = max(1, len(days) // 1024)
+    sample = sorted(days[position] for position in range(0, len(days), step))
+    bounds = sorted({sample[len(sample) * i // workers] for i in range(1, workers)} - {0})
+    return list(zip([0] + bounds, bounds + [math.inf]))
+
+
+def run_shard(function, filename, layout, size, day_range, extra):
+    # Процесс читает столбцы из общего файла сам: в задаче передаются только имя файла и диапазон дат
+    import mmap
+
+    with open(filename, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        with memoryview(data) as view:
+            columns = [view[offset:offset + size * itemsize].cast(typecode) for typecode, itemsize, offset in layout]
+            try:
+                return function(columns, day_range, *extra)
+            finally:
+                for column in columns:
+                    column.release()
+
+
+def map_shards(function, columns, day_column, extra=(), workers=None):
+    # Строки делятся по диапазонам дат, каждый диапазон считается в своём процессе.
+    # function(columns, (начало, конец), *extra) обрабатывает строки с днём из [начало, конец)
+    # и возвращает частичный результат; столбцы - массивы array одной длины
+    workers = workers or PARALLEL_WORKERS
+    size = len(columns[0])
+    if workers <= 1 or size < PARALLEL_THRESHOLD:
+        return [function(columns, (0, math.inf), *extra)]
+    import concurrent.futures
+    import multiprocessing
+    import tempfile
+    ranges = shard_ranges(columns[day_column], workers)
+    layout = []
+    descriptor, filename = tempfile.mkstemp(prefix='pa-shards-')
+    try:
+        with os.fdopen(descriptor, 'wb') as file:
+            for column in columns:
+                # Столбцы выравниваются по 8 байт
+                file.write(bytes(-file.tell() % 8))
+                layout.append((column.typecode, column.itemsize, file.tell()))
+                column.tofile(file)
+        # Сервер держит потоки записи и таймеры, поэтому процессы не копируются fork, а запускаются заново
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        with concurrent.futures.ProcessPoolExecutor(len(ranges), mp_context=context) as executor:
+            futures = [
+                executor.submit(run_shard, function, filename, layout, size, day_range, extra) for day_range in ranges
+            ]
+            return [future.result() for future in futures]
+    finally:
+        os.remove(filename)
+
+
+class ConflictError(Exception):
+    def __init__(self, filename, record_ids):
+        super().__init__(f'Записи {sorted(record_ids)} в {filename} изменены другим процессом')
+        self.filename = filename
+        self.record_ids = record_ids
+
+
+def as_row(item, fields):
+    # Снимки до перехода на строки хранили записи словарями
+    if isinstance(item, dict):
+        return [item.get(name) for name in fields]
+    return item
+
+
+VALUE_NONE, VALUE_FALSE, VALUE_TRUE, VALUE_INT, VALUE_FLOAT, VALUE_STR, VALUE_LIST, VALUE_DICT, VALUE_BIGINT = range(9)
+
+
+def pack_value(value, out):
+    # Компактная замена JSON для заголовка и столбцов со смешанными типами, в духе msgpack
+    if value is None:
+        out.append(VALUE_NONE)
+    elif value is True or value is False:
+        out.append(VALUE_TRUE if value else VALUE_FALSE)
+    elif isinstance(value, int) and -2 ** 63 <= value < 2 ** 63:
+        out.append(VALUE_INT)
+        out += struct.pack('<q', value)
+    elif isinstance(value, int):
+        # Числа за пределами int64 (JSON их допускает) пишутся дополнительным кодом нужной длины
+        data = value.to_bytes(value.bit_length() // 8 + 1, 'little', signed=True)
+        out.append(VALUE_BIGINT)
+        out += struct.pack('<I', len(data))
+        out += data
+    elif isinstance(value, float):
+        out.append(VALUE_FLOAT)
+        out += struct.pack('<d', value)
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        out.append(VALUE_STR)
+        out += struct.pack('<I', len(data))
+        out += data
+    elif isinstance(value, (list, tuple)):
+        out.append(VALUE_LIST)
+        out += struct.pack('<I', len(value))
+        for item in value:
+            pack_value(item, out)
+    elif isinstance(value, dict):
+        out.append(VALUE_DICT)
+        out += struct.pack('<I', len(value))
+        for key, item in value.items():
+            pack_value(key, out)
+            pack_value(item, out)
+    else:
+        raise TypeError(f'Тип {type(value).__name__} не поддерживается двоичным форматом')
+
+
+def unpack_value(data, offset):
+    kind = data[offset]
+    offset += 1
+    if kind == VALUE_NONE:
+        return None, offset
+    if kind == VALUE_FALSE or kind == VALUE_TRUE:
+        return kind == VALUE_TRUE, offset
+    if kind == VALUE_INT:
+        return struct.unpack_from('<q', data, offset)[0], offset + 8
+    if kind == VALUE_FLOAT:
+        return struct.unpack_from('<d', data, offset)[0], offset + 8
+    size = struct.unpack_from('<I', data, offset)[0]
+    offset += 4
+    if kind == VALUE_STR:
+        return str(data[offset:offset + size], 'utf-8'), offset + size
+    if kind == VALUE_BIGINT:
+        return int.from_bytes(data[offset:offset + size], 'little', signed=True), offset + size
+    if kind == VALUE_LIST:
+        items = []
+        for _ in range(size):
+            item, offset = unpack_value(data, offset)
+            items.append(item)
+        return items, offset
+    if kind == VALUE_DICT:
+        items = {}
+        for _ in range(size):
+            key, offset = unpack_value(data, offset)
+            items[key], offset = unpack_value(data, offset)
+        return items, offset
+    raise ValueError(f'Неизвестный тип значения {kind} в двоичном снимке')
+
+
+def column_kind(values):
+    types = set(map(type, values))
+    if not types:
+        return 'v'
+    if types == {bool}:
+        return 'b'
+    if types == {int}:
+        low, high = min(values), max(values)
+        if -2 ** 31 <= low and high < 2 ** 31:
+            return 'i'
+        if -2 ** 63 <= low and high < 2 ** 63:
+            return 'q'
+        return 'v'
+    if types == {float}:
+        return 'd'
+    if types == {str}:
+        # Повторяющиеся строки (категории, приоритеты) хранятся словарём и номерами в нём
+        if len(set(values)) * 4 <= len(values):
+            return 'e'
+        return 's'
+    return 'v'
+
+
+class JsonSerializer:
+    name = 'json'
+
+    def matches(self, data):
+        return True
+
+    def dump(self, file, meta, fields, rows):
+        # Без отступов и пробелов снимок в разы меньше, а json.dumps быстрее
+        data = {'meta': meta, 'fields': fields, 'rows': rows}
+        file.write(json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+    def load(self, data):
+        return json.loads(data)
+
+
+class BinarySerializer:
+    name = 'binary'
+    magic = b'PABIN01\n'
+
+    def matches(self, data):
+        return data[:len(self.magic)] == self.magic
+
+    def write_block(self, file, data):
+        file.write(struct.pack('<Q', len(data)))
+        file.write(data)
+
+    def read_block(self, data, offset):
+        size = struct.unpack_from('<Q', data, offset)[0]
+        offset += 8
+        return data[offset:offset + size], offset + size
+
+    def dump(self, file, meta, fields, rows):
+        header = bytearray()
+        pack_value({'meta': meta, 'fields': fields, 'count': len(rows), 'byteorder': sys.byteorder}, header)
+        file.write(self.magic)
+        self.write_block(file, header)
+        # Снимок хранится по столбцам: однотипные значения пишутся одним блоком
+        columns = zip(*rows) if rows else ([] for _ in fields)
+        for column in columns:
+            self.dump_column(file, column)
+
+    def dump_column(self, file, column):
+        has_nulls = None in column
+        values = [value for value in column if value is not None] if has_nulls else column
+        kind = column_kind(values)
+        if has_nulls and kind != 'v':
+            empty = '' if kind in 'se' else 0
+            values = [empty if value is None else value for value in column]
+        if kind == 's':
+            text = '\0'.join(values)
+            # Разделитель внутри значения сломал бы разбор - такой столбец пишется общим способом
+            if text.count('\0') != len(values) - 1:
+                kind = 'v'
+        file.write(struct.pack('<cB', kind.encode('ascii'), has_nulls and kind != 'v'))
+        if kind == 's':
+            self.write_block(file, text.encode('utf-8'))
+        elif kind == 'e':
+            uniques = list(dict.fromkeys(values))
+            positions = {value: position for position, value in enumerate(uniques)}
+            self.dump_column(file, uniques)
+            self.dump_column(file, [positions[value] for value in values])
+        elif kind == 'v':
+            out = bytearray()
+            for value in column:
+                pack_value(value, out)
+            self.write_block(file, out)
+        else:
+            self.write_block(file, array(kind, values).tobytes())
+        if has_nulls and kind != 'v':
+            self.write_block(file, array('b', [value is None for value in column]).tobytes())
+
+    def load(self, data):
+        data = memoryview(data)
+        header, offset = self.read_block(data, len(self.magic))
+        header = unpack_value(header, 0)[0]
+        swap = header['byteorder'] != sys.byteorder
+        columns = []
+        for field in header['fields']:
+            column, offset = self.load_column(data, offset, swap)
+            columns.append(column)
+        # Строки собираются прямо из столбцов, без промежуточных словарей
+        return {'meta': header['meta'], 'fields': header['fields'], 'rows': list(zip(*columns))}
+
+    def load_column(self, data, offset, swap):
+        kind, has_nulls = struct.unpack_from('<cB', data, offset)
+        kind = kind.decode('ascii')
+        offset += 2
+        if kind == 's':
+            block, offset = self.read_block(data, offset)
+            column = str(block, 'utf-8').split('\0')
+        elif kind == 'e':
+            uniques, offset = self.load_column(data, offset, swap)
+            positions, offset = self.load_column(data, offset, swap)
+            column = list(map(uniques.__getitem__, positions))
+        elif kind == 'v':
+            block, offset = self.read_block(data, offset)
+            column = []
+            position = 0
+            while position < len(block):
+                value, position = unpack_value(block, position)
+                column.append(value)
+        else:
+            block, offset = self.read_block(data, offset)
+            values = array(kind)
+            values.frombytes(block)
+            if swap:
+                values.byteswap()
+            column = list(map(bool, values)) if kind == 'b' else values.tolist()
+        if has_nulls:
+            block, offset = self.read_block(data, offset)
+            column = [None if null else value for value, null in zip(column, block.tobytes())]
+        return column, offset
+
+
+SERIALIZERS = {serializer.name: serializer for serializer in (JsonSerializer(), BinarySerializer())}
+
+
+def detect_serializer(data):
+    # JSON проверяется последним: он принимает всё, что не опознано по сигнатуре
+    for serializer in reversed(list(SERIALIZERS.values())):
+        if serializer.matches(data):
+            return serializer
+
+
+class PackReader:
+    def __init__(self, filename, fields):
+        self.fields = fields
+        import mmap
+
+        with open(filename, 'rb') as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        index_offset, count = struct.unpack('<qq', self.map[-16:])
+        header_end = self.map.find(b'\n', len(PACK_MAGIC)) + 1
+        self.header = json.loads(self.map[len(PACK_MAGIC):header_end])
+        # Смещения читаются прямо из отображённого файла, без копирования
+        view = memoryview(self.map)
+        self.ids = view[index_offset:index_offset + 8 * count].cast('q')
+        self.offsets = view[index_offset + 8 * count:index_offset + 16 * count].cast('q')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for position in range(len(self.ids)):
+            yield self.ids[position], self.read(self.offsets[position])
+
+    def position(self, record_id):
+        position = bisect.bisect_left(self.ids, record_id)
+        if position < len(self.ids) and self.ids[position] == record_id:
+            return position
+        return None
+
+    def contains(self, record_id):
+        return self.position(record_id) is not None
+
+    def read(self, offset):
+        return as_row(json.loads(self.map[offset:self.map.find(b'\n', offset)]), self.fields)
+
+    def get(self, record_id):
+        position = self.position(record_id)
+        if position is None:
+            return None
+        return self.read(self.offsets[position])
+
+    def get_many(self, record_ids):
+        return [(record_id, self.get(record_id)) for record_id in record_ids]
+
+    def max_key(self):
+        return self.ids[-1] if len(self.ids) else 0
+
+
+class JournalStorage:
+    supports_queries = False
+    supports_summary = False
+
+    def __init__(self, filename, fields, compact_threshold=1000, sync=True, pack=False, batch_size=1, flush_delay=0.0,
+                 serializer='json'):
+        self.filename = filename
+        self.journal_filename = filename + '.log'
+        self.fields = list(fields)
+        self.compact_threshold = compact_threshold
+        self.sync = sync
+        self.pack = pack
+        self.serializer = SERIALIZERS[serializer]
+        self.batch_size = batch_size
+        self.flush_delay = flush_delay
+        self.pending = []
+        self.depth = 0
+        self.timer = None
+        self.meta = {}
+        self.max_key = 0
+        self.snapshot_size = 0
+        self.journal_size = 0
+        self.journal_file = None
+        self.unsynced = False
+        self.lock = threading.RLock()
+        self.lock_filename = filename + '.lock'
+        self.lock_descriptor = None
+        self.lock_depth = 0
+        # Версия хранилища: какой файл журнала и до какого байта этот процесс уже прочитал
+        self.journal_inode = None
+        self.journal_offset = 0
+        self.listener = None
+        self.conflicts = set()
+        self.replayed = []
+        self.reader = None
+        self.deleted = set()
+
+    @contextlib.contextmanager
+    def locked(self):
+        # Блокировка fcntl согласует процессы, RLock - потоки внутри процесса
+        with self.lock:
+            if self.lock_descriptor is None:
+                self.lock_descriptor = os.open(self.lock_filename, os.O_RDWR | os.O_CREAT, 0o644)
+            if not self.lock_depth and fcntl is not None:
+                fcntl.flock(self.lock_descriptor, fcntl.LOCK_EX)
+            self.lock_depth += 1
+            try:
+                yield
+            finally:
+                self.lock_depth -= 1
+                if not self.lock_depth and fcntl is not None:
+                    fcntl.flock(self.lock_descriptor, fcntl.LOCK_UN)
+
+    def load(self, lazy=False):
+        with self.locked():
+            records = {}
+            self.reader = None
+            self.deleted = set()
+            snapshot_found = self.read_snapshot(records, lazy)
+            journal_found = self.replay_journal(records)
+        if not snapshot_found and not journal_found:
+            raise FileNotFoundError(self.filename)
+        return list(records.values())
+
+    def read_snapshot(self, records, lazy=False):
+        try:
+            with open(self.filename, 'rb') as file:
+                if file.read(len(PACK_MAGIC)) == PACK_MAGIC:
+                    data = None
+                else:
+                    file.seek(0)
+                    data = file.read()
+        except FileNotFoundError:
+            return False
+        if data is None:
+            return self.read_pack(records, lazy)
+        # Формат определяется по содержимому, поэтому смена PA_FORMAT не требует миграции
+        data = detect_serializer(data).load(data)
+        # Старые файлы хранят просто список записей без метаданных
+        if isinstance(data, list):
+            rows = (as_row(item, self.fields) for item in data)
+        elif 'rows' in data:
+            self.meta = data.get('meta', {})
+            rows = data['rows']
+            if data.get('fields', self.fields) != self.fields:
+                rows = (as_row(dict(zip(data['fields'], row)), self.fields) for row in rows)
+        else:
+            self.meta = data.get('meta', {})
+            rows = (as_row(item, self.fields) for item in data.get('records', []))
+        for row in rows:
+            self.track_key(row[0])
+            records[row[0]] = row
+        self.snapshot_size = len(records)
+        return True
+
+    def read_pack(self, records, lazy):
+        reader = PackReader(self.filename, self.fields)
+        self.meta = reader.header.get('meta', {})
+        self.track_key(reader.max_key())
+        self.snapshot_size = len(reader)
+        if lazy:
+            # Записи снимка читаются по требованию, в память попадает только журнал
+            self.reader = reader
+        else:
+            for record_id, record in reader:
+                records[record_id] = record
+        return True
+
+    def snapshot_record(self, records, record_id):
+        record = records.get(record_id)
+        if record is None and self.reader is not None and record_id not in self.deleted:
+            record = self.reader.get(record_id)
+        return record
+
+    def replay_journal(self, records):
+        self.journal_size = 0
+        self.replayed = []
+        self.journal_inode = None
+        self.journal_offset = 0
+        try:
+            file = open(self.journal_filename, 'rb')
+        except FileNotFoundError:
+            return False
+        valid_size = 0
+        with file:
+            self.journal_inode = os.fstat(file.fileno()).st_ino
+            for line in file:
+                # Недописанная строка в конце журнала - след аварийного завершения
+                if not line.endswith(b'\n'):
+                    break
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                self.apply(records, entry)
+                self.journal_size += len(entry.get('ops', (entry,)))
+                valid_size += len(line)
+        if os.path.getsize(self.journal_filename) != valid_size:
+            with open(self.journal_filename, 'r+b') as file:
+                file.truncate(valid_size)
+        self.journal_offset = valid_size
+        return True
+
+    def read_tail(self):
+        # Читает записи других процессов после известной версии; None - снимок пересобран
+        try:
+            stat = os.stat(self.journal_filename)
+        except FileNotFoundError:
+            return [] if self.journal_inode is None else None
+        offset = self.journal_offset
+        if stat.st_ino != self.journal_inode:
+            offset = 0
+        elif stat.st_size == offset:
+            return []
+        elif stat.st_size < offset:
+            return None
+        changes = []
+        with open(self.journal_filename, 'rb') as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    break
+                entry = json.loads(line)
+                for item in entry.get('ops', (entry,)):
+                    op = item['op']
+                    if op == 'put':
+                        row = item['row'] if 'row' in item else as_row(item['record'], self.fields)
+                        self.track_key(row[0])
+                        changes.append((row[0], row))
+                    elif op == 'delete':
+                        changes.append((item['id'], None))
+                    elif op == 'meta':
+                        if item['name'] == 'generation' and item['value'] != self.meta.get('generation', 0):
+                            return None
+                        self.meta[item['name']] = item['value']
+                    self.journal_size += 1
+                offset += len(line)
+        self.journal_inode = stat.st_ino
+        self.journal_offset = offset
+        return changes
+
+    def pending_id(self, entry):
+        if entry['op'] == 'put':
+            return entry['row'][0]
+        return entry.get('id')
+
+    def catch_up(self):
+        # Вызывается под блокировкой: чужие изменения применяются к памяти через listener
+        changes = self.read_tail()
+        if changes is None:
+            self.reload()
+            return
+        if not changes:
+            return
+        # Сравнение с версией, на которой основаны наши изменения: кто записал первым, тот и прав
+        conflicts = {record_id for record_id, row in changes} & {self.pending_id(entry) for entry in self.pending}
+        if conflicts:
+            self.pending = [entry for entry in self.pending if self.pending_id(entry) not in conflicts]
+            self.conflicts |= conflicts
+        if self.listener is not None:
+            self.listener(changes)
+
+    def reload(self):
+        # Другой процесс пересобрал снимок: это хранилище перечитывается целиком,
+        # а ещё не записанные изменения накладываются поверх
+        pending, self.pending = self.pending, []
+        if self.listener is not None:
+            self.listener(None)
+        else:
+            self.load()
+        self.pending = pending
+        if self.listener is not None:
+            self.listener([
+                (self.pending_id(entry), entry['row'] if entry['op'] == 'put' else None)
+                for entry in pending if entry['op'] != 'meta'
+            ])
+
+    def refresh(self):
+        with self.locked():
+            self.catch_up()
+
+    def journal_changed(self):
+        try:
+            stat = os.stat(self.journal_filename)
+        except FileNotFoundError:
+            return self.journal_inode is not None
+        return stat.st_ino != self.journal_inode or stat.st_size != self.journal_offset
+
+    def raise_conflicts(self):
+        if self.conflicts:
+            conflicts, self.conflicts = self.conflicts, set()
+            raise ConflictError(self.filename, conflicts)
+
+    def apply(self, records, entry):
+        op = entry['op']
+        # Пары (старое, новое) позволяют догнать сохранённые производные индексы
+        if op == 'put':
+            row = entry['row'] if 'row' in entry else as_row(entry['record'], self.fields)
+            self.track_key(row[0])
+            self.replayed.append((self.snapshot_record(records, row[0]), row))
+            records[row[0]] = row
+        elif op == 'delete':
+            old = self.snapshot_record(records, entry['id'])
+            records.pop(entry['id'], None)
+            self.deleted.add(entry['id'])
+            if old is not None:
+                self.replayed.append((old, None))
+        elif op == 'meta':
+            self.meta[entry['name']] = entry['value']
+        elif op == 'batch':
+            for item in entry['ops']:
+                self.apply(records, item)
+
+    def track_key(self, record_id):
+        if isinstance(record_id, int) and record_id > self.max_key:
+            self.max_key = record_id
+
+    @property
+    def dirty(self):
+        return bool(self.pending) or self.unsynced
+
+    def append(self, entry):
+        with self.lock:
+            self.pending.append(entry)
+            self.journal_size += 1
+            if len(self.pending) >= self.batch_size:
+                self.write_pending()
+            elif self.flush_delay and self.timer is None and not self.depth:
+                self.timer = threading.Timer(self.flush_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        self.raise_conflicts()
+
+    def write_pending(self, foreground=True):
+        if self.depth or not self.pending:
+            return
+        with self.locked():
+            if foreground:
+                self.catch_up()
+            elif self.journal_changed():
+                # Фоновый поток не трогает данные менеджеров - чужие записи подхватит основной поток
+                return
+            if not self.pending:
+                return
+            entries, self.pending = self.pending, []
+            # Пачка пишется одной строкой: недописанная строка при восстановлении отбрасывается целиком
+            entry = entries[0] if len(entries) == 1 else {'op': 'batch', 'ops': entries}
+            self.write_line(entry)
+            if self.sync:
+                os.fsync(self.journal_file.fileno())
+            else:
+                self.unsynced = True
+
+    def write_line(self, entry):
+        # Вызывается под блокировкой после catch_up, поэтому запись идёт сразу за известной версией
+        if self.journal_file is not None and os.fstat(self.journal_file.fileno()).st_ino != self.journal_inode:
+            self.close_journal()
+        if self.journal_file is None:
+            self.journal_file = open(self.journal_filename, 'a', encoding='utf-8')
+            self.journal_inode = os.fstat(self.journal_file.fileno()).st_ino
+        line = json.dumps(entry, ensure_ascii=False, separators=(',', ':')) + '\n'
+        self.journal_file.write(line)
+        self.journal_file.flush()
+        size = len(line.encode('utf-8'))
+        self.journal_offset += size
+        if metrics.enabled:
+            metrics.count('journal.bytes_written', size)
+
+    def high_water(self):
+        # Наибольший выданный id: счётчик в файле блокировки, метаданные и ключи записей
+        with self.locked():
+            os.lseek(self.lock_descriptor, 0, os.SEEK_SET)
+            counter = os.read(self.lock_descriptor, 32).strip()
+        return max(self.meta.get('last_id', 0), self.max_key, int(counter or 0))
+
+    def claim_ids(self, count, last_id=0):
+        # Счётчик id лежит в файле блокировки: выданные id сразу видны другим процессам,
+        # а журнал не получает лишних строк
+        with self.locked():
+            first = max(last_id, self.high_water()) + 1
+            self.meta['last_id'] = first + count - 1
+            os.lseek(self.lock_descriptor, 0, os.SEEK_SET)
+            os.write(self.lock_descriptor, str(self.meta['last_id']).encode('ascii').ljust(20) + b'\n')
+        return first
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self.lock:
+            self.depth += 1
+            start = len(self.pending)
+        try:
+            yield self
+        except BaseException:
+            # Записи блока, завершившегося ошибкой, в журнал не попадают, а менеджер перечитывает хранилище
+            with self.lock:
+                self.depth -= 1
+                dropped = len(self.pending) - start
+                del self.pending[start:]
+                self.journal_size -= dropped
+                self.write_pending()
+            if dropped and not self.depth and self.listener is not None:
+                self.listener(None)
+            raise
+        with self.lock:
+            self.depth -= 1
+            self.write_pending()
+        self.raise_conflicts()
+
+    def defer_sync(self):
+        # fsync журнала выполняет фоновый поток через flush()
+        self.sync = False
+
+    def flush(self):
+        with self.lock:
+            self.timer = None
+            self.write_pending(foreground=False)
+            if not self.unsynced or self.journal_file is None:
+                return
+            # Копия дескриптора не даёт закрыть файл во время fsync и не держит блокировку
+            descriptor = os.dup(self.journal_file.fileno())
+            self.unsynced = False
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+    def put(self, row):
+        self.append({'op': 'put', 'row': row})
+
+    def delete(self, record_id):
+        self.append({'op': 'delete', 'id': record_id})
+
+    def set_meta(self, name, value):
+        self.meta[name] = value
+        self.append({'op': 'meta', 'name': name, 'value': value})
+
+    def needs_compaction(self):
+        # Снимок посреди транзакции содержал бы её половину
+        return not self.depth and self.journal_size > max(self.compact_threshold, self.snapshot_size)
+
+    def compact(self, rows):
+        with self.locked():
+            self.write_snapshot(rows)
+
+    def write_snapshot(self, rows):
+        # Отложенные записи уже отражены в снимке
+        self.pending = []
+        self.meta['generation'] = self.meta.get('generation', 0) + 1
+        temp_filename = self.filename + '.tmp'
+        if self.pack:
+            with open(temp_filename, 'wb') as file:
+                self.write_pack(file, rows)
+                file.flush()
+                os.fsync(file.fileno())
+        else:
+            with open(temp_filename, 'wb') as file:
+                self.serializer.dump(file, self.meta, self.fields, rows)
+                file.flush()
+                os.fsync(file.fileno())
+        if metrics.enabled:
+            metrics.count('snapshot.bytes_written', os.path.getsize(temp_filename))
+        os.replace(temp_filename, self.filename)
+        # Журнал заменяется только после атомарной замены снимка:
+        # повторное применение уже вошедших в снимок записей безопасно.
+        # Новый журнал начинается с номера поколения - по нему другие процессы узнают о новом снимке
+        self.close_journal()
+        marker = json.dumps({'op': 'meta', 'name': 'generation', 'value': self.meta['generation']}) + '\n'
+        with open(self.journal_filename + '.tmp', 'w', encoding='utf-8') as file:
+            file.write(marker)
+        os.replace(self.journal_filename + '.tmp', self.journal_filename)
+        self.journal_inode = os.stat(self.journal_filename).st_ino
+        self.journal_offset = len(marker.encode('utf-8'))
+        self.snapshot_size = len(rows)
+        self.journal_size = 0
+        self.replayed = []
+
+    def write_pack(self, file, rows):
+        file.write(PACK_MAGIC)
+        file.write(json.dumps({'meta': self.meta, 'fields': self.fields}).encode('utf-8') + b'\n')
+        ids = array('q')
+        offsets = array('q')
+        for row in sorted(rows, key=lambda row: row[0]):
+            ids.append(row[0])
+            offsets.append(file.tell())
+            file.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode('utf-8') + b'\n')
+        index_offset = file.tell()
+        ids.tofile(file)
+        offsets.tofile(file)
+        file.write(struct.pack('<qq', index_offset, len(ids)))
+
+    def save_sidecar(self, name, data):
+        temp_filename = f'{self.filename}.{name}.tmp'
+        with open(temp_filename, 'w', encoding='utf-8') as file:
+            json.dump({'generation': self.meta.get('generation', 0), 'data': data}, file, ensure_ascii=False)
+        os.replace(temp_filename, f'{self.filename}.{name}')
+
+    def load_sidecar(self, name):
+        try:
+            with open(f'{self.filename}.{name}', 'r', encoding='utf-8') as file:
+                sidecar = json.load(file)
+        except (FileNotFoundError, ValueError):
+            return None
+        # Файл относится к другому снимку - его нужно пересобрать
+        if sidecar['generation'] != self.meta.get('generation', 0):
+            return None
+        return sidecar['data']
+
+    def close_journal(self):
+        with self.lock:
+            if self.journal_file is not None:
+                if self.unsynced:
+                    os.fsync(self.journal_file.fileno())
+                self.journal_file.close()
+                self.journal_file = None
+            self.unsynced = False
+
+    def close(self):
+        with self.lock:
+            self.write_pending()
+            self.close_journal()
+            if self.lock_descriptor is not None:
+                os.close(self.lock_descriptor)
+                self.lock_descriptor = None
+
+
+@functools.lru_cache(None)
+def shared_connection_class():
+    # sqlite3 импортируется при первом открытии базы, а не при запуске
+    import sqlite3
+
+    class SharedConnection(sqlite3.Connection):
+        # Одно соединение на файл, чтобы общая транзакция охватывала все таблицы
+        depth = 0
+        users = 0
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            # Хранилища, в чьих блоках транзакции возникла ошибка
+            self.failed = []
+
+    return SharedConnection
+
+
+_sqlite_connections = {}
+
+
+def sqlite_connection(filename):
+    if filename not in _sqlite_connections:
+        import sqlite3
+
+        connection = sqlite3.connect(filename, factory=shared_connection_class())
+        _sqlite_connections[filename] = connection
+        # INSERT OR REPLACE должен запускать триггеры удаления, иначе сводные таблицы разойдутся с данными
+        connection.execute('PRAGMA recursive_triggers = ON')
+    connection = _sqlite_connections[filename]
+    connection.users += 1
+    return connection
+
+
+class SqliteReader:
+    # Аналог PackReader для SQLite: в памяти только отсортированные id, строки читаются по требованию.
+    # Набор id фиксируется при загрузке - записи других процессов приходят через catch_up
+    def __init__(self, storage):
+        self.storage = storage
+        self.query = f'SELECT {", ".join(storage.columns)} FROM {storage.table}'
+        self.ids = array('q', (
+            row[0] for row in storage.connection.execute(
+                f'SELECT {storage.key} FROM {storage.table} ORDER BY {storage.key}'
+            )
+        ))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        cursor = self.storage.connection.execute(f'{self.query} ORDER BY {self.storage.key}')
+        for row in cursor:
+            if self.contains(row[0]):
+                yield row[0], self.storage.from_sql_row(row)
+
+    def contains(self, record_id):
+        position = bisect.bisect_left(self.ids, record_id)
+        return position < len(self.ids) and self.ids[position] == record_id
+
+    def get(self, record_id):
+        # None - запись уже удалена другим процессом
+        row = self.storage.connection.execute(f'{self.query} WHERE {self.storage.key} = ?', (record_id,)).fetchone()
+        return self.storage.from_sql_row(row) if row is not None else None
+
+    def get_many(self, record_ids):
+        rows = dict.fromkeys(record_ids)
+        record_ids = list(rows)
+        for start in range(0, len(record_ids), 500):
+            chunk = record_ids[start:start + 500]
+            cursor = self.storage.connection.execute(
+                f'{self.query} WHERE {self.storage.key} IN ({", ".join("?" for record_id in chunk)})', chunk
+            )
+            for row in cursor:
+                rows[row[0]] = self.storage.from_sql_row(row)
+        return rows.items()
+
+    def max_key(self):
+        return self.ids[-1] if self.ids else 0
+
+
+class SqliteStorage:
+    supports_queries = True
+
+    def __init__(self, filename, table, schema, indexes=(), migrate_from=None, summary=None):
+        self.table = table
+        self.schema = schema
+        self.key = schema[0][0]
+        self.columns = [name for name, convert in schema]
+        self.converters = dict(schema)
+        self.migrate_from = migrate_from
+        self.listener = None
+        self.meta = {}
+        self.written_meta = {}
+        self.replayed = []
+        self.reader = None
+        self.deleted = set()
+        self.max_key = 0
+        # Версия базы и номер последнего прочитанного изменения - аналог позиции в журнале JournalStorage
+        self.data_version = None
+        self.change_seq = 0
+        self.writer = f'{os.getpid()}-{int.from_bytes(os.urandom(4), "little")}'
+        self.claimed = set()
+        self.filename = filename
+        self.connection = sqlite_connection(filename)
+        self.summary = summary
+        self.supports_summary = summary is not None
+        self.create_tables(indexes)
+
+    def create_tables(self, indexes):
+        types = {int: 'INTEGER', float: 'REAL', parse_bool: 'INTEGER', parse_timestamp: 'INTEGER'}
+        columns = ', '.join(
+            f'{name} {types.get(convert, "TEXT")}' + (' PRIMARY KEY' if name == self.key else '')
+            for name, convert in self.schema
+        )
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table} ({columns})')
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.table}_meta (name TEXT PRIMARY KEY, value TEXT)')
+            # Журнал изменённых id: по нему другие процессы догоняют свои копии в памяти
+            self.connection.execute(
+                f'CREATE TABLE IF NOT EXISTS {self.table}_changes '
+                f'(seq INTEGER PRIMARY KEY AUTOINCREMENT, record_id INTEGER, writer TEXT)'
+            )
+            for name in indexes:
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {self.table}_{name} ON {self.table} ({name})')
+            if self.summary is not None:
+                self.create_summary()
+
+    def create_summary(self):
+        # Сводка по (день, категория) ведётся триггерами в той же транзакции, что и запись,
+        # поэтому она всегда совпадает с таблицей, в том числе после записей других процессов
+        date, category, amount = self.summary
+        summary = f'{self.table}_summary'
+        exists = self.connection.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (summary,)
+        ).fetchone()
+        self.connection.execute(
+            f'CREATE TABLE IF NOT EXISTS {summary} (day INTEGER, category TEXT, count INTEGER, income REAL, '
+            f'expenses REAL, PRIMARY KEY (day, category))'
+        )
+
+        def values(row):
+            # Дата хранится как ГГГГ-ММ-ДД, в сводке - порядковый номер дня, как в FinanceAggregates
+            return (
+                f'COALESCE(CAST(julianday({row}.{date}) - 1721424.5 AS INTEGER), 0)',
+                f"COALESCE({row}.{category}, '')",
+                f'CASE WHEN {row}.{amount} > 0 THEN {row}.{amount} ELSE 0 END',
+                f'CASE WHEN {row}.{amount} > 0 THEN 0 ELSE {row}.{amount} END',
+            )
+
+        def add(row):
+            day, group, income, expenses = values(row)
+            return (
+                f'INSERT INTO {summary} (day, category, count, income, expenses) '
+                f'VALUES ({day}, {group}, 1, {income}, {expenses}) '
+                f'ON CONFLICT (day, category) DO UPDATE SET count = count + 1, '
+                f'income = income + excluded.income, expenses = expenses + excluded.expenses;'
+            )
+
+        def remove(row):
+            day, group, income, expenses = values(row)
+            return (
+                f'UPDATE {summary} SET count = count - 1, income = income - {income}, expenses = expenses - {expenses} '
+                f'WHERE day = {day} AND category = {group}; '
+                f'DELETE FROM {summary} WHERE day = {day} AND category = {group} AND count = 0;'
+            )
+
+        triggers = {'insert': add('NEW'), 'delete': remove('OLD'), 'update': remove('OLD') + ' ' + add('NEW')}
+        for event, body in triggers.items():
+            self.connection.execute(
+                f'CREATE TRIGGER IF NOT EXISTS {summary}_{event} AFTER {event.upper()} ON {self.table} '
+                f'BEGIN {body} END'
+            )
+        if not exists:
+            # Таблица, созданная до появления сводки, суммируется один раз
+            day, group, income, expenses = values(self.table)
+            self.connection.execute(
+                f'INSERT INTO {summary} (day, category, count, income, expenses) '
+                f'SELECT {day}, {group}, COUNT(*), SUM({income}), SUM({expenses}) FROM {self.table} '
+                f'GROUP BY 1, 2'
+            )
+
+    def load_summary(self):
+        return self.connection.execute(
+            f'SELECT day, category, count, income, expenses FROM {self.table}_summary'
+        ).fetchall()
+
+    def to_sql(self, name, value):
+        convert = self.converters[name]
+        if value is None:
+            return None
+        if convert is parse_date:
+            # ISO-формат, чтобы диапазоны дат сравнивались в самом SQL
+            return datetime.date.fromordinal(to_ordinal(value)).strftime('%Y-%m-%d')
+        if convert is parse_bool:
+            return int(parse_bool(value))
+        return value
+
+    def from_sql(self, name, value):
+        convert = self.converters[name]
+        if value is None:
+            return None
+        if convert is parse_date:
+            return datetime.datetime.strptime(value, '%Y-%m-%d').toordinal()
+        if convert is parse_timestamp:
+            # В таблицах, созданных до перехода на секунды, колонка текстовая
+            return parse_timestamp(value)
+        if convert is parse_bool:
+            return bool(value)
+        return value
+
+    def row_values(self, row):
+        return [self.to_sql(name, value) for name, value in zip(self.columns, row)]
+
+    def from_sql_row(self, row):
+        return [self.from_sql(name, value) for name, value in zip(self.columns, row)]
+
+    def load(self, lazy=False):
+        self.data_version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+        self.change_seq = self.connection.execute(f'SELECT MAX(seq) FROM {self.table}_changes').fetchone()[0] or 0
+        self.reader = None
+        if lazy:
+            reader = SqliteReader(self)
+            records = []
+            if len(reader):
+                self.reader = reader
+        else:
+            cursor = self.connection.execute(f'SELECT {", ".join(self.columns)} FROM {self.table}')
+            records = [self.from_sql_row(row) for row in cursor]
+        if not records and self.reader is None and self.migrate_from is not None:
+            records = self.migrate()
+        self.meta = {
+            name: json.loads(value)
+            for name, value in self.connection.execute(f'SELECT name, value FROM {self.table}_meta')
+        }
+        self.written_meta = dict(self.meta)
+        if not records and self.reader is None and not self.meta:
+            raise FileNotFoundError(self.table)
+        self.max_key = self.connection.execute(f'SELECT MAX({self.key}) FROM {self.table}').fetchone()[0] or 0
+        return records
+
+    def migrate(self):
+        source = JournalStorage(self.migrate_from, self.columns)
+        try:
+            records = source.load()
+        except FileNotFoundError:
+            return []
+        with self.connection:
+            self.insert_many(records)
+            for name, value in source.meta.items():
+                self.write_meta(name, value)
+        print(f'Данные перенесены из {self.migrate_from}')
+        return records
+
+    def insert_many(self, records, replace=True):
+        # Новые записи вставляются простым INSERT: совпадение id с чужой записью даёт ошибку, а не потерю данных
+        placeholders = ', '.join('?' for name in self.columns)
+        self.connection.executemany(
+            f'INSERT {"OR REPLACE " if replace else ""}INTO {self.table} ({", ".join(self.columns)}) '
+            f'VALUES ({placeholders})',
+            (self.row_values(record) for record in records),
+        )
+
+    def log_changes(self, record_ids):
+        self.connection.executemany(
+            f'INSERT INTO {self.table}_changes (record_id, writer) VALUES (?, ?)',
+            ((record_id, self.writer) for record_id in record_ids),
+        )
+
+    def write_meta(self, name, value):
+        self.connection.execute(
+            f'INSERT OR REPLACE INTO {self.table}_meta (name, value) VALUES (?, ?)',
+            (name, json.dumps(value)),
+        )
+        self.written_meta[name] = value
+
+    def write_changed_meta(self):
+        for name, value in self.meta.items():
+            if self.written_meta.get(name) != value:
+                self.write_meta(name, value)
+
+    def commit(self):
+        # Внутри транзакции изменения фиксируются одним коммитом при выходе из неё
+        if not self.connection.depth:
+            self.connection.commit()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        connection = self.connection
+        connection.depth += 1
+        try:
+            yield self
+        except BaseException:
+            if self not in connection.failed:
+                connection.failed.append(self)
+            raise
+        finally:
+            connection.depth -= 1
+            if connection.depth or not connection.failed:
+                self.commit()
+            else:
+                # Общая транзакция откатывается целиком; менеджеры всех затронутых таблиц перечитывают данные
+                failed, connection.failed = connection.failed, []
+                if connection.in_transaction:
+                    connection.rollback()
+                    for storage in failed:
+                        if storage.listener is not None:
+                            storage.listener(None)
+
+    @property
+    def dirty(self):
+        return self.connection.in_transaction
+
+    def put(self, row):
+        new = row[0] in self.claimed
+        self.insert_many([row], replace=not new)
+        self.claimed.discard(row[0])
+        self.log_changes([row[0]])
+        self.write_changed_meta()
+        self.commit()
+
+    def delete(self, record_id):
+        # Удалённый id остаётся в счётчике, иначе после удаления последней записи он выдался бы снова
+        if isinstance(record_id, int) and record_id > self.meta.get('last_id', 0):
+            self.meta['last_id'] = record_id
+            self.write_meta('last_id', record_id)
+        self.connection.execute(f'DELETE FROM {self.table} WHERE {self.key} = ?', (record_id,))
+        self.log_changes([record_id])
+        self.commit()
+
+    def set_meta(self, name, value):
+        self.meta[name] = value
+        self.write_meta(name, value)
+        self.commit()
+
+    @contextlib.contextmanager
+    def locked(self):
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: до коммита другие процессы в базу не пишут
+        with self.transaction():
+            if not self.connection.in_transaction:
+                self.connection.execute('BEGIN IMMEDIATE')
+            yield
+
+    def refresh(self):
+        # data_version меняется только после коммитов других соединений
+        version = self.connection.execute('PRAGMA data_version').fetchone()[0]
+        if version != self.data_version:
+            self.data_version = version
+            self.catch_up()
+
+    def catch_up(self):
+        first_seq = self.connection.execute(f'SELECT MIN(seq) FROM {self.table}_changes').fetchone()[0]
+        if first_seq is not None and first_seq > self.change_seq + 1:
+            # Нужная часть журнала изменений уже удалена сжатием - хранилище перечитывается целиком
+            if self.listener is not None:
+                self.listener(None)
+            else:
+                self.load()
+            return
+        cursor = self.connection.execute(
+            f'SELECT seq, record_id, writer FROM {self.table}_changes WHERE seq > ? ORDER BY seq', (self.change_seq,)
+        )
+        record_ids = {}
+        for seq, record_id, writer in cursor:
+            self.change_seq = seq
+            if writer != self.writer:
+                record_ids[record_id] = None
+        if not record_ids:
+            return
+        for start in range(0, len(record_ids), 500):
+            chunk = list(record_ids)[start:start + 500]
+            cursor = self.connection.execute(
+                f'SELECT {", ".join(self.columns)} FROM {self.table} '
+                f'WHERE {self.key} IN ({", ".join("?" for record_id in chunk)})',
+                chunk,
+            )
+            for row in cursor:
+                record_ids[row[0]] = self.from_sql_row(row)
+        self.max_key = max(self.max_key, max(record_ids))
+        self.meta = {
+            name: json.loads(value)
+            for name, value in self.connection.execute(f'SELECT name, value FROM {self.table}_meta')
+        }
+        self.written_meta = dict(self.meta)
+        if self.listener is not None:
+            self.listener(list(record_ids.items()))
+
+    def high_water(self):
+        row = self.connection.execute(f"SELECT value FROM {self.table}_meta WHERE name = 'last_id'").fetchone()
+        current = self.connection.execute(f'SELECT MAX({self.key}) FROM {self.table}').fetchone()[0] or 0
+        return max(json.loads(row[0]) if row else 0, current)
+
+    def claim_ids(self, count, last_id=0):
+        # Счётчик в таблице _meta читается и обновляется под блокировкой записи,
+        # поэтому два процесса не получат один и тот же id
+        with self.locked():
+            first = max(last_id, self.high_water()) + 1
+            self.meta['last_id'] = first + count - 1
+            self.write_meta('last_id', self.meta['last_id'])
+        self.claimed.update(range(first, first + count))
+        return first
+
+    def defer_sync(self):
+        # В режиме WAL коммит не ждёт fsync, данные сбрасываются при контрольной точке
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+    def flush(self):
+        pass
+
+    def needs_compaction(self):
+        return False
+
+    def compact(self, rows, keep_changes=10000):
+        # Таблица не очищается: записываются только строки, которые отличаются от сохранённых,
+        # поэтому записи других процессов не теряются
+        with self.locked():
+            # Записи, изменённые другими процессами после нашего чтения, не перезаписываются устаревшей копией
+            external = {
+                record_id for record_id, in self.connection.execute(
+                    f'SELECT record_id FROM {self.table}_changes WHERE seq > ? AND writer != ?',
+                    (self.change_seq, self.writer),
+                )
+            }
+            stored = {
+                row[0]: tuple(row)
+                for row in self.connection.execute(f'SELECT {", ".join(self.columns)} FROM {self.table}')
+            }
+            changed = []
+            for row in rows:
+                values = self.row_values(row)
+                if values[0] not in external and stored.get(values[0]) != tuple(values):
+                    changed.append(row)
+            self.insert_many(changed)
+            self.claimed.difference_update(row[0] for row in changed)
+            self.log_changes(row[0] for row in changed)
+            self.write_changed_meta()
+            last_seq = self.connection.execute(f'SELECT MAX(seq) FROM {self.table}_changes').fetchone()[0] or 0
+            if not external:
+                self.change_seq = last_seq
+            self.connection.execute(f'DELETE FROM {self.table}_changes WHERE seq <= ?', (last_seq - keep_changes,))
+
+    def where(self, conditions):
+        clauses = []
+        params = []
+        for name, op, value in conditions:
+            clauses.append(f'{name} {op} ?')
+            params.append(self.to_sql(name, value))
+        return (' WHERE ' + ' AND '.join(clauses)) if clauses else '', params
+
+    def query_ids(self, conditions):
+        where, params = self.where(conditions)
+        cursor = self.connection.execute(f'SELECT {self.key} FROM {self.table}{where} ORDER BY {self.key}', params)
+        return [row[0] for row in cursor]
+
+    def save_sidecar(self, name, data):
+        pass
+
+    def load_sidecar(self, name):
+        # Производные индексы для SQLite собираются заново при загрузке
+        return None
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.connection.users -= 1
+        if not self.connection.users:
+            self.connection.commit()
+            self.connection.close()
+            _sqlite_connections.pop(self.filename, None)
+        self.connection = None
+
+
+def open_storage(name, record_class, indexes=(), directory='', close_at_exit=True):
+    if STORAGE_BACKEND == 'sqlite':
+        storage = SqliteStorage(
+            os.path.join(directory, SQLITE_FILENAME),
+            name,
+            record_class.schema,
+            indexes,
+            migrate_from=os.path.join(directory, f'{name}.json'),
+            summary=getattr(record_class, 'summary', None),
+        )
+    else:
+        fields = [name for name, convert in record_class.schema]
+        storage = JournalStorage(
+            os.path.join(directory, f'{name}.json'),
+            fields,
+            pack=LAZY_LOADING,
+            batch_size=WRITE_BATCH_SIZE,
+            flush_delay=WRITE_DELAY,
+            serializer=SNAPSHOT_FORMAT,
+        )
+    if close_at_exit:
+        # Отложенные записи менеджеров гарантированно попадают на диск при завершении программы;
+        # короткоживущие хранилища синхронизации и копий закрываются явно
+        atexit.register(storage.close)
+    return storage
+
+
+def lazy_loading(storage):
+    # SQLite отдаёт строки по id без чтения всей таблицы, поэтому загружается лениво всегда
+    return LAZY_LOADING or storage.supports_queries
+
+
+class RecordTable:
+    typecodes = {int: 'q', float: 'd', parse_bool: 'b', parse_date: 'q'}
+
+    def __init__(self, record_class):
+        self.record_class = record_class
+        self.names = [name for name, convert in record_class.schema]
+        # Числа и даты лежат в плотных массивах, строки - в списках интернированных значений
+        self.columns = [
+            array(self.typecodes[convert]) if convert in self.typecodes else []
+            for name, convert in record_class.schema
+        ]
+
+    @classmethod
+    def from_records(cls, record_class, records):
+        table = cls(record_class)
+        for record in records:
+            table.append(record)
+        return table
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, position):
+        return self.record_class.from_row([column[position] for column in self.columns])
+
+    def __iter__(self):
+        for position in range(len(self)):
+            yield self[position]
+
+    def append(self, record):
+        for column, value in zip(self.columns, record.to_row()):
+            if isinstance(column, array):
+                column.append(value or 0)
+            else:
+                column.append(intern(value))
+
+    def column(self, name):
+        return self.columns[self.names.index(name)]
+
+
+class IdSequence:
+    def __init__(self, storage):
+        self.storage = storage
+        self.last_id = 0
+
+    def restore(self):
+        # Журнал и снимок хранят выданные id, поэтому удалённые id не переиспользуются
+        self.last_id = max(self.storage.meta.get('last_id', 0), self.storage.max_key)
+
+    def observe(self, record_id):
+        if record_id > self.last_id:
+            self.last_id = record_id
+            self.storage.meta['last_id'] = record_id
+
+    def next(self):
+        self.last_id = self.storage.claim_ids(1, self.last_id)
+        return self.last_id
+
+    def reserve(self, count):
+        first = self.storage.claim_ids(count, self.last_id)
+        self.last_id = first + count - 1
+        return range(first, self.last_id + 1)
+
+
+class IndexedCollection:
+    def __init__(self, key, indexes=()):
+        self.key = key
+        self.items = {}
+        self.indexes = {name: {} for name in indexes}
+        self.reader = None
+        self.record_class = None
+        self.hidden = set()
+        self.lazy_count = 0
+        self.orders = {}
+
+    def __len__(self):
+        return len(self.items) + self.lazy_count
+
+    def __iter__(self):
+        if self.reader is not None:
+            self.materialize()
+        return iter(list(self.items.values()))
+
+    def __contains__(self, item_id):
+        return item_id in self.items or self.lazy_id(item_id)
+
+    def attach_reader(self, reader, deleted, record_class):
+        if reader is None:
+            return
+        self.reader = reader
+        self.record_class = record_class
+        self.hidden = {item_id for item_id in deleted if reader.contains(item_id)}
+        self.lazy_count = len(reader) - len(self.hidden)
+
+    def lazy_id(self, item_id):
+        return self.reader is not None and item_id not in self.hidden and self.reader.contains(item_id)
+
+    def materialize(self):
+        if metrics.enabled:
+            metrics.count('collection.records_materialized', self.lazy_count)
+        for item_id, data in self.reader:
+            if item_id not in self.hidden:
+                self.items[item_id] = self.record_class.from_row(data)
+        self.reader = None
+        self.hidden = set()
+        self.lazy_count = 0
+        for item in self.items.values():
+            self.index(item)
+
+    def get(self, item_id):
+        item = self.items.get(item_id)
+        if item is None and self.lazy_id(item_id):
+            row = self.reader.get(item_id)
+            self.hidden.add(item_id)
+            self.lazy_count -= 1
+            # Строку могли удалить в базе после загрузки, удаление придёт через catch_up
+            if row is None:
+                return None
+            item = self.items[item_id] = self.record_class.from_row(row)
+        return item
+
+    def get_many(self, item_ids):
+        # Недостающие записи читаются с диска одним запросом, а не по одной
+        if self.reader is not None:
+            missing = [item_id for item_id in item_ids if item_id not in self.items and self.lazy_id(item_id)]
+            for item_id, row in self.reader.get_many(missing):
+                self.hidden.add(item_id)
+                self.lazy_count -= 1
+                if row is not None:
+                    self.items[item_id] = self.record_class.from_row(row)
+        return [item for item in map(self.items.get, item_ids) if item is not None]
+
+    def add(self, item):
+        item_id = getattr(item, self.key)
+        if self.lazy_id(item_id):
+            self.hidden.add(item_id)
+            self.lazy_count -= 1
+        self.items[item_id] = item
+        self.index(item)
+
+    def extend(self, items):
+        for item in items:
+            self.add(item)
+
+    def remove(self, item):
+        self.unindex(item)
+        del self.items[getattr(item, self.key)]
+
+    def update(self, item, changes):
+        self.unindex(item)
+        for name, value in changes.items():
+            setattr(item, name, value)
+        self.index(item)
+
+    def index(self, item):
+        # Пока часть записей не прочитана с диска, вторичные индексы не ведутся
+        if self.reader is not None:
+            return
+        item_id = getattr(item, self.key)
+        for name, index in self.indexes.items():
+            index.setdefault(getattr(item, name), {})[item_id] = item
+        for key, entries in self.orders.values():
+            bisect.insort(entries, (key(item), item_id))
+
+    def unindex(self, item):
+        if self.reader is not None:
+            return
+        item_id = getattr(item, self.key)
+        for name, index in self.indexes.items():
+            value = getattr(item, name)
+            bucket = index.get(value)
+            if bucket is not None:
+                bucket.pop(item_id, None)
+                if not bucket:
+                    del index[value]
+        for key, entries in self.orders.values():
+            entry = (key(item), item_id)
+            position = bisect.bisect_left(entries, entry)
+            if position < len(entries) and entries[position] == entry:
+                del entries[position]
+
+    def find(self, name, value):
+        if self.reader is not None:
+            self.materialize()
+        bucket = self.indexes[name].get(value, {})
+        if metrics.enabled:
+            metrics.count('collection.records_scanned', len(bucket))
+        return list(bucket.values())
+
+    def count(self, name, value):
+        if self.reader is not None:
+            self.materialize()
+        return len(self.indexes[name].get(value, ()))
+
+    def ordered(self, name, key):
+        # Отсортированный список (ключ, id) строится при первом обращении и дальше поддерживается
+        order = self.orders.get(name)
+        if order is None:
+            if self.reader is not None:
+                self.materialize()
+            order = self.orders[name] = (key, sorted((key(item), item_id) for item_id, item in self.items.items()))
+        return order[1]
+
+    def iterate(self, name, key, after=None, reverse=False, chunk_size=256):
+        # Каждая порция ищется заново от курсора, поэтому изменения между порциями не сбивают обход
+        after = tuple(after) if after is not None else None
+        while True:
+            entries = self.ordered(name, key)
+            if reverse:
+                end = len(entries) if after is None else bisect.bisect_left(entries, after)
+                chunk = entries[max(0, end - chunk_size):end][::-1]
+            else:
+                start = 0 if after is None else bisect.bisect_right(entries, after)
+                chunk = entries[start:start + chunk_size]
+            if not chunk:
+                return
+            for value, item_id in chunk:
+                item = self.items.get(item_id)
+                if item is not None:
+                    yield item
+            after = chunk[-1]
+
+    def page(self, name, key, after=None, limit=20, reverse=False):
+        items = self.iterate(name, key, after, reverse)
+        return self.cut_page(list(itertools.islice(items, limit + 1)), key, limit)
+
+    def cut_page(self, page, key, limit):
+        # Лишняя запись показывает, есть ли следующая страница
+        if len(page) <= limit:
+            return page, None
+        page = page[:limit]
+        return page, [key(page[-1]), getattr(page[-1], self.key)]
+
+    def subset_entries(self, items, key, after=None, reverse=False):
+        entries = ((key(item), getattr(item, self.key), item) for item in items)
+        if after is None:
+            return entries
+        after = tuple(after)
+        if reverse:
+            return (entry for entry in entries if entry[:2] < after)
+        return (entry for entry in entries if entry[:2] > after)
+
+    def iterate_subset(self, items, key, after=None, reverse=False):
+        # Записи уже отобраны индексом или запросом, курсор применяется только к ним
+        entries = sorted(self.subset_entries(items, key, after, reverse), key=operator.itemgetter(0, 1), reverse=reverse)
+        return (entry[2] for entry in entries)
+
+    def page_subset(self, items, key, after=None, limit=20, reverse=False):
+        select = heapq.nlargest if reverse else heapq.nsmallest
+        entries = select(limit + 1, self.subset_entries(items, key, after, reverse), key=operator.itemgetter(0, 1))
+        return self.cut_page([entry[2] for entry in entries], key, limit)
+
+    def clear(self):
+        self.reader = None
+        self.hidden = set()
+        self.lazy_count = 0
+        self.items.clear()
+        for index in self.indexes.values():
+            index.clear()
+        self.orders.clear()
+
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def tokenize(text):
+    # casefold приводит регистр и для кириллицы, «ё» ищется наравне с «е»
+    return [token.replace('ё', 'е') for token in TOKEN_PATTERN.findall(text.casefold())]
+
+
+class TextIndex:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+        self.terms = None
+
+    def add(self, doc_id, text):
+        tokens = tokenize(text)
+        self.lengths[doc_id] = len(tokens)
+        self.total_length += len(tokens)
+        for token in tokens:
+            postings = self.postings.get(token)
+            if postings is None:
+                postings = self.postings[token] = {}
+                if self.terms is not None:
+                    bisect.insort(self.terms, token)
+            postings[doc_id] = postings.get(doc_id, 0) + 1
+
+    def remove(self, doc_id, text):
+        self.total_length -= self.lengths.pop(doc_id, 0)
+        for token in set(tokenize(text)):
+            postings = self.postings.get(token)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[token]
+                if self.terms is not None:
+                    del self.terms[bisect.bisect_left(self.terms, token)]
+
+    def expand(self, prefix):
+        if self.terms is None:
+            self.terms = sorted(self.postings)
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff')
+        return self.terms[start:end]
+
+    def search(self, query, limit=10):
+        if not self.lengths:
+            return []
+        average_length = self.total_length / len(self.lengths)
+        scores = {}
+        for word in query.split():
+            prefix = word.endswith('*')
+            for token in tokenize(word):
+                terms = self.expand(token) if prefix else [token]
+                for term in terms:
+                    postings = self.postings.get(term, {})
+                    if metrics.enabled:
+                        metrics.count('text_index.postings_scanned', len(postings))
+                    idf = math.log(1 + (len(self.lengths) - len(postings) + 0.5) / (len(postings) + 0.5))
+                    for doc_id, frequency in postings.items():
+                        norm = self.k1 * (1 - self.b + self.b * self.lengths[doc_id] / average_length)
+                        score = idf * frequency * (self.k1 + 1) / (frequency + norm)
+                        scores[doc_id] = scores.get(doc_id, 0) + score
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+    def to_dict(self):
+        return {
+            'postings': {term: list(postings.items()) for term, postings in self.postings.items()},
+            'lengths': list(self.lengths.items()),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.postings = {term: dict(postings) for term, postings in data['postings'].items()}
+        index.lengths = dict(data['lengths'])
+        index.total_length = sum(index.lengths.values())
+        return index
 
 
 class Note:
+    __slots__ = ('note_id', 'title', 'content', 'timestamp')
+    schema = (('note_id', int), ('title', str), ('content', str), ('timestamp', parse_timestamp))
+
     def __init__(self, note_id, title, content, timestamp):
         self.note_id = note_id
         self.title = title
-        self.content = content
-        self.timestamp = timestamp
+        self.content = content
+        self.timestamp = parse_timestamp(timestamp)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return [self.note_id, self.title, self.content, self.timestamp]
+
+    def text(self):
+        return f'{self.title} {self.content}'
+
+    def to_dict(self):
+        return {
+            'note_id': self.note_id,
+            'title': self.title,
+            'content': self.content,
+            'timestamp': format_timestamp(self.timestamp)
+        }
+
+
+NOTE_SORT_KEYS = {
+    'id': operator.attrgetter('note_id'),
+    'timestamp': lambda note: note.timestamp or 0,
+}
+
+
+def sort_key(sort_keys, sort):
+    if sort not in sort_keys:
+        raise ValueError(f'Неизвестная сортировка: {sort}')
+    return sort_keys[sort]
+
+
+def merge_changes(collection, record_class, changes, attach, detach):
+    for record_id, row in changes:
+        old = collection.get(record_id)
+        if old is not None:
+            detach(old)
+        if row is not None:
+            attach(record_class.from_row(row))
+
+
+class NoteManager:
+    def __init__(self):
+        self.note_list = IndexedCollection('note_id')
+        self.storage = open_storage('notes', Note)
+        self.storage.listener = self.apply_changes
+        self.ids = IdSequence(self.storage)
+        self.text_index = None
+        self.load_notes()
+
+    def find_note(self, note_id):
+        return self.note_list.get(note_id)
+
+    def view_note(self, note_id):
+        note = self.find_note(note_id)
+        if note:
+            self.print_note(note)
+        else:
+            print(f'Заметка с ID {note_id} не найдена...')
+
+    def print_note(self, note):
+        print(f'ID: {note.note_id}\nЗаголовок: {note.title}\nСодержание: {note.content}\nВремя изменения: {format_timestamp(note.timestamp)}')
+
+    def iter_notes(self, sort='id', after=None, reverse=False):
+        return self.note_list.iterate(sort, sort_key(NOTE_SORT_KEYS, sort), after, reverse)
+
+    def page_notes(self, sort='id', after=None, limit=20, reverse=False):
+        return self.note_list.page(sort, sort_key(NOTE_SORT_KEYS, sort), after, limit, reverse)
+
+    def list_notes(self, sort='id', reverse=False, page_size=20):
+        if self.note_list:
+            page_through(lambda after: self.page_notes(sort, after, page_size, reverse), self.print_note)
+        else:
+            print('Список заметок пуст...')
+
+    def time_index(self):
+        # Пары (время изменения, id) поддерживаются при добавлении, правке и удалении заметок;
+        # заметки в снимке идут почти по порядку времени, поэтому первая сортировка близка к линейной
+        return self.note_list.ordered('timestamp', NOTE_SORT_KEYS['timestamp'])
+
+    def notes_between(self, start=None, end=None, limit=None, reverse=False):
+        entries = self.time_index()
+        whole_day = (
+            isinstance(end, str) and not end.strip().isdigit() and ' ' not in end.strip()
+            or isinstance(end, datetime.date) and not isinstance(end, datetime.datetime)
+        )
+        if whole_day:
+            # Дата без времени включает весь день; строка из цифр - уже секунды эпохи
+            end = parse_timestamp(end) + 86399
+        low = 0 if start is None else bisect.bisect_left(entries, (parse_timestamp(start),))
+        high = len(entries) if end is None else bisect.bisect_left(entries, (parse_timestamp(end), math.inf))
+        if limit is not None and high - low > limit:
+            if reverse:
+                low = high - limit
+            else:
+                high = low + limit
+        selected = entries[low:high]
+        if reverse:
+            selected.reverse()
+        return [self.note_list.items[note_id] for _, note_id in selected]
+
+    def recent_notes(self, count=10):
+        return self.notes_between(limit=count, reverse=True)
+
+    def modified_since(self, seconds):
+        return self.notes_between(start=int(time.time() - seconds), reverse=True)
+
+    def search_notes(self, query, limit=10):
+        return [self.find_note(note_id) for note_id, score in self.get_text_index().search(query, limit)]
+
+    def add_note(self, title, content):
+        new_id = self.ids.next()
+        new_note = Note(new_id, title, content, int(time.time()))
+        self._attach(new_note)
+        self._write(new_note)
+        print('Заметка добавлена!')
+        return new_note
+
+    def _attach(self, note):
+        text_index = self.get_text_index()
+        self.note_list.add(note)
+        text_index.add(note.note_id, note.text())
+
+    def _detach(self, note):
+        text_index = self.get_text_index()
+        self.note_list.remove(note)
+        text_index.remove(note.note_id, note.text())
+
+    def _write(self, note):
+        self.storage.put(note.to_row())
+        if self.storage.needs_compaction():
+            self.save_notes()
+
+    def _erase(self, note_id):
+        self.storage.delete(note_id)
+        if self.storage.needs_compaction():
+            self.save_notes()
+
+    def save_notes(self):
+        with self.storage.locked():
+            # Снимок собирается из состояния, догнавшего записи других процессов
+            self.storage.refresh()
+            rows = [note.to_row() for note in self.note_list]
+            text_index = self.get_text_index()
+            self.storage.compact(rows)
+            self.storage.save_sidecar('index', text_index.to_dict())
+
+    def apply_changes(self, changes):
+        if changes is None:
+            self.note_list.clear()
+            self.text_index = None
+            self.load_notes()
+        else:
+            merge_changes(self.note_list, Note, changes, self._attach, self._detach)
+
+    def load_notes(self):
+        try:
+            rows = self.storage.load(lazy=lazy_loading(self.storage))
+            self.note_list.attach_reader(self.storage.reader, self.storage.deleted, Note)
+            self.note_list.extend(Note.from_row(row) for row in rows)
+        except FileNotFoundError:
+            print('Нет сохранённых заметок')
+        self.ids.restore()
+
+    def get_text_index(self):
+        # Индекс читается при первом обращении; до этого заметки не меняются,
+        # поэтому догнать его достаточно записями журнала, прочитанными при загрузке
+        if self.text_index is None:
+            self.load_text_index()
+        return self.text_index
+
+    def load_text_index(self):
+        data = self.storage.load_sidecar('index')
+        if data is None:
+            self.text_index = TextIndex()
+            for note in self.note_list:
+                self.text_index.add(note.note_id, note.text())
+            return
+        self.text_index = TextIndex.from_dict(data)
+        for old, new in self.storage.replayed:
+            if old is not None:
+                self.text_index.remove(old[0], Note.from_row(old).text())
+            if new is not None:
+                self.text_index.add(new[0], Note.from_row(new).text())
+
+    def delete_note(self, note_id):
+        note = self.find_note(note_id)
+        if note:
+            self._detach(note)
+            self._erase(note_id)
+            print('Заметка удалена')
+            return note
+        else:
+            print('Заметка не найдена')
+
+    def edit_note(self, note_id, edit_dict):
+        note = self.find_note(note_id)
+        if note:
+            changes = {key: value for key, value in edit_dict.items() if key in ('title', 'content')}
+            changes['timestamp'] = int(time.time())
+            text_index = self.get_text_index()
+            text_index.remove(note_id, note.text())
+            self.note_list.update(note, changes)
+            text_index.add(note_id, note.text())
+            self._write(note)
+            print('Изменения внесены!')
+            return note
+        else:
+            print('Заметка не найдена')
+
+    def export_csv(self, filename, chunk_size=10000):
+        export_csv_records(filename, Note.schema, self.note_list, chunk_size)
+        print('Данные успешно экспортированы')
+
+    def import_csv(self, filename, chunk_size=10000):
+        try:
+            stats = import_csv_records(
+                filename, Note, self.note_list, self._attach, self._detach, self.ids, chunk_size
+            )
+            self.save_notes()
+            print_import_stats(*stats)
+        except FileNotFoundError:
+            print('Файл не найден...')
+
+
+
+
+class Task:
+    schema = (
+        ('task_id', int), ('title', str), ('description', str),
+        ('done', parse_bool), ('priority', str), ('due_date', parse_date),
+    )
+
+    __slots__ = ('task_id', 'title', 'description', 'priority', 'due_ordinal', 'done')
+
+    def __init__(self, task_id, title, description, priority, due_date, done=False):
+        self.task_id = task_id
+        self.title = title
+        self.description = description
+        self.priority = intern(priority)
+        self.due_ordinal = to_ordinal(due_date)
+        self.done = bool(done)
+
+    @property
+    def due_date(self):
+        return from_ordinal(self.due_ordinal)
+
+    @due_date.setter
+    def due_date(self, value):
+        self.due_ordinal = to_ordinal(value)
+
+    @classmethod
+    def from_row(cls, row):
+        task_id, title, description, done, priority, due_date = row
+        return cls(task_id, title, description, priority, due_date, done)
+
+    def to_row(self):
+        return [self.task_id, self.title, self.description, self.done, self.priority, self.due_ordinal]
+
+    def to_dict(self):
+        return {
+            'task_id': self.task_id,
+            'title': self.title,
+            'description': self.description,
+            'done': self.done,
+            'priority': self.priority,
+            'due_date': format_date(self.due_date)
+        }
+
+
+PRIORITY_RANKS = {'Высокий': 0, 'Средний': 1, 'Низкий': 2}
+MAX_ORDINAL = datetime.date.max.toordinal()
+
+TASK_SORT_KEYS = {
+    'id': operator.attrgetter('task_id'),
+    # Задачи без срока идут после всех задач со сроком
+    'due_date': lambda task: task.due_ordinal or MAX_ORDINAL,
+    'priority': lambda task: PRIORITY_RANKS.get(task.priority, len(PRIORITY_RANKS)),
+}
+
+
+class TaskScheduler:
+    # Невыполненные задачи со сроком, отсортированные по (срок, приоритет, ID)
+    def __init__(self):
+        self.keys = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def key(self, task):
+        return (task.due_ordinal, PRIORITY_RANKS.get(task.priority, len(PRIORITY_RANKS)), task.task_id)
+
+    def add(self, task):
+        if task.due_ordinal and not task.done:
+            bisect.insort(self.keys, self.key(task))
+
+    def remove(self, task):
+        if not task.due_ordinal:
+            return
+        key = self.key(task)
+        position = bisect.bisect_left(self.keys, key)
+        if position < len(self.keys) and self.keys[position] == key:
+            del self.keys[position]
+
+    def between(self, start=None, end=None, limit=None):
+        low = 0 if start is None else bisect.bisect_left(self.keys, (start,))
+        high = len(self.keys) if end is None else bisect.bisect_left(self.keys, (end + 1,))
+        if limit is not None:
+            high = min(high, low + limit)
+        return [key[2] for key in self.keys[low:high]]
+
+    def upcoming(self, today, count):
+        return self.between(today, None, count)
+
+    def overdue(self, today):
+        return self.between(None, today - 1)
+
+
+def aggregate_task_shard(columns, day_range, priorities):
+    # Для каждого года срока: приоритет -> [выполнено, не выполнено]
+    start, end = day_range
+    summary = {}
+    years = {}
+    for day, code, done in zip(*columns):
+        if not start <= day < end:
+            continue
+        year = years.get(day)
+        if year is None:
+            year = years[day] = datetime.date.fromordinal(day).year if day else None
+        counts = summary.setdefault(year, {}).setdefault(priorities[code], [0, 0])
+        counts[0 if done else 1] += 1
+    return summary
+
+
+class TaskManager:
+    def __init__(self):
+        self.task_list = IndexedCollection('task_id', ('priority', 'done'))
+        self.storage = open_storage('tasks', Task, ('done', 'priority', 'due_date'))
+        self.storage.listener = self.apply_changes
+        self.ids = IdSequence(self.storage)
+        self.scheduler = None
+        self.load_tasks()
+
+    def find_task(self, task_id):
+        return self.task_list.get(task_id)
+
+    def view_task(self, task_id):
+        task = self.find_task(task_id)
+        if task:
+            status = 'Выполнена' if task.done else 'Не выполнена'
+            print(
+                f'ID: {task.task_id}'
+                f'\nКраткое описание: {task.title}'
+                f'\nСтатус: {status}'
+                f'\nПриоритет: {task.priority}',
+                f'\nСрок: {task.due_date}'
+            )
+        else:
+            print(f'Задача с ID {task_id} не найдена...')
+
+    def filter_tasks(self, status=None, priority=None, due_date=None):
+        filters = {}
+        if status is not None:
+            filters['done'] = status
+        if priority is not None:
+            filters['priority'] = priority
+        if due_date is not None:
+            due_date = parse_date(due_date)
+
+        if self.storage.supports_queries:
+            conditions = [(name, '=', value) for name, value in filters.items()]
+            if due_date is not None:
+                conditions.append(('due_date', '<=', due_date))
+            filtered_tasks = self.task_list.get_many(self.storage.query_ids(conditions))
+        elif due_date is not None and not filters.get('done', True):
+            # Невыполненные задачи до даты берём прямо из планировщика
+            del filters['done']
+            filtered_tasks = self.tasks_due_between(None, due_date)
+            for name, value in filters.items():
+                filtered_tasks = [task for task in filtered_tasks if getattr(task, name) == value]
+        else:
+            filtered_tasks = self.task_list
+            if filters:
+                # Начинаем с самого маленького индекса, остальные условия проверяем по нему
+                name = min(filters, key=lambda name: self.task_list.count(name, filters[name]))
+                filtered_tasks = self.task_list.find(name, filters.pop(name))
+                for name, value in filters.items():
+                    filtered_tasks = [task for task in filtered_tasks if getattr(task, name) == value]
+            if due_date is not None:
+                due_ordinal = due_date.toordinal()
+                filtered_tasks = [task for task in filtered_tasks if task.due_ordinal and task.due_ordinal <= due_ordinal]
+        return filtered_tasks
+
+    def iter_tasks(self, status=None, priority=None, due_date=None, sort='id', after=None, reverse=False):
+        key = sort_key(TASK_SORT_KEYS, sort)
+        if status is None and priority is None and due_date is None:
+            return self.task_list.iterate(sort, key, after, reverse)
+        return self.task_list.iterate_subset(self.filter_tasks(status, priority, due_date), key, after, reverse)
+
+    def page_tasks(self, status=None, priority=None, due_date=None, sort='id', after=None, limit=20, reverse=False):
+        key = sort_key(TASK_SORT_KEYS, sort)
+        if status is None and priority is None and due_date is None:
+            return self.task_list.page(sort, key, after, limit, reverse)
+        # Отбор идёт через индексы, SQL или планировщик, поэтому страница стоит столько, сколько найдено задач
+        return self.task_list.page_subset(self.filter_tasks(status, priority, due_date), key, after, limit, reverse)
+
+    def print_task(self, task):
+        status = 'выполнена' if task.done else 'не выполнена'
+        due_date = format_date(task.due_date) or 'нет'
+        print(f'{task.task_id}. {task.title} (срок: {due_date}, приоритет: {task.priority}, {status})')
+
+    def show_list_tasks(self, status=None, priority=None, due_date=None, sort='id', page_size=20):
+        page_through(lambda after: self.page_tasks(status, priority, due_date, sort, after, page_size), self.print_task)
+
+    def add_task(self, title, description, priority, due_date):
+        date = parse_date(due_date)
+        new_id = self.ids.next()
+        new_task = Task(new_id, title, description, priority, date)
+        self._attach(new_task)
+        self._write(new_task)
+        print('Задача добавлена!')
+        return new_task
+
+    def get_scheduler(self):
+        # Планировщик строится при первом запросе, а не при запуске
+        if self.scheduler is None:
+            self.scheduler = TaskScheduler()
+            keys = [self.scheduler.key(task) for task in self.task_list if task.due_ordinal and not task.done]
+            keys.sort()
+            self.scheduler.keys = keys
+        return self.scheduler
+
+    def tasks_due_between(self, start=None, end=None, limit=None):
+        start = parse_date(start).toordinal() if start is not None else None
+        end = parse_date(end).toordinal() if end is not None else None
+        return [self.task_list.get(task_id) for task_id in self.get_scheduler().between(start, end, limit)]
+
+    def next_tasks(self, count=10, today=None):
+        today = (today or datetime.date.today()).toordinal()
+        return [self.task_list.get(task_id) for task_id in self.get_scheduler().upcoming(today, count)]
+
+    def overdue_tasks(self, today=None):
+        today = (today or datetime.date.today()).toordinal()
+        return [self.task_list.get(task_id) for task_id in self.get_scheduler().overdue(today)]
+
+    def yearly_summary(self, workers=None):
+        tasks = list(self.task_list)
+        # Приоритеты передаются кодами, чтобы все столбцы были числовыми массивами
+        priorities = {}
+        columns = (
+            array('q', [task.due_ordinal or 0 for task in tasks]),
+            array('q', [priorities.setdefault(task.priority, len(priorities)) for task in tasks]),
+            array('b', [task.done for task in tasks]),
+        )
+        summary = {}
+        for partial in map_shards(aggregate_task_shard, columns, 0, (list(priorities),), workers):
+            for year, priorities in partial.items():
+                for priority, (done, pending) in priorities.items():
+                    counts = summary.setdefault(year, {}).setdefault(priority, [0, 0])
+                    counts[0] += done
+                    counts[1] += pending
+        return dict(sorted(summary.items(), key=lambda item: (item[0] is None, item[0] or 0)))
+
+    def show_yearly_summary(self):
+        summary = self.yearly_summary()
+        if not summary:
+            print('Список задач пуст')
+        for year, priorities in summary.items():
+            print(f'{year or "Без срока"}:')
+            for priority, (done, pending) in priorities.items():
+                print(f'  {priority}: выполнено {done}, не выполнено {pending}')
+
+    def show_agenda(self, count=10):
+        overdue = self.overdue_tasks()
+        if overdue:
+            print('Просроченные задачи:')
+            for task in overdue:
+                print(f'{task.task_id}. {task.title} (срок: {format_date(task.due_date)}, приоритет: {task.priority})')
+        upcoming = self.next_tasks(count)
+        if upcoming:
+            print('Ближайшие задачи:')
+            for task in upcoming:
+                print(f'{task.task_id}. {task.title} (срок: {format_date(task.due_date)}, приоритет: {task.priority})')
+        if not overdue and not upcoming:
+            print('Нет запланированных задач')
+
+    def _attach(self, task):
+        self.task_list.add(task)
+        if self.scheduler is not None:
+            self.scheduler.add(task)
+
+    def _detach(self, task):
+        self.task_list.remove(task)
+        if self.scheduler is not None:
+            self.scheduler.remove(task)
+
+    def _write(self, task):
+        self.storage.put(task.to_row())
+        if self.storage.needs_compaction():
+            self.save_tasks()
+
+    def _erase(self, task_id):
+        self.storage.delete(task_id)
+        if self.storage.needs_compaction():
+            self.save_tasks()
+
+    def save_tasks(self):
+        with self.storage.locked():
+            self.storage.refresh()
+            rows = [task.to_row() for task in self.task_list]
+            self.storage.compact(rows)
+
+    def apply_changes(self, changes):
+        if changes is None:
+            self.task_list.clear()
+            self.scheduler = None
+            self.load_tasks()
+        else:
+            merge_changes(self.task_list, Task, changes, self._attach, self._detach)
+
+    def load_tasks(self):
+        try:
+            rows = self.storage.load(lazy=lazy_loading(self.storage))
+            self.task_list.attach_reader(self.storage.reader, self.storage.deleted, Task)
+            self.task_list.extend(Task.from_row(row) for row in rows)
+        except FileNotFoundError:
+            print('Нет сохранённых задач')
+        self.ids.restore()
+
+    def delete_task(self, task_id):
+        task = self.find_task(task_id)
+        if task:
+            self._detach(task)
+            self._erase(task_id)
+            print('Задача удалена')
+            return task
+        else:
+            print('Задача не найдена')
+
+    def edit_task(self, task_id, edit_dict):
+        task = self.find_task(task_id)
+        if task:
+            changes = {}
+            for key, value in edit_dict.items():
+                if key in ('title', 'description', 'priority'):
+                    changes[key] = value
+                elif key == 'due_date':
+                    changes[key] = parse_date(value)
+            if self.scheduler is not None:
+                self.scheduler.remove(task)
+            self.task_list.update(task, changes)
+            if self.scheduler is not None:
+                self.scheduler.add(task)
+            self._write(task)
+            print('Изменения внесены!')
+            return task
+        else:
+            print('Задача не найдена')
+
+    def change_done(self, task_id):
+        task = self.find_task(task_id)
+        if task:
+            if self.scheduler is not None:
+                self.scheduler.remove(task)
+            self.task_list.update(task, {'done': True})
+            self._write(task)
+            return task
+        else:
+            print('Задача не найдена...')
+
+
+    def export_csv(self, filename, chunk_size=10000):
+        export_csv_records(filename, Task.schema, self.task_list, chunk_size)
+        print('Данные успешно экспортированы')
+
+    def import_csv(self, filename, chunk_size=10000):
+        try:
+            stats = import_csv_records(
+                filename, Task, self.task_list, self._attach, self._detach, self.ids, chunk_size
+            )
+            self.save_tasks()
+            print_import_stats(*stats)
+        except FileNotFoundError:
+            print('Файл не найден...')
+
+
+
+
+
+class Contact:
+    schema = (('contact_id', int), ('name', str), ('phone', str), ('email', str))
+
+    __slots__ = ('contact_id', 'name', 'phone', 'email')
+
+    def __init__(self, contact_id, name, phone, email):
+        self.contact_id = contact_id
+        self.name = name
+        self.phone = phone
+        self.email = email
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return [self.contact_id, self.name, self.phone, self.email]
+
+    def to_dict(self):
+        return {
+            'contact_id': self.contact_id,
+            'name': self.name,
+            'phone': self.phone,
+            'email': self.email,
+        }
+
+
+def phone_digits(phone):
+    return ''.join(char for char in phone or '' if char.isdigit())
+
+
+def phone_key(phone):
+    digits = phone_digits(phone)
+    # Российские номера хранятся без кода страны, чтобы +7 900… находился по «900»
+    if len(digits) == 11 and digits[0] in '78':
+        return digits[1:]
+    return digits
+
+
+def trigrams(text):
+    # Каждое слово дополняется пробелами отдельно, чтобы опечатка в начале фамилии не рвала её триграммы
+    grams = set()
+    for token in tokenize(text or ''):
+        padded = '  ' + token + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def edit_distance(first, second, limit):
+    # Расстояние Дамерау-Левенштейна (с перестановкой соседних букв); больше limit не считается
+    if abs(len(first) - len(second)) > limit:
+        return limit + 1
+    previous = None
+    current = list(range(len(second) + 1))
+    for i in range(1, len(first) + 1):
+        before, previous, current = previous, current, [i] + [0] * len(second)
+        for j in range(1, len(second) + 1):
+            cost = first[i - 1] != second[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and first[i - 1] == second[j - 2] and first[i - 2] == second[j - 1]:
+                current[j] = min(current[j], before[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+    return current[-1]
+
+
+class ContactLookup:
+    def __init__(self):
+        self.phone_trie = {}
+        # Слово -> контакты; триграммы ведут к словам словаря, а не к контактам,
+        # поэтому нечёткий поиск перебирает имена, а не всю адресную книгу
+        self.postings = {}
+        self.grams = {}
+        self.terms = None
+        self.contact_tokens = {}
+
+    def add(self, contact):
+        node = self.phone_trie
+        for digit in phone_key(contact.phone):
+            node = node.setdefault(digit, {})
+        node.setdefault(None, set()).add(contact.contact_id)
+        tokens = self.contact_tokens[contact.contact_id] = tuple(set(tokenize(contact.name)) | set(tokenize(contact.email)))
+        for token in tokens:
+            ids = self.postings.get(token)
+            if ids is None:
+                ids = self.postings[token] = set()
+                for gram in trigrams(token):
+                    self.grams.setdefault(gram, set()).add(token)
+                if self.terms is not None:
+                    bisect.insort(self.terms, token)
+            ids.add(contact.contact_id)
+
+    def remove(self, contact):
+        key = phone_key(contact.phone)
+        path = [self.phone_trie]
+        for digit in key:
+            node = path[-1].get(digit)
+            if node is None:
+                break
+            path.append(node)
+        else:
+            ids = path[-1].get(None, set())
+            ids.discard(contact.contact_id)
+            if not ids:
+                path[-1].pop(None, None)
+            # Убираем опустевшие ветки, чтобы обход префикса не заходил в них
+            for parent, digit, node in zip(reversed(path[:-1]), reversed(key), reversed(path[1:])):
+                if node:
+                    break
+                del parent[digit]
+        for token in self.contact_tokens.pop(contact.contact_id, ()):
+            ids = self.postings.get(token)
+            if ids is None:
+                continue
+            ids.discard(contact.contact_id)
+            if not ids:
+                del self.postings[token]
+                for gram in trigrams(token):
+                    tokens = self.grams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self.grams[gram]
+                if self.terms is not None:
+                    del self.terms[bisect.bisect_left(self.terms, token)]
+
+    def phone_prefix(self, digits, limit):
+        node = self.phone_trie
+        for digit in digits:
+            node = node.get(digit)
+            if node is None:
+                return []
+        found = {}
+        stack = [node]
+        # Обход в глубину по возрастанию цифр останавливается, как только набрано limit контактов
+        while stack and len(found) < limit:
+            node = stack.pop()
+            for contact_id in sorted(node.get(None, ())):
+                found[contact_id] = None
+            stack.extend(node[digit] for digit in sorted((key for key in node if key is not None), reverse=True))
+        return list(found)[:limit]
+
+    def expand(self, prefix):
+        if self.terms is None:
+            self.terms = sorted(self.postings)
+        start = bisect.bisect_left(self.terms, prefix)
+        end = bisect.bisect_left(self.terms, prefix + '\uffff')
+        return start, end
+
+    def similar(self, token):
+        # Слова словаря в пределах одной-двух опечаток. Слово с k опечатками теряет не больше 3k триграмм,
+        # значит встречается хотя бы в одной из 3k+1 самых редких триграмм запроса - остальные не просматриваются
+        limit = 1 if len(token) <= 6 else 2
+        grams = sorted(trigrams(token), key=lambda gram: len(self.grams.get(gram, ())))
+        candidates = set()
+        for gram in grams[:3 * limit + 1]:
+            candidates.update(self.grams.get(gram, ()))
+        matches = {}
+        for candidate in candidates:
+            distance = edit_distance(token, candidate, limit)
+            if distance <= limit:
+                matches[candidate] = 1 - distance / (len(token) + 1)
+        return matches
+
+    def matcher(self, token, last, fuzzy):
+        # Качество совпадения слова запроса: 1 - точное или (для последнего слова) начало слова, меньше - с опечаткой
+        matches = self.similar(token) if fuzzy and len(token) >= 3 and not token.isdigit() else {}
+        if token in self.postings:
+            matches[token] = 1.0
+        prefix = None
+        if last:
+            start, end = self.expand(token)
+            prefix = token, start, end
+        return matches, prefix
+
+    def candidates_cost(self, matcher, bound):
+        matches, prefix = matcher
+        cost = sum(len(self.postings[token]) for token in matches)
+        if prefix is not None:
+            for position in range(prefix[1], prefix[2]):
+                if cost > bound:
+                    break
+                cost += len(self.postings[self.terms[position]])
+        return cost
+
+    def candidate_groups(self, matcher):
+        # Слова-кандидаты по убыванию качества: (качество, контакты)
+        matches, prefix = matcher
+        if prefix is not None:
+            for position in range(prefix[1], prefix[2]):
+                yield 1.0, self.postings[self.terms[position]]
+        for token in sorted(matches, key=matches.get, reverse=True):
+            yield matches[token], self.postings[token]
+
+    def narrow(self, ids, matcher):
+        # Контакты из ids, в которых есть подходящее слово; None - слов слишком много, контакты проверяются по одному
+        matches, prefix = matcher
+        tokens = list(matches)
+        if prefix is not None:
+            if prefix[2] - prefix[1] > 16:
+                return None
+            tokens.extend(self.terms[prefix[1]:prefix[2]])
+        found = set()
+        for token in tokens:
+            found |= ids & self.postings[token]
+        return found
+
+    def quality(self, matcher, tokens):
+        matches, prefix = matcher
+        best = 0
+        for token in tokens:
+            if prefix is not None and token.startswith(prefix[0]):
+                return 1.0
+            quality = matches.get(token, 0)
+            if quality > best:
+                best = quality
+        return best
+
+    def match_words(self, words, limit, fuzzy):
+        matchers = [self.matcher(word, i == len(words) - 1, fuzzy) for i, word in enumerate(words)]
+        # Перебираются только контакты самого редкого слова запроса, остальные слова проверяются по контакту
+        driver = matchers[0]
+        if len(matchers) > 1:
+            bound = float('inf')
+            for matcher in matchers:
+                cost = self.candidates_cost(matcher, bound)
+                if cost < bound:
+                    bound, driver = cost, matcher
+        others = [matcher for matcher in matchers if matcher is not driver]
+        top = []
+        seen = set()
+        for driver_quality, ids in self.candidate_groups(driver):
+            # Контакт впервые встретился на слове с этим качеством, лучше по ведущему слову он не совпадёт
+            best_left = (driver_quality + len(others)) / len(matchers)
+            if len(top) >= limit and top[0][0] >= best_left:
+                break
+            for matcher in others:
+                subset = self.narrow(ids, matcher)
+                if subset is not None:
+                    ids = subset
+            for contact_id in ids:
+                if len(top) >= limit and top[0][0] >= best_left:
+                    return top
+                if contact_id in seen:
+                    continue
+                seen.add(contact_id)
+                tokens = self.contact_tokens[contact_id]
+                score = driver_quality
+                for matcher in others:
+                    quality = self.quality(matcher, tokens)
+                    if not quality:
+                        break
+                    score += quality
+                else:
+                    # При равном совпадении выше более короткие записи
+                    item = (score / len(matchers), -len(tokens), contact_id)
+                    if len(top) < limit:
+                        heapq.heappush(top, item)
+                    elif item > top[0]:
+                        heapq.heapreplace(top, item)
+        return top
+
+    def search(self, query, limit=5):
+        digits = phone_digits(query)
+        if digits and len(digits) >= len(query.replace(' ', '')) // 2:
+            found = self.phone_prefix(digits, limit)
+            if digits[0] in '78' and len(digits) > 1:
+                # Начало номера может быть кодом страны: «8 900» и «+7 900» ищут «900»
+                found.extend(contact_id for contact_id in self.phone_prefix(digits[1:], limit) if contact_id not in found)
+            if found:
+                return [(contact_id, 1.0) for contact_id in found[:limit]]
+        words = tokenize(query)
+        if not words:
+            return []
+        top = self.match_words(words, limit, False)
+        if len(top) < limit:
+            # Опечатки ищутся, только если точных совпадений и продолжений не хватило
+            found = {contact_id for score, length, contact_id in top}
+            top.extend(item for item in self.match_words(words, limit, True) if item[2] not in found)
+        return [(contact_id, score) for score, length, contact_id in heapq.nlargest(limit, top)]
+
+
+class ContactManager:
+    def __init__(self):
+        self.contact_list = IndexedCollection('contact_id', ('name', 'phone'))
+        self.storage = open_storage('contacts', Contact, ('name', 'phone'))
+        self.storage.listener = self.apply_changes
+        self.ids = IdSequence(self.storage)
+        self.lookup = None
+        self.load_contacts()
+
+    def find_contact(self, info):
+        for name in ('name', 'phone'):
+            contacts = self.contact_list.find(name, info)
+            if contacts:
+                return contacts[0]
+        return None
+
+    def get_lookup(self):
+        # Индекс поиска строится при первом запросе, а не при запуске
+        if self.lookup is None:
+            self.lookup = ContactLookup()
+            for contact in self.contact_list:
+                self.lookup.add(contact)
+        return self.lookup
+
+    def search_contacts(self, query, limit=5):
+        return [self.contact_list.get(contact_id) for contact_id, score in self.get_lookup().search(query, limit)]
+
+    def view_contact(self, contact_id):
+        contact = self.contact_list.get(contact_id)
+        if contact:
+            print(f'ID: {contact.contact_id}\nИмя: {contact.name}\nТелефон: {contact.phone}\nEmail: {contact.email}')
+        else:
+            print(f'Контакт с ID {contact_id} не найден...')
+
+    def add_contact(self, name, phone, email):
+        new_id = self.ids.next()
+        new_contact = Contact(new_id, name, phone, email)
+        self._attach(new_contact)
+        self._write(new_contact)
+        print('Контакт добавлен!')
+        return new_contact
+
+    def _attach(self, contact):
+        self.contact_list.add(contact)
+        if self.lookup is not None:
+            self.lookup.add(contact)
+
+    def _detach(self, contact):
+        self.contact_list.remove(contact)
+        if self.lookup is not None:
+            self.lookup.remove(contact)
+
+    def _write(self, contact):
+        self.storage.put(contact.to_row())
+        if self.storage.needs_compaction():
+            self.save_contacts()
+
+    def _erase(self, contact_id):
+        self.storage.delete(contact_id)
+        if self.storage.needs_compaction():
+            self.save_contacts()
+
+    def save_contacts(self):
+        with self.storage.locked():
+            self.storage.refresh()
+            rows = [contact.to_row() for contact in self.contact_list]
+            self.storage.compact(rows)
+
+    def apply_changes(self, changes):
+        if changes is None:
+            self.contact_list.clear()
+            self.lookup = None
+            self.load_contacts()
+        else:
+            merge_changes(self.contact_list, Contact, changes, self._attach, self._detach)
+
+    def load_contacts(self):
+        try:
+            rows = self.storage.load(lazy=lazy_loading(self.storage))
+            self.contact_list.attach_reader(self.storage.reader, self.storage.deleted, Contact)
+            self.contact_list.extend(Contact.from_row(row) for row in rows)
+        except FileNotFoundError:
+            print('Нет сохранённых контактов')
+        self.ids.restore()
+
+    def delete_contact(self, info):
+        contact = self.find_contact(info)
+        if contact:
+            self._detach(contact)
+            self._erase(contact.contact_id)
+            print('Контакт удален')
+            return contact
+        else:
+            print('Контакт не найден')
+
+    def edit_contact(self, edit_dict, info):
+        contact = self.find_contact(info)
+        if contact:
+            changes = {key: value for key, value in edit_dict.items() if key in ('name', 'phone', 'email')}
+            if self.lookup is not None:
+                self.lookup.remove(contact)
+            self.contact_list.update(contact, changes)
+            if self.lookup is not None:
+                self.lookup.add(contact)
+            self._write(contact)
+            print('Изменения внесены!')
+            return contact
+        else:
+            print('Задача не найдена')
+
+    def export_csv(self, filename, chunk_size=10000):
+        export_csv_records(filename, Contact.schema, self.contact_list, chunk_size)
+        print('Данные успешно экспортированы')
+
+    def import_csv(self, filename, chunk_size=10000):
+        try:
+            stats = import_csv_records(
+                filename, Contact, self.contact_list, self._attach, self._detach, self.ids, chunk_size
+            )
+            self.save_contacts()
+            print_import_stats(*stats)
+        except FileNotFoundError:
+            print('Файл не найден...')
+
+
+
+
+
+class FinanceRecord:
+    schema = (
+        ('record_id', int), ('amount', float), ('category', str),
+        ('date', parse_date), ('description', str),
+    )
+
+    __slots__ = ('record_id', 'amount', 'category', 'day', 'description')
+    # Поля даты, категории и суммы для сводной таблицы SQLite
+    summary = ('date', 'category', 'amount')
+
+    def __init__(self, record_id, amount, category, date, description):
+        self.record_id = record_id
+        self.amount = amount
+        self.category = intern(category)
+        self.day = to_ordinal(date)
+        self.description = description
+
+    @property
+    def date(self):
+        return from_ordinal(self.day)
+
+    @date.setter
+    def date(self, value):
+        self.day = to_ordinal(value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*row)
+
+    def to_row(self):
+        return [self.record_id, self.amount, self.category, self.day, self.description]
 
     def to_dict(self):
         return {
-            'note_id': self.note_id,
-            'title': self.title,
-            'content': self.content,
-            'timestamp': self.timestamp
+            'record_id': self.record_id,
+            'amount': self.amount,
+            'category': self.category,
+            'date': format_date(self.date),
+            'description': self.description,
+        }
+
+
+FINANCE_SORT_KEYS = {
+    'id': operator.attrgetter('record_id'),
+    'date': lambda record: record.day or 0,
+    'amount': operator.attrgetter('amount'),
+}
+
+
+class FinanceAggregates:
+    def __init__(self):
+        self.total_income = 0.0
+        self.total_expenses = 0.0
+        self.categories = {}
+        self.days = {}
+        self.sorted_days = None
+        self.prefix = None
+
+    def add(self, record, sign=1):
+        self.add_values(record.amount, record.category, record.day, sign)
+
+    def add_values(self, amount, category, day, sign=1):
+        income = amount > 0
+        amount *= sign
+        if income:
+            self.total_income += amount
+        else:
+            self.total_expenses += amount
+        self.add_category(self.categories, category, sign, amount)
+        day = day or 0
+        totals = self.days.get(day)
+        if totals is None:
+            totals = self.days[day] = [0, 0.0, 0.0, {}]
+            self.sorted_days = None
+        totals[0] += sign
+        totals[1 if income else 2] += amount
+        self.add_category(totals[3], category, sign, amount)
+        if totals[0] == 0:
+            del self.days[day]
+            self.sorted_days = None
+        self.prefix = None
+
+    def add_category(self, categories, category, sign, amount):
+        totals = categories.setdefault(category, [0, 0.0])
+        totals[0] += sign
+        totals[1] += amount
+        if totals[0] == 0:
+            del categories[category]
+
+    def remove(self, record):
+        self.add(record, -1)
+
+    def build_prefix(self):
+        if self.sorted_days is None:
+            self.sorted_days = sorted(self.days)
+        income = [0.0]
+        expenses = [0.0]
+        category_days = {}
+        for day in self.sorted_days:
+            totals = self.days[day]
+            income.append(income[-1] + totals[1])
+            expenses.append(expenses[-1] + totals[2])
+            for category, (count, amount) in totals[3].items():
+                days, sums = category_days.setdefault(category, ([], [0.0]))
+                days.append(day)
+                sums.append(sums[-1] + amount)
+        self.prefix = income, expenses, category_days
+
+    def totals(self, start_date=None, end_date=None):
+        if self.prefix is None:
+            self.build_prefix()
+        income, expenses, category_days = self.prefix
+        start = start_date.toordinal() if start_date else 0
+        end = end_date.toordinal() if end_date else float('inf')
+        lo = bisect.bisect_left(self.sorted_days, start)
+        # Перевёрнутый период (начало позже конца) пуст, а не отрицателен
+        hi = max(lo, bisect.bisect_right(self.sorted_days, end))
+        category_summary = {}
+        for category, (days, sums) in category_days.items():
+            first = bisect.bisect_left(days, start)
+            last = bisect.bisect_right(days, end)
+            if last > first:
+                category_summary[category] = sums[last] - sums[first]
+        return income[hi] - income[lo], expenses[hi] - expenses[lo], category_summary
+
+    def balance(self):
+        return self.total_income + self.total_expenses
+
+    def to_dict(self):
+        return [
+            [day, count, income, expenses, categories]
+            for day, (count, income, expenses, categories) in self.days.items()
+        ]
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        aggregates.merge(data)
+        return aggregates
+
+    @classmethod
+    def from_summary(cls, rows):
+        # Строки сводной таблицы SQLite (день, категория, число, доход, расход) в формате to_dict
+        days = {}
+        for day, category, count, income, expenses in rows:
+            totals = days.get(day)
+            if totals is None:
+                totals = days[day] = [day, 0, 0.0, 0.0, {}]
+            totals[1] += count
+            totals[2] += income
+            totals[3] += expenses
+            totals[4][category] = [count, income + expenses]
+        return cls.from_dict(days.values())
+
+    def merge(self, data):
+        # Частичные агрегаты разных кусков могут содержать одни и те же дни - суммы складываются
+        for day, count, income, expenses, categories in data:
+            totals = self.days.get(day)
+            if totals is None:
+                totals = self.days[day] = [0, 0.0, 0.0, {}]
+            totals[0] += count
+            totals[1] += income
+            totals[2] += expenses
+            self.total_income += income
+            self.total_expenses += expenses
+            for category, (category_count, amount) in categories.items():
+                self.add_category(totals[3], category, category_count, amount)
+                self.add_category(self.categories, category, category_count, amount)
+        self.sorted_days = None
+        self.prefix = None
+
+    def years(self):
+        if self.sorted_days is None:
+            self.sorted_days = sorted(self.days)
+        days = [day for day in self.sorted_days if day]
+        if not days:
+            return []
+        first = datetime.date.fromordinal(days[0]).year
+        last = datetime.date.fromordinal(days[-1]).year
+        return list(range(first, last + 1))
+
+
+class FinanceColumns:
+    # Порядковый номер 01-01-1970 - начало отсчёта datetime64
+    epoch = datetime.date(1970, 1, 1).toordinal()
+
+    def __init__(self, amounts, days, categories):
+        np = load_numpy()
+        codes = {}
+        self.amounts = amounts
+        # Порядковые номера дней; 0 - запись без даты, в dates она становится NaT
+        self.days = days
+        self.dates = np.where(days > 0, days - self.epoch, np.iinfo(np.int64).min).astype('datetime64[D]')
+        self.codes = np.fromiter(
+            (codes.setdefault(category, len(codes)) for category in categories),
+            dtype=np.int64, count=len(amounts),
+        )
+        self.categories = list(codes)
+
+    @classmethod
+    def from_records(cls, records):
+        np = load_numpy()
+        records = list(records)
+        return cls(
+            np.fromiter((record.amount for record in records), dtype=np.float64, count=len(records)),
+            np.fromiter((record.day or 0 for record in records), dtype=np.int64, count=len(records)),
+            (record.category for record in records),
+        )
+
+    @classmethod
+    def from_table(cls, table):
+        # Массивы таблицы копируются целиком, без обхода значений в Python
+        np = load_numpy()
+        return cls(
+            np.frombuffer(table.column('amount'), dtype=np.float64).copy(),
+            np.frombuffer(table.column('date'), dtype=np.int64).copy(),
+            table.column('category'),
+        )
+
+    def mask(self, start_date=None, end_date=None):
+        np = load_numpy()
+        mask = np.ones(len(self.amounts), dtype=bool)
+        if start_date is not None:
+            mask &= self.dates >= np.datetime64(to_ordinal(start_date) - self.epoch, 'D')
+        if end_date is not None:
+            mask &= self.dates <= np.datetime64(to_ordinal(end_date) - self.epoch, 'D')
+        return mask
+
+    def totals(self, start_date=None, end_date=None):
+        np = load_numpy()
+        mask = self.mask(start_date, end_date)
+        amounts = self.amounts[mask]
+        codes = self.codes[mask]
+        total_income = float(amounts[amounts > 0].sum())
+        total_expenses = float(amounts[amounts <= 0].sum())
+        sums = np.bincount(codes, weights=amounts, minlength=len(self.categories))
+        counts = np.bincount(codes, minlength=len(self.categories))
+        category_summary = {self.categories[code]: float(sums[code]) for code in np.flatnonzero(counts)}
+        return total_income, total_expenses, category_summary
+
+    def aggregate(self):
+        # Суммы по парам (день, категория) одним проходом bincount; результат в формате FinanceAggregates.to_dict
+        np = load_numpy()
+        if not len(self.amounts):
+            return []
+        width = len(self.categories)
+        keys, groups = np.unique(self.days * width + self.codes, return_inverse=True)
+        counts = np.bincount(groups)
+        income = np.bincount(groups, weights=np.where(self.amounts > 0, self.amounts, 0.0))
+        expenses = np.bincount(groups, weights=np.where(self.amounts > 0, 0.0, self.amounts))
+        days = {}
+        for key, count, day_income, day_expenses in zip(
+            keys.tolist(), counts.tolist(), income.tolist(), expenses.tolist()
+        ):
+            day, code = divmod(key, width)
+            totals = days.get(day)
+            if totals is None:
+                totals = days[day] = [day, 0, 0.0, 0.0, {}]
+            totals[1] += count
+            totals[2] += day_income
+            totals[3] += day_expenses
+            totals[4][self.categories[code]] = [count, day_income + day_expenses]
+        return list(days.values())
+
+
+def aggregate_finance_shard(columns, day_range, categories):
+    start, end = day_range
+    aggregates = FinanceAggregates()
+    for amount, code, day in zip(*columns):
+        if start <= day < end:
+            aggregates.add_values(amount, categories[code], day)
+    return aggregates.to_dict()
+
+
+def aggregate_finance_records(records, workers=None):
+    # Частичные агрегаты разных диапазонов дат не пересекаются по дням и сливаются в один объект
+    categories = {}
+    columns = (
+        array('d', [record.amount for record in records]),
+        array('q', [categories.setdefault(record.category, len(categories)) for record in records]),
+        array('q', [record.day or 0 for record in records]),
+    )
+    aggregates = FinanceAggregates()
+    for partial in map_shards(aggregate_finance_shard, columns, 2, (list(categories),), workers):
+        aggregates.merge(partial)
+    return aggregates
+
+
+class FinanceManager:
+    def __init__(self):
+        self.record_list = IndexedCollection('record_id', ('category',))
+        self.storage = open_storage('finance', FinanceRecord, ('date', 'category'))
+        self.storage.listener = self.apply_changes
+        self.ids = IdSequence(self.storage)
+        self.aggregates = None
+        self.load_records()
+
+    def find_record(self, record_id):
+        return self.record_list.get(record_id)
+
+    def add_record(self, amount, category, date, description):
+        date = parse_date(date)
+        new_id = self.ids.next()
+        new_record = FinanceRecord(new_id, amount, category, date, description)
+        self._attach(new_record)
+        self._write(new_record)
+        print('Запись добавлена!')
+        return new_record
+
+    def edit_record(self, record_id, edit_dict):
+        record = self.find_record(record_id)
+        if record:
+            changes = {}
+            for key, value in edit_dict.items():
+                if key == 'amount':
+                    changes[key] = float(value)
+                elif key in ('category', 'description'):
+                    changes[key] = value
+                elif key == 'date':
+                    changes[key] = parse_date(value)
+            aggregates = self.get_aggregates()
+            aggregates.remove(record)
+            self.record_list.update(record, changes)
+            aggregates.add(record)
+            self._write(record)
+            print('Изменения внесены!')
+            return record
+        else:
+            print('Запись не найдена')
+
+    def delete_record(self, record_id):
+        record = self.find_record(record_id)
+        if record:
+            self._detach(record)
+            self._erase(record_id)
+            print('Запись удалена')
+            return record
+        else:
+            print('Запись не найдена')
+
+    def _attach(self, record):
+        aggregates = self.get_aggregates()
+        self.record_list.add(record)
+        aggregates.add(record)
+
+    def _detach(self, record):
+        aggregates = self.get_aggregates()
+        self.record_list.remove(record)
+        aggregates.remove(record)
+
+    def _write(self, record):
+        self.storage.put(record.to_row())
+        if self.storage.needs_compaction():
+            self.save_records()
+
+    def _erase(self, record_id):
+        self.storage.delete(record_id)
+        if self.storage.needs_compaction():
+            self.save_records()
+
+    def filter_records(self, category=None, date=None):
+        if self.storage.supports_queries:
+            conditions = []
+            if category is not None:
+                conditions.append(('category', '=', category))
+            if date is not None:
+                conditions.append(('date', '<=', date))
+            filtered_records = self.record_list.get_many(self.storage.query_ids(conditions))
+        else:
+            filtered_records = self.record_list
+            if category is not None:
+                filtered_records = self.record_list.find('category', category)
+            if date is not None:
+                day = to_ordinal(date)
+                filtered_records = [record for record in filtered_records if record.day <= day]
+        return filtered_records
+
+    def iter_records(self, category=None, date=None, sort='id', after=None, reverse=False):
+        key = sort_key(FINANCE_SORT_KEYS, sort)
+        if category is None and date is None:
+            return self.record_list.iterate(sort, key, after, reverse)
+        return self.record_list.iterate_subset(self.filter_records(category, date), key, after, reverse)
+
+    def page_records(self, category=None, date=None, sort='id', after=None, limit=20, reverse=False):
+        key = sort_key(FINANCE_SORT_KEYS, sort)
+        if category is None and date is None:
+            return self.record_list.page(sort, key, after, limit, reverse)
+        # Категория берётся из индекса или SQL, курсор применяется к найденным записям
+        return self.record_list.page_subset(self.filter_records(category, date), key, after, limit, reverse)
+
+    def print_record(self, record):
+        print(f'{record.record_id}. {format_date(record.date)} {record.amount} {record.category} {record.description}')
+
+    def list_records(self, category=None, date=None, sort='id', page_size=20):
+        page_through(lambda after: self.page_records(category, date, sort, after, page_size), self.print_record)
+
+    def generate_report(self, start_date, end_date):
+        start_date = parse_date(start_date)
+        end_date = parse_date(end_date)
+        total_income, total_expenses, category_summary = self.get_aggregates().totals(start_date, end_date)
+        balance = total_income + total_expenses
+        start_date = format_date(start_date)
+        end_date = format_date(end_date)
+
+        print(f'Отчёт за период с {start_date} по {end_date}:')
+        print(f'Общий доход: {total_income}')
+        print(f'Общий расход: {total_expenses}')
+        print(f'Баланс: {balance}')
+
+        print('Сводка по категориям:')
+        for category, amount in category_summary.items():
+            print(f'{category}: {amount}')
+
+    def save_records(self):
+        with self.storage.locked():
+            self.storage.refresh()
+            rows = [record.to_row() for record in self.record_list]
+            aggregates = self.get_aggregates()
+            self.storage.compact(rows)
+            self.storage.save_sidecar('aggregates', aggregates.to_dict())
+
+    def apply_changes(self, changes):
+        if changes is None:
+            self.record_list.clear()
+            self.aggregates = None
+            self.load_records()
+        else:
+            merge_changes(self.record_list, FinanceRecord, changes, self._attach, self._detach)
+            if self.storage.supports_summary:
+                # Прежние значения ещё не прочитанных записей неизвестны - сводка перечитывается из базы
+                self.aggregates = None
+
+    def load_records(self):
+        try:
+            rows = self.storage.load(lazy=lazy_loading(self.storage))
+            self.record_list.attach_reader(self.storage.reader, self.storage.deleted, FinanceRecord)
+            self.record_list.extend(FinanceRecord.from_row(row) for row in rows)
+        except FileNotFoundError:
+            print('Нет сохранённых записей')
+        self.ids.restore()
+
+    def get_aggregates(self):
+        if self.aggregates is None:
+            self.load_aggregates()
+        return self.aggregates
+
+    def load_aggregates(self):
+        if self.storage.supports_summary:
+            # Сводку по дням ведёт сама база, записи для этого не читаются
+            self.aggregates = FinanceAggregates.from_summary(self.storage.load_summary())
+            return
+        data = self.storage.load_sidecar('aggregates')
+        if data is None:
+            records = list(self.record_list)
+            if load_numpy() is not None and len(records) >= COLUMNAR_THRESHOLD:
+                # Большое хранилище без сохранённых агрегатов суммируется векторно
+                self.aggregates = FinanceAggregates.from_dict(FinanceColumns.from_records(records).aggregate())
+                return
+            self.aggregates = aggregate_finance_records(records)
+            return
+        # Снимок агрегатов догоняется записями журнала, сделанными после него
+        self.aggregates = FinanceAggregates.from_dict(data)
+        for old, new in self.storage.replayed:
+            if old is not None:
+                self.aggregates.remove(FinanceRecord.from_row(old))
+            if new is not None:
+                self.aggregates.add(FinanceRecord.from_row(new))
+
+    def export_csv(self, filename, chunk_size=10000):
+        export_csv_records(filename, FinanceRecord.schema, self.record_list, chunk_size)
+        print('Данные успешно экспортированы')
+
+    def import_csv(self, filename, chunk_size=10000):
+        try:
+            stats = import_csv_records(
+                filename, FinanceRecord, self.record_list, self._attach, self._detach, self.ids, chunk_size
+            )
+            self.save_records()
+            print_import_stats(*stats)
+        except FileNotFoundError:
+            print('Файл не найден...')
+
+    def evaluate_formula(self, expression, category=None):
+        records = self.record_list if category is None else self.filter_records(category)
+        ids = [record.record_id for record in records]
+        amounts = [record.amount for record in records]
+        values = compile_expression(expression).evaluate_many({'amount': amounts})
+        return dict(zip(ids, values.tolist() if load_numpy() is not None else values))
+
+    def yearly_totals(self):
+        aggregates = self.get_aggregates()
+        totals = {}
+        for year in aggregates.years():
+            totals[year] = aggregates.totals(datetime.date(year, 1, 1), datetime.date(year, 12, 31))
+        return totals
+
+    def year_over_year_report(self):
+        totals = self.yearly_totals()
+        if not totals:
+            print('Нет записей с датами')
+            return
+        previous = None
+        for year, (total_income, total_expenses, category_summary) in totals.items():
+            balance = total_income + total_expenses
+            print(f'{year}: доход {total_income:.2f}, расход {total_expenses:.2f}, баланс {balance:.2f}')
+            if previous is not None and previous[0]:
+                change = (total_income - previous[0]) / previous[0] * 100
+                print(f'  Изменение дохода к {year - 1}: {change:+.1f}%')
+            for category, amount in sorted(category_summary.items()):
+                print(f'  {category}: {amount:.2f}')
+            previous = total_income, total_expenses
+
+    def calculate_balance(self):
+        balance = self.get_aggregates().balance()
+        print(f'Общий баланс: {balance}')
+
+
+
+
+
+EXPRESSION_TOKEN = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)|(\*\*|[-+*/%^(),]))')
+
+SCALAR_LIBRARY = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '%': operator.mod,
+    '^': math.pow,
+    'neg': operator.neg,
+    'abs': abs,
+    # Числа выражения - float, поэтому число знаков приводится к int; min и max принимают и один аргумент
+    'round': lambda value, digits=0: round(value, int(digits)),
+    'min': lambda *args: min(args),
+    'max': lambda *args: max(args),
+    'sqrt': math.sqrt,
+    'log': math.log,
+    'exp': math.exp,
+}
+
+# Функция -> (наименьшее, наибольшее) число аргументов; None - без ограничения
+FUNCTIONS = {
+    'abs': (1, 1), 'round': (1, 2), 'min': (1, None), 'max': (1, None), 'sqrt': (1, 1), 'log': (1, 1), 'exp': (1, 1),
+}
+
+_array_library = None
+_checked_library = None
+
+
+def checked_library():
+    # Для расчёта по строкам: бесконечный результат любой операции - такая же ошибка, как деление на ноль
+    global _checked_library
+    if _checked_library is None:
+        def checked(function):
+            def call(*args):
+                value = function(*args)
+                if not math.isfinite(value):
+                    raise OverflowError('бесконечный результат')
+                return value
+            return call
+        _checked_library = {name: checked(function) for name, function in SCALAR_LIBRARY.items()}
+    return _checked_library
+
+
+def array_library():
+    # Неопределённые и бесконечные значения каждой операции заменяются на nan, который доходит до результата,
+    # поэтому строка с ошибкой в любом месте выражения даёт nan так же, как при расчёте по строкам
+    global _array_library
+    if _array_library is None:
+        np = load_numpy()
+
+        def finite(function):
+            def call(*args):
+                result = function(*args)
+                return np.where(np.isfinite(result), result, np.nan)
+            return call
+        # Операции numpy и над постоянными частями выражения: 0 % 0 даёт nan, а не исключение
+        functions = {
+            '+': np.add,
+            '-': np.subtract,
+            '*': np.multiply,
+            '/': np.true_divide,
+            '%': np.remainder,
+            'neg': np.negative,
+            # power(nan, 0) = 1 потеряло бы ошибку
+            '^': lambda base, exponent: np.where(
+                np.isnan(base) | np.isnan(exponent), np.nan, np.power(base, exponent)
+            ),
+            'abs': np.abs,
+            # np.round умножает на 10^digits и теряет точность на половинах, round из Python округляет точно
+            'round': lambda value, digits=0: np.asarray(
+                np.frompyfunc(lambda item: round(float(item), int(digits)), 1, 1)(value), dtype=float
+            ),
+            'min': lambda *args: functools.reduce(np.minimum, args),
+            'max': lambda *args: functools.reduce(np.maximum, args),
+            'sqrt': np.sqrt,
+            'log': np.log,
+            'exp': np.exp,
         }
+        _array_library = {name: finite(function) for name, function in functions.items()}
+    return _array_library
+
+
+class ExpressionError(ValueError):
+    pass
+
+
+def tokenize_expression(text):
+    tokens = []
+    text = text.strip()
+    position = 0
+    while position < len(text):
+        match = EXPRESSION_TOKEN.match(text, position)
+        if match is None:
+            raise ExpressionError(f"Неверное выражение: недопустимый символ '{text[position:].lstrip()[0]}'")
+        number, name, symbol = match.groups()
+        if number:
+            tokens.append(('number', float(number)))
+        elif name:
+            tokens.append(('name', name))
+        else:
+            tokens.append(('op', '^' if symbol == '**' else symbol))
+        position = match.end()
+    tokens.append(('end', None))
+    return tokens
+
+
+class ExpressionParser:
+    # Pratt-парсер: чем больше сила связывания, тем раньше выполняется операция
+    binding_powers = {'+': 10, '-': 10, '*': 20, '/': 20, '%': 20, '^': 40}
+    prefix_power = 30
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position]
+
+    def next(self):
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def expect(self, symbol):
+        kind, value = self.next()
+        if (kind, value) != ('op', symbol):
+            raise self.unexpected(kind, value)
+
+    def unexpected(self, kind, value):
+        if kind == 'end':
+            return ExpressionError('Неверное выражение: неожиданный конец')
+        return ExpressionError(f"Неверное выражение: неожиданное '{format_number(value) if kind == 'number' else value}'")
+
+    def parse(self):
+        node = self.expression(0)
+        kind, value = self.peek()
+        if kind != 'end':
+            raise self.unexpected(kind, value)
+        return node
+
+    def expression(self, min_power):
+        left = self.prefix()
+        while True:
+            kind, value = self.peek()
+            power = self.binding_powers.get(value) if kind == 'op' else None
+            if power is None or power <= min_power:
+                return left
+            self.next()
+            # Степень правоассоциативна: 2^3^2 = 2^(3^2)
+            right = self.expression(power - 1 if value == '^' else power)
+            left = fold_constants(('binary', value, left, right))
+
+    def prefix(self):
+        kind, value = self.next()
+        if kind == 'number':
+            return ('number', value)
+        if kind == 'name':
+            if self.peek() != ('op', '('):
+                return ('name', value)
+            if value not in FUNCTIONS:
+                raise ExpressionError(f'Неизвестная функция: {value}')
+            self.next()
+            args = []
+            if self.peek() != ('op', ')'):
+                args.append(self.expression(0))
+                while self.peek() == ('op', ','):
+                    self.next()
+                    args.append(self.expression(0))
+            self.expect(')')
+            low, high = FUNCTIONS[value]
+            if len(args) < low or high is not None and len(args) > high:
+                raise ExpressionError(f'Неверное число аргументов функции {value}: {len(args)}')
+            return fold_constants(('call', value, args))
+        if kind == 'op' and value in ('+', '-'):
+            operand = self.expression(self.prefix_power)
+            return operand if value == '+' else fold_constants(('unary', 'neg', operand))
+        if (kind, value) == ('op', '('):
+            node = self.expression(0)
+            self.expect(')')
+            return node
+        raise self.unexpected(kind, value)
+
+
+def format_number(value):
+    return str(int(value)) if value.is_integer() else str(value)
+
+
+def node_operands(node):
+    if node[0] == 'binary':
+        return [node[2], node[3]]
+    if node[0] == 'unary':
+        return [node[2]]
+    return node[2]
+
+
+def fold_constants(node):
+    operands = node_operands(node)
+    if not all(operand[0] == 'number' for operand in operands):
+        return node
+    try:
+        return ('number', SCALAR_LIBRARY[node[1]](*(operand[1] for operand in operands)))
+    except (ArithmeticError, ValueError, TypeError):
+        # Ошибка (например, деление на ноль) должна возникнуть при вычислении
+        return node
+
+
+def build_closure(node, library):
+    kind = node[0]
+    if kind == 'number':
+        value = node[1]
+        return lambda env: value
+    if kind == 'name':
+        name = node[1]
+        return lambda env: env[name]
+    function = library[node[1]]
+    operands = [build_closure(operand, library) for operand in node_operands(node)]
+    if len(operands) == 1:
+        operand = operands[0]
+        return lambda env: function(operand(env))
+    if len(operands) == 2:
+        left, right = operands
+        return lambda env: function(left(env), right(env))
+    return lambda env: function(*[operand(env) for operand in operands])
+
+
+def node_variables(node):
+    if node[0] == 'name':
+        return {node[1]}
+    if node[0] == 'number':
+        return set()
+    return set().union(*map(node_variables, node_operands(node)))
+
+
+class CompiledExpression:
+    def __init__(self, text, tree):
+        self.text = text
+        self.tree = tree
+        self.variables = sorted(node_variables(tree))
+        self.scalar = build_closure(tree, SCALAR_LIBRARY)
+        self.checked = None
+        self.vector = None
+
+    def __call__(self, **bindings):
+        return self.evaluate(bindings)
+
+    def evaluate(self, bindings=None):
+        try:
+            return self.scalar(bindings or {})
+        except KeyError as e:
+            raise ExpressionError(f'Не задана переменная: {e.args[0]}')
+
+    def evaluate_many(self, bindings):
+        # Принимает столбцы {имя: значения} или список словарей с переменными.
+        # Оба пути дают одинаковый результат: ошибка или бесконечность в строке (например, деление на ноль) - nan
+        if not isinstance(bindings, dict):
+            rows = list(bindings)
+            try:
+                bindings = {name: [row[name] for row in rows] for name in self.variables}
+            except KeyError as e:
+                raise ExpressionError(f'Не задана переменная: {e.args[0]}')
+            size = len(rows)
+        else:
+            missing = [name for name in self.variables if name not in bindings]
+            if missing:
+                raise ExpressionError(f'Не задана переменная: {missing[0]}')
+            # Без столбцов выражение постоянно и вычисляется один раз
+            size = len(next(iter(bindings.values()))) if bindings else 1
+        np = load_numpy()
+        if np is not None:
+            if self.vector is None:
+                self.vector = build_closure(self.tree, array_library())
+            columns = {name: np.asarray(bindings[name], dtype=np.float64) for name in self.variables}
+            with np.errstate(all='ignore'):
+                result = np.array(np.broadcast_to(self.vector(columns), (size,)), dtype=np.float64)
+            # Свёрнутая при разборе бесконечная константа
+            result[~np.isfinite(result)] = np.nan
+            return result
+        if self.checked is None:
+            self.checked = build_closure(self.tree, checked_library())
+        values = []
+        for position in range(size):
+            try:
+                value = float(self.checked({name: bindings[name][position] for name in self.variables}))
+            except (ArithmeticError, ValueError):
+                value = math.nan
+            values.append(value if math.isfinite(value) else math.nan)
+        return values
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(text):
+    # Повторные выражения берутся из кэша и не разбираются заново
+    return CompiledExpression(text, ExpressionParser(tokenize_expression(text)).parse())
+
+
+class Calculator:
+    def add(self, a, b):
+        return a + b
+
+    def subtract(self, a, b):
+        return a - b
+
+    def multiply(self, a, b):
+        return a * b
+
+    def divide(self, a, b):
+        if b == 0:
+            return "Деление на ноль недопустимо"
+        return a / b
+
+    def calculate(self, expression, **bindings):
+        try:
+            return compile_expression(expression).evaluate(bindings)
+        except ZeroDivisionError:
+            return "Деление на ноль недопустимо"
+        except ValueError as e:
+            return str(e)
+        except Exception as e:
+            return f"Ошибка: {e}"
+
+    def evaluate_many(self, expression, bindings):
+        return compile_expression(expression).evaluate_many(bindings)
+
+
+
+
+_managers = {}
+
+
+def get_manager(manager_class):
+    # Менеджер загружается один раз за время работы программы
+    if manager_class not in _managers:
+        _managers[manager_class] = manager_class()
+    else:
+        storage = getattr(_managers[manager_class], 'storage', None)
+        if storage is not None:
+            # Подхватываем изменения, сделанные другими процессами
+            storage.refresh()
+    return _managers[manager_class]
+
+
+def load_managers(manager_classes=(NoteManager, TaskManager, ContactManager, FinanceManager)):
+    missing = [manager_class for manager_class in manager_classes if manager_class not in _managers]
+    if STORAGE_BACKEND == 'sqlite' or len(missing) < 2:
+        # Все таблицы SQLite читаются через одно соединение, параллельная загрузка ничего не даст
+        for manager_class in missing:
+            get_manager(manager_class)
+        return
+    # Хранилища независимы: пока один поток ждёт диска, другие разбирают свои снимки
+    import concurrent.futures
+
+    with concurrent.futures.ThreadPoolExecutor(len(missing)) as executor:
+        managers = list(executor.map(lambda manager_class: manager_class(), missing))
+    _managers.update(zip(missing, managers))
+
+
+@contextlib.contextmanager
+def storage_transaction(storage, conflicts):
+    committed = False
+    try:
+        with storage.transaction():
+            yield
+            committed = True
+    except ConflictError as e:
+        # Конфликт при записи касается только этого хранилища и не должен откатывать остальные
+        if not committed:
+            raise
+        conflicts.append(e)
+
+
+@contextlib.contextmanager
+def transaction(conflicts=None):
+    # Изменения всех загруженных менеджеров записываются одной пачкой на хранилище.
+    # Конфликты при записи собираются в conflicts, если список передан, иначе первый из них поднимается
+    # после того, как записаны все хранилища
+    found = [] if conflicts is None else conflicts
+    with contextlib.ExitStack() as stack:
+        for manager in list(_managers.values()):
+            storage = getattr(manager, 'storage', None)
+            if storage is not None:
+                stack.enter_context(storage_transaction(storage, found))
+        yield
+    if conflicts is None and found:
+        raise found[0]
+
+
+INSTRUMENTED_METHODS = {
+    JournalStorage: ('load', 'compact', 'write_pending', 'catch_up'),
+    SqliteStorage: ('load', 'compact', 'put', 'delete', 'query_ids'),
+    NoteManager: (
+        'load_notes', 'save_notes', 'find_note', 'search_notes', 'add_note', 'edit_note', 'delete_note',
+        'import_csv', 'export_csv',
+    ),
+    TaskManager: (
+        'load_tasks', 'save_tasks', 'find_task', 'filter_tasks', 'add_task', 'edit_task', 'change_done',
+        'delete_task', 'next_tasks', 'overdue_tasks', 'tasks_due_between', 'import_csv', 'export_csv',
+    ),
+    ContactManager: (
+        'load_contacts', 'save_contacts', 'find_contact', 'search_contacts', 'add_contact', 'edit_contact',
+        'delete_contact', 'import_csv', 'export_csv',
+    ),
+    FinanceManager: (
+        'load_records', 'save_records', 'find_record', 'filter_records', 'add_record', 'edit_record',
+        'delete_record', 'generate_report', 'calculate_balance', 'evaluate_formula', 'import_csv', 'export_csv',
+    ),
+    Calculator: ('calculate', 'evaluate_many'),
+}
+
+
+def timed(name, function):
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            metrics.observe(name, time.perf_counter() - started)
+    wrapper.original = function
+    return wrapper
+
+
+def enable_metrics():
+    # Методы оборачиваются только при включении: выключенные метрики ничего не стоят
+    if metrics.enabled:
+        return
+    for owner, names in INSTRUMENTED_METHODS.items():
+        for name in names:
+            setattr(owner, name, timed(f'{owner.__name__}.{name}', getattr(owner, name)))
+    metrics.enabled = True
+
+
+def disable_metrics():
+    if not metrics.enabled:
+        return
+    for owner, names in INSTRUMENTED_METHODS.items():
+        for name in names:
+            setattr(owner, name, getattr(owner, name).original)
+    metrics.enabled = False
+
+
+class ProfileHook:
+    def __init__(self, target, name, kind='cprofile', filename=None):
+        if kind not in ('cprofile', 'tracemalloc'):
+            raise ValueError(f'Неизвестный профилировщик: {kind}')
+        self.target = target
+        self.name = name
+        self.kind = kind
+        self.filename = filename
+        self.profiler = None
+        self.snapshots = []
+        self.peak = 0
+        self.original = getattr(target, name)
+        setattr(target, name, self.wrap(self.original))
+
+    def wrap(self, function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if self.kind == 'cprofile':
+                if self.profiler is None:
+                    import cProfile
+                    self.profiler = cProfile.Profile()
+                self.profiler.enable()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.profiler.disable()
+            import tracemalloc
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+                self.snapshots.append(tracemalloc.take_snapshot())
+                if started:
+                    tracemalloc.stop()
+        return wrapper
+
+    def report(self, limit=20):
+        output = io.StringIO()
+        if self.kind == 'cprofile':
+            if self.profiler is not None:
+                import pstats
+                pstats.Stats(self.profiler, stream=output).sort_stats('cumulative').print_stats(limit)
+        else:
+            print(f'Пиковая память: {self.peak} байт', file=output)
+            if self.snapshots:
+                for statistic in self.snapshots[-1].statistics('lineno')[:limit]:
+                    print(statistic, file=output)
+        return output.getvalue()
+
+    def stop(self):
+        # У экземпляра обёртка удаляется, и снова работает метод класса
+        if isinstance(self.target, type):
+            setattr(self.target, self.name, self.original)
+        else:
+            delattr(self.target, self.name)
+        if self.filename:
+            if self.kind == 'cprofile' and self.profiler is not None:
+                self.profiler.dump_stats(self.filename)
+            else:
+                with open(self.filename, 'w', encoding='utf-8') as file:
+                    file.write(self.report())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+        return False
+
+
+def profile_method(target, name, kind='cprofile', filename=None):
+    return ProfileHook(target, name, kind, filename)
+
+
+if METRICS_ENABLED:
+    enable_metrics()
+if METRICS_FILENAME:
+    atexit.register(lambda: metrics.dump(METRICS_FILENAME))
+
+
+class QueryError(ValueError):
+    pass
+
+
+def date_ordinal(value):
+    return to_ordinal(parse_date(value))
+
+
+# Источник запроса: (класс менеджера, коллекция, ключи сортировки, поля).
+# Поле: (атрибут или функция записи, приведение значения из запроса, имя упорядоченного индекса)
+QUERY_SOURCES = {
+    'notes': (NoteManager, 'note_list', NOTE_SORT_KEYS, {
+        'note_id': ('note_id', int, 'id'),
+        'title': ('title', str, None),
+        'content': ('content', str, None),
+        'text': (Note.text, str, None),
+        'timestamp': ('timestamp', parse_timestamp, 'timestamp'),
+    }),
+    'tasks': (TaskManager, 'task_list', TASK_SORT_KEYS, {
+        'task_id': ('task_id', int, 'id'),
+        'title': ('title', str, None),
+        'description': ('description', str, None),
+        'priority': ('priority', str, None),
+        'done': ('done', parse_bool, None),
+        'due_date': ('due_ordinal', date_ordinal, 'due_date'),
+    }),
+    'contacts': (ContactManager, 'contact_list', {}, {
+        'contact_id': ('contact_id', int, None),
+        'name': ('name', str, None),
+        'phone': ('phone', str, None),
+        'email': ('email', str, None),
+    }),
+    'finance': (FinanceManager, 'record_list', FINANCE_SORT_KEYS, {
+        'record_id': ('record_id', int, 'id'),
+        'amount': ('amount', float, 'amount'),
+        'category': ('category', str, None),
+        'date': ('day', date_ordinal, 'date'),
+        'description': ('description', str, None),
+    }),
+}
+
+# Поля заметок, для которых слова ищутся через текстовый индекс
+TEXT_INDEX_FIELDS = ('title', 'content', 'text')
+
+QUERY_OPERATORS = {
+    '=': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    'in': lambda value, operand: value in operand,
+    'between': lambda value, operand: operand[0] <= value <= operand[1],
+    'contains': lambda value, operand: operand in value.casefold(),
+    'match': lambda value, operand: operand <= set(tokenize(value)),
+}
+
+JOIN_OPERATORS = ('=', 'mentions')
+TEXT_OPERATORS = ('contains', 'match', 'mentions')
+
+
+def check_text_operator(field, op):
+    # Текстовые операторы работают со строками - для чисел, дат и флагов ошибка видна сразу при разборе запроса
+    if op in TEXT_OPERATORS and field.convert is not str:
+        raise QueryError(f'Оператор {op} применим только к текстовым полям, а {field.source}.{field.name} не текст')
+
+
+class QueryField:
+    def __init__(self, source, name):
+        if not isinstance(source, str) or source not in QUERY_SOURCES:
+            raise QueryError(f'Неизвестный источник: {source}')
+        fields = QUERY_SOURCES[source][3]
+        if name not in fields:
+            raise QueryError(f'Неизвестное поле {source}.{name}')
+        attribute, self.convert, self.order = fields[name]
+        self.source = source
+        self.name = name
+        self.attribute = attribute if isinstance(attribute, str) else None
+        self.get = operator.attrgetter(attribute) if self.attribute else attribute
+
+    def sort_key(self):
+        # Поле с упорядоченным индексом сортируется его ключом, иначе пустые значения идут последними
+        if self.order is not None:
+            return QUERY_SOURCES[self.source][2][self.order]
+        get = self.get
+        return lambda record: (get(record) is None, get(record))
+
+
+class Predicate:
+    def __init__(self, field, op, value):
+        if op not in QUERY_OPERATORS:
+            raise QueryError(f'Неизвестный оператор: {op}')
+        check_text_operator(field, op)
+        self.field = field
+        self.op = op
+        self.value = value
+        try:
+            if op == 'in':
+                self.operand = {field.convert(item) for item in value}
+            elif op == 'between':
+                start, end = value
+                self.operand = (field.convert(start), field.convert(end))
+            elif op == 'contains':
+                self.operand = str(value).casefold()
+            elif op == 'match':
+                self.operand = set(tokenize(str(value)))
+            else:
+                self.operand = field.convert(value)
+        except (TypeError, ValueError) as e:
+            raise QueryError(f'Некорректное значение для {self}: {e}') from e
+        self.compare = QUERY_OPERATORS[op]
+
+    def __call__(self, record):
+        value = self.field.get(record)
+        # Пустые значения (задача без срока) не подходят ни под одно условие
+        return value is not None and self.compare(value, self.operand)
+
+    def key_range(self, entries):
+        # Границы условия в отсортированном списке (ключ, id)
+        low, high = 0, len(entries)
+        if self.op == 'between':
+            start, end = self.operand
+        else:
+            start = end = self.operand
+        if self.op in ('=', '>=', 'between'):
+            low = bisect.bisect_left(entries, (start,))
+        elif self.op == '>':
+            low = bisect.bisect_left(entries, (start, math.inf))
+        if self.op in ('=', '<=', 'between'):
+            high = bisect.bisect_left(entries, (end, math.inf))
+        elif self.op == '<':
+            high = bisect.bisect_left(entries, (end,))
+        return low, max(low, high)
+
+    def __str__(self):
+        return f'{self.field.source}.{self.field.name} {self.op} {self.value!r}'
+
+
+class AccessPath:
+    def __init__(self, cost, description, fetch, ordered=False):
+        self.cost = cost
+        self.description = description
+        self.fetch = fetch
+        self.ordered = ordered
+
+
+class Join:
+    def __init__(self, left, op, right, alias):
+        if op not in JOIN_OPERATORS:
+            raise QueryError(f'Соединение поддерживает только {", ".join(JOIN_OPERATORS)}, а не {op}')
+        self.left_alias, self.left = left
+        check_text_operator(self.left, op)
+        check_text_operator(right, op)
+        self.op = op
+        self.right = right
+        self.alias = alias
+        self.filters = []
+
+    def describe(self, collection):
+        right = self.right
+        if self.op == 'mentions':
+            return f'поиск упоминаний {right.name} среди {len(collection)} записей по словарю фраз'
+        if right.attribute == collection.key:
+            return f'поиск по ключу {right.name}'
+        if right.attribute in collection.indexes:
+            return f'индекс {right.name}'
+        return f'хеш-таблица по {len(collection)} записям'
+
+    def lookup(self, collection):
+        right = self.right
+        if self.op == 'mentions':
+            # Значения правой стороны раскладываются по фразам из слов,
+            # слова левого текста перебираются отрезками той же длины
+            phrases = {}
+            for record in collection:
+                value = right.get(record)
+                words = tuple(tokenize(value)) if value else ()
+                if words:
+                    phrases.setdefault(words, []).append(record)
+            lengths = sorted({len(words) for words in phrases})
+
+            def mentioned(text):
+                tokens = tokenize(text)
+                found = {}
+                for length in lengths:
+                    for start in range(len(tokens) - length + 1):
+                        for record in phrases.get(tuple(tokens[start:start + length]), ()):
+                            found[getattr(record, collection.key)] = record
+                return found.values()
+            return mentioned
+        if right.attribute == collection.key:
+            return lambda value: filter(None, [collection.get(value)])
+        if right.attribute in collection.indexes:
+            return lambda value: collection.find(right.attribute, value)
+        table = {}
+        for record in collection:
+            table.setdefault(right.get(record), []).append(record)
+        return lambda value: table.get(value, ())
+
+    def __str__(self):
+        return f'{self.left_alias}.{self.left.name} {self.op} {self.alias}.{self.right.name}'
+
 
-class NoteManager:
-    def __init__(self):
-        self.note_list = []
-        self.load_notes()
+class Query:
+    def __init__(self, source):
+        if not isinstance(source, str) or source not in QUERY_SOURCES:
+            raise QueryError(f'Неизвестный источник: {source}')
+        self.source = source
+        self.sources = {source: source}
+        self.predicates = []
+        self.joins = []
+        self.sort = None
+        self.reverse = False
+        self.max_rows = None
 
-    def find_note(self, note_id):
-        for note in self.note_list:
-            if note.note_id == note_id:
-                return note
-        return None
+    @classmethod
+    def from_dict(cls, spec):
+        if not isinstance(spec, dict):
+            raise QueryError('Запрос должен быть объектом')
+        query = cls(spec.get('from'))
+        for join in spec.get('join', ()):
+            query.join(join['source'], join['left'], join.get('op', '='), join['right'], join.get('alias'))
+        for field, op, value in spec.get('where', ()):
+            query.where(field, op, value)
+        if spec.get('order_by'):
+            query.order_by(spec['order_by'], spec.get('reverse', False))
+        if spec.get('limit') is not None:
+            query.limit(spec['limit'])
+        return query
 
-    def view_note(self, note_id):
-        note = self.find_note(note_id)
-        if note:
-            print(f'ID: {note.note_id}\nЗаголовок: {note.title}\nСодержание: {note.content}\nВремя создания: {note.timestamp}')
-        else:
-            print(f'Заметка с ID {note_id} не найдена...')
+    def resolve(self, name):
+        # Поля присоединённых источников записываются как псевдоним.поле
+        alias, _, field = name.rpartition('.')
+        alias = alias or self.source
+        if alias not in self.sources:
+            raise QueryError(f'Неизвестный источник в поле {name}')
+        return alias, QueryField(self.sources[alias], field)
 
-    def list_notes(self):
-        if self.note_list:
-            for note in self.note_list:
-                print(self.view_note(note.note_id))
+    def where(self, name, op, value):
+        alias, field = self.resolve(name)
+        predicate = Predicate(field, op, value)
+        if alias == self.source:
+            self.predicates.append(predicate)
         else:
-            print('Список заметок пуст...')
+            next(join for join in self.joins if join.alias == alias).filters.append(predicate)
+        return self
 
-    def add_note(self, title, content):
-        timestamp = datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')
-        max_id = max((note.note_id for note in self.note_list), default=0) + 1
-        new_note = Note(max_id, title, content, timestamp)
-        self.note_list.append(new_note)
-        self.save_notes()
-        print('Заметка добавлена!')
+    def join(self, source, left, op, right, alias=None):
+        alias = alias or source
+        if alias in self.sources:
+            raise QueryError(f'Псевдоним {alias} уже используется')
+        join = Join(self.resolve(left), op, QueryField(source, right), alias)
+        self.sources[alias] = source
+        self.joins.append(join)
+        return self
 
-    def save_notes(self):
-        notes_dicts = [note.to_dict() for note in self.note_list]
-        with open('notes.json', 'w') as file:
-            json.dump(notes_dicts, file, indent=4)
+    def order_by(self, name, reverse=False):
+        self.sort = self.resolve(name)
+        self.reverse = reverse
+        return self
 
-    def load_notes(self):
-        try:
-            with open('notes.json', 'r') as file:
-                notes = json.load(file)
-            self.note_list = [Note(**note) for note in notes]
-        except FileNotFoundError:
-            print('Нет сохранённых заметок')
+    def limit(self, count):
+        if count < 0:
+            raise QueryError('Ограничение не может быть отрицательным')
+        self.max_rows = count
+        return self
 
-    def delete_note(self, note_id):
-        note = self.find_note(note_id)
-        if note:
-            self.note_list.remove(note)
-            self.save_notes()
-            print('Заметка удалена')
-        else:
-            print('Заметка не найдена')
+    def access_paths(self, manager, collection):
+        yield AccessPath(len(collection), f'полный просмотр {self.source}', lambda: iter(collection))
+        for predicate in self.predicates:
+            field = predicate.field
+            if predicate.op in ('=', 'in') and field.attribute == collection.key:
+                ids = [predicate.operand] if predicate.op == '=' else sorted(predicate.operand)
+                yield AccessPath(
+                    len(ids), f'поиск по ключу: {predicate}',
+                    lambda ids=ids: filter(None, map(collection.get, ids))
+                )
+            elif predicate.op in ('=', 'in') and field.attribute in collection.indexes:
+                values = [predicate.operand] if predicate.op == '=' else list(predicate.operand)
+                cost = sum(collection.count(field.attribute, value) for value in values)
+                yield AccessPath(
+                    cost, f'индекс {field.name}: {predicate}',
+                    lambda field=field, values=values: itertools.chain.from_iterable(
+                        collection.find(field.attribute, value) for value in values
+                    )
+                )
+            elif predicate.op in ('=', '<', '<=', '>', '>=', 'between') and field.order in collection.orders:
+                # Упорядоченный индекс используется, только если он уже построен: строить его ради
+                # одного запроса дороже полного просмотра
+                entries = collection.orders[field.order][1]
+                low, high = predicate.key_range(entries)
+                # Диапазон обходится в направлении сортировки запроса, чтобы сортировать не пришлось
+                step = -1 if self.reverse and self.sort is not None and self.sort[1].order == field.order else 1
+                yield AccessPath(
+                    high - low, f'диапазон упорядоченного индекса {field.order}: {predicate}',
+                    lambda entries=entries, low=low, high=high, step=step: (
+                        collection.items[item_id] for _, item_id in entries[low:high][::step]
+                    ),
+                    ordered=field.order
+                )
+            elif predicate.op == 'match' and field.source == 'notes' and field.name in TEXT_INDEX_FIELDS:
+                postings = manager.get_text_index().postings
+                lists = sorted((postings.get(token, {}) for token in predicate.operand), key=len)
+                if lists:
+                    yield AccessPath(
+                        len(lists[0]), f'текстовый индекс заметок: {predicate}',
+                        lambda lists=lists: filter(None, [
+                            collection.get(doc_id) for doc_id in lists[0]
+                            if all(doc_id in other for other in lists[1:])
+                        ])
+                    )
+        if self.sort is not None and self.sort[0] == self.source and self.sort[1].order is not None:
+            field = self.sort[1]
+            yield AccessPath(
+                len(collection), f'обход упорядоченного индекса {field.order}',
+                lambda: collection.iterate(field.order, field.sort_key(), reverse=self.reverse), ordered=field.order
+            )
 
-    def edit_note(self, note_id, edit_dict):
-        note = self.find_note(note_id)
-        if note:
-            for key, value in edit_dict.items():
-                if key == 'title':
-                    note.title = value
-                elif key == 'content':
-                    note.content = value
-            note.timestamp = datetime.datetime.now().strftime('%d-%m-%Y %H:%M:%S')
-            self.save_notes()
-            print('Изменения внесены!')
-        else:
-            print('Заметка не найдена')
+    def choose_path(self, manager, collection):
+        def cost(path):
+            # Путь, который уже выдаёт записи в нужном порядке, избавляет от сортировки
+            if self.sort is None or (self.sort[0] == self.source and path.ordered == self.sort[1].order):
+                return path.cost
+            return path.cost + path.cost * math.log2(path.cost + 1)
+        return min(self.access_paths(manager, collection), key=cost)
 
-    def export_csv(self, filename):
-        notes_dicts = [note.to_dict() for note in self.note_list]
-        with open(filename, 'w', newline='') as file:
-            dict_writer = csv.DictWriter(file, fieldnames=['note_id', 'title', 'content', 'timestamp'])
-            dict_writer.writeheader()
-            dict_writer.writerows(notes_dicts)
-        print('Данные успешно экспортированы')
+    def manager(self, source, managers=None):
+        return lookup_manager(QUERY_SOURCES[source][0], managers)
 
-    def import_csv(self, filename):
-        try:
-            with open(filename, 'r', newline='') as file:
-                dict_reader = csv.DictReader(file)
-                for row in dict_reader:
-                    self.note_list.append(Note(**row))
-            self.save_notes()
-            print('Данные успешно импортированы')
-        except FileNotFoundError:
-            print('Файл не найден...')
+    def collection(self, manager, source):
+        return getattr(manager, QUERY_SOURCES[source][1])
 
+    def plan(self, managers=None):
+        manager = self.manager(self.source, managers)
+        collection = self.collection(manager, self.source)
+        path = self.choose_path(manager, collection)
+        steps = [f'{path.description}, ~{path.cost} из {len(collection)} записей']
+        if self.predicates:
+            steps.append('проверка условий: ' + '; '.join(map(str, self.predicates)))
+        collections = []
+        for join in self.joins:
+            source = self.sources[join.alias]
+            collections.append(self.collection(self.manager(source, managers), source))
+            steps.append(f'соединение {join.alias} по {join}: {join.describe(collections[-1])}')
+            if join.filters:
+                steps.append(f'проверка условий {join.alias}: ' + '; '.join(map(str, join.filters)))
+        sorted_already = self.sort is None or (self.sort[0] == self.source and path.ordered == self.sort[1].order)
+        if self.sort is not None:
+            alias, field = self.sort
+            direction = 'по убыванию' if self.reverse else 'по возрастанию'
+            if sorted_already:
+                steps.append(f'порядок {alias}.{field.name} {direction} задан индексом, сортировка не нужна')
+            elif self.max_rows is not None:
+                steps.append(f'отбор первых {self.max_rows} по {alias}.{field.name} {direction} через кучу')
+            else:
+                steps.append(f'сортировка по {alias}.{field.name} {direction}')
+        if self.max_rows is not None:
+            steps.append(f'ограничение: {self.max_rows}')
+        return path, collections, sorted_already, steps
 
+    def explain(self, managers=None):
+        return self.plan(managers)[3]
 
+    def run(self, managers=None):
+        path, collections, sorted_already, _ = self.plan(managers)
+        base_key = operator.attrgetter(self.collection(self.manager(self.source, managers), self.source).key)
+        records = (record for record in path.fetch() if all(predicate(record) for predicate in self.predicates))
+        rows = records
+        if self.joins:
+            rows = ({self.source: record} for record in records)
+            for join, collection in zip(self.joins, collections):
+                rows = self.join_rows(rows, join, join.lookup(collection))
+        if not sorted_already:
+            alias, field = self.sort
+            key = field.sort_key()
+            if self.joins:
+                row_key = lambda row: (key(row[alias]), base_key(row[self.source]))
+            else:
+                row_key = lambda row: (key(row), base_key(row))
+            if self.max_rows is None:
+                rows = sorted(rows, key=row_key, reverse=self.reverse)
+            elif self.reverse:
+                rows = heapq.nlargest(self.max_rows, rows, key=row_key)
+            else:
+                rows = heapq.nsmallest(self.max_rows, rows, key=row_key)
+        if self.max_rows is not None:
+            rows = itertools.islice(rows, self.max_rows)
+        return list(rows)
 
-class Task:
-    def __init__(self, task_id, title, description, priority, due_date):
-        self.task_id = task_id
-        self.title = title
-        self.description = description
-        self.priority = priority
-        self.due_date = due_date
-        self.done = False
+    def join_rows(self, rows, join, lookup):
+        for row in rows:
+            value = join.left.get(row[join.left_alias])
+            if value is None:
+                continue
+            for record in lookup(value):
+                if all(predicate(record) for predicate in join.filters):
+                    yield {**row, join.alias: record}
 
-    def to_dict(self):
-        return {
-            'task_id': self.task_id,
-            'title': self.title,
-            'description': self.description,
-            'done': self.done,
-            'priority': self.priority,
-            'due_date': self.due_date
-        }
 
+def lookup_manager(manager_class, managers=None):
+    if managers is None:
+        return get_manager(manager_class)
+    # Пакет уже загрузил и обновил свои менеджеры, повторная проверка журнала не нужна
+    manager = managers.get(manager_class)
+    if manager is None:
+        manager = managers[manager_class] = get_manager(manager_class)
+    return manager
 
-class TaskManager:
-    def __init__(self):
-        self.task_list = []
-        self.load_tasks()
 
-    def find_task(self, task_id):
-        for task in self.task_list:
-            if task.task_id == task_id:
-                return task
-        return None
+def run_query(spec, managers=None, explain=False):
+    query = Query.from_dict(spec)
+    if explain:
+        return {'plan': query.explain(managers)}
+    rows = query.run(managers)
+    if not query.joins:
+        return record_dicts(rows)
+    return [{alias: record.to_dict() for alias, record in row.items()} for row in rows]
 
-    def view_task(self, task_id):
-        task = self.find_task(task_id)
-        if task:
-            status = 'Выполнена' if task.done else 'Не выполнена'
-            print(
-                f'ID: {task.task_id}'
-                f'\nКраткое описание: {task.title}'
-                f'\nСтатус: {status}'
-                f'\nПриоритет: {task.priority}',
-                f'\nСрок: {task.due_date}'
-            )
-        else:
-            print(f'Задача с ID {task_id} не найдена...')
 
-    def show_list_tasks(self, status=None, priority=None, due_date=None):
-        filtered_tasks = self.task_list
+class NotFoundError(LookupError):
+    pass
 
-        if status is not None:
-            filtered_tasks = [task for task in filtered_tasks if task.done == status]
 
-        if priority is not None:
-            filtered_tasks = [task for task in filtered_tasks if task.priority == priority]
+def record_dict(record):
+    # Запрос к несуществующей записи - ошибка, а не пустой результат
+    if record is None:
+        raise NotFoundError('Запись не найдена')
+    return record.to_dict()
 
-        if due_date is not None:
-            due_date = datetime.datetime.strptime(due_date, '%d-%m-%Y')
-            filtered_tasks = [task for task in filtered_tasks if task.due_date <= due_date]
 
-        for task in filtered_tasks:
-            print(task)
+def record_dicts(records):
+    return [record.to_dict() for record in records]
 
-    def add_task(self, title, description, priority, due_date):
-        date = datetime.datetime.strptime(due_date, '%d-%m-%Y')
-        max_id = max((task.task_id for task in self.task_list), default=0) + 1
-        new_task = Task(max_id, title, description, priority, date)
-        self.task_list.append(new_task)
-        self.save_tasks()
-        print('Задача добавлена!')
 
-    def save_tasks(self):
-        tasks_dicts = [task.to_dict() for task in self.task_list]
-        with open('tasks.json', 'w') as file:
-            json.dump(tasks_dicts, file, indent=4)
+def record_page(page):
+    records, cursor = page
+    return {'records': record_dicts(records), 'cursor': cursor}
 
-    def load_tasks(self):
-        try:
-            with open('tasks.json', 'r') as file:
-                tasks = json.load(file)
-            self.task_list = [Task(**task) for task in tasks]
-        except FileNotFoundError:
-            print('Нет сохранённых задач')
 
-    def delete_task(self, task_id):
-        task = self.find_task(task_id)
-        if task:
-            self.task_list.remove(task)
-            self.save_tasks()
-            print('Задача удалена')
-        else:
-            print('Задача не найдена')
+def finance_report(manager, start_date, end_date):
+    income, expenses, categories = manager.get_aggregates().totals(parse_date(start_date), parse_date(end_date))
+    return {'income': income, 'expenses': expenses, 'balance': income + expenses, 'categories': categories}
 
-    def edit_task(self, task_id, edit_dict):
-        task = self.find_task(task_id)
-        if task:
-            for key, value in edit_dict.items():
-                if key == 'title':
-                    task.title = value
-                elif key == 'description':
-                    task.description = value
-                elif key == 'priority':
-                    task.priority = value
-                elif key == 'due_date':
-                    task.due_date = datetime.datetime.strptime(value, '%d-%m-%Y')
-            self.save_tasks()
-            print('Изменения внесены!')
-        else:
-            print('Задача не найдена')
 
-    def change_done(self, task_id):
-        task = self.find_task(task_id)
-        if task:
-            task.done = True
-        else:
-            print('Задача не найдена...')
+SERVICE_OPERATIONS = {
+    'notes.list': (NoteManager, lambda manager: record_dicts(manager.note_list)),
+    'notes.page': (NoteManager, lambda manager, sort='id', after=None, limit=20, reverse=False:
+                   record_page(manager.page_notes(sort, after, limit, reverse))),
+    'notes.get': (NoteManager, lambda manager, note_id: record_dict(manager.find_note(note_id))),
+    'notes.recent': (NoteManager, lambda manager, count=10: record_dicts(manager.recent_notes(count))),
+    'notes.between': (NoteManager, lambda manager, start=None, end=None, limit=None, reverse=False:
+                      record_dicts(manager.notes_between(start, end, limit, reverse))),
+    'notes.search': (NoteManager, lambda manager, query, limit=10: record_dicts(manager.search_notes(query, limit))),
+    'notes.add': (NoteManager, lambda manager, title, content: record_dict(manager.add_note(title, content))),
+    'notes.edit': (NoteManager, lambda manager, note_id, changes: record_dict(manager.edit_note(note_id, changes))),
+    'notes.delete': (NoteManager, lambda manager, note_id: record_dict(manager.delete_note(note_id))),
+    'tasks.list': (TaskManager, lambda manager, status=None, priority=None, due_date=None:
+                   record_dicts(manager.filter_tasks(status, priority, due_date))),
+    'tasks.get': (TaskManager, lambda manager, task_id: record_dict(manager.find_task(task_id))),
+    'tasks.add': (TaskManager, lambda manager, title, description, priority, due_date:
+                  record_dict(manager.add_task(title, description, priority, due_date))),
+    'tasks.edit': (TaskManager, lambda manager, task_id, changes: record_dict(manager.edit_task(task_id, changes))),
+    'tasks.done': (TaskManager, lambda manager, task_id: record_dict(manager.change_done(task_id))),
+    'tasks.delete': (TaskManager, lambda manager, task_id: record_dict(manager.delete_task(task_id))),
+    'tasks.upcoming': (TaskManager, lambda manager, count=10: record_dicts(manager.next_tasks(count))),
+    'tasks.page': (TaskManager, lambda manager, status=None, priority=None, due_date=None, sort='id', after=None,
+                   limit=20, reverse=False:
+                   record_page(manager.page_tasks(status, priority, due_date, sort, after, limit, reverse))),
+    'tasks.overdue': (TaskManager, lambda manager: record_dicts(manager.overdue_tasks())),
+    'tasks.yearly': (TaskManager, lambda manager: manager.yearly_summary()),
+    'tasks.between': (TaskManager, lambda manager, start_date=None, end_date=None, limit=None:
+                      record_dicts(manager.tasks_due_between(start_date, end_date, limit))),
+    'contacts.list': (ContactManager, lambda manager: record_dicts(manager.contact_list)),
+    'contacts.find': (ContactManager, lambda manager, info: record_dict(manager.find_contact(info))),
+    'contacts.search': (ContactManager, lambda manager, query, limit=5: record_dicts(manager.search_contacts(query, limit))),
+    'contacts.add': (ContactManager, lambda manager, name, phone, email: record_dict(manager.add_contact(name, phone, email))),
+    'contacts.edit': (ContactManager, lambda manager, info, changes: record_dict(manager.edit_contact(changes, info))),
+    'contacts.delete': (ContactManager, lambda manager, info: record_dict(manager.delete_contact(info))),
+    'finance.list': (FinanceManager, lambda manager, category=None, date=None:
+                     record_dicts(manager.filter_records(category, date))),
+    'finance.get': (FinanceManager, lambda manager, record_id: record_dict(manager.find_record(record_id))),
+    'finance.add': (FinanceManager, lambda manager, amount, category, date, description:
+                    record_dict(manager.add_record(float(amount), category, date, description))),
+    'finance.edit': (FinanceManager, lambda manager, record_id, changes: record_dict(manager.edit_record(record_id, changes))),
+    'finance.delete': (FinanceManager, lambda manager, record_id: record_dict(manager.delete_record(record_id))),
+    'finance.page': (FinanceManager, lambda manager, category=None, date=None, sort='id', after=None, limit=20,
+                     reverse=False:
+                     record_page(manager.page_records(category, parse_date(date), sort, after, limit, reverse))),
+    'finance.report': (FinanceManager, finance_report),
+    'finance.yearly': (FinanceManager, lambda manager: manager.yearly_totals()),
+    'finance.balance': (FinanceManager, lambda manager: manager.get_aggregates().balance()),
+    'finance.formula': (FinanceManager, lambda manager, expression, category=None: manager.evaluate_formula(expression, category)),
+    'query': (None, lambda managers, explain=False, **spec: run_query(spec, managers, explain)),
+    'calculator.calculate': (Calculator, lambda calculator, expression, bindings=None:
+                             calculator.calculate(expression, **(bindings or {}))),
+    'calculator.evaluate_many': (Calculator, lambda calculator, expression, bindings:
+                                 list(calculator.evaluate_many(expression, bindings))),
+}
 
 
-    def export_csv(self, filename):
-        tasks_dicts = [task.to_dict() for task in self.task_list]
-        with open(filename, 'w', newline='') as file:
-            dict_writer = csv.DictWriter(file, fieldnames=['task_id', 'title', 'description', 'done', 'priority', 'due_date'])
-            dict_writer.writeheader()
-            dict_writer.writerows(tasks_dicts)
-        print('Данные успешно экспортированы')
+def call_operation(name, params=None, managers=None):
+    if name not in SERVICE_OPERATIONS:
+        raise ValueError(f'Неизвестная операция: {name}')
+    manager_class, handler = SERVICE_OPERATIONS[name]
+    if manager_class is None:
+        # Операция сама выбирает нужные ей менеджеры
+        return handler(managers, **(params or {}))
+    return handler(lookup_manager(manager_class, managers), **(params or {}))
 
-    def import_csv(self, filename):
-        try:
-            with open(filename, 'r', newline='') as file:
-                dict_reader = csv.DictReader(file)
-                for task in dict_reader:
-                    self.task_list.append(Contact(**task))
-            self.save_tasks()
-            print('Данные успешно импортированы')
-        except FileNotFoundError:
-            print('Файл не найден...')
 
+def decode_request(line):
+    try:
+        request = json.loads(line)
+    except ValueError:
+        return None
+    return request if isinstance(request, dict) else None
 
 
+def invalid_request():
+    return {'id': None, 'ok': False, 'error': 'Некорректный запрос', 'messages': []}
 
 
-class Contact:
-    def __init__(self, contact_id, name, phone, email):
-        self.contact_id = contact_id
-        self.name = name
-        self.phone = phone
-        self.email = email
+def execute_request(request, managers=None):
+    response = {'id': request.get('id')}
+    output = io.StringIO()
+    try:
+        # Сообщения менеджеров возвращаются клиенту вместо вывода в консоль
+        with contextlib.redirect_stdout(output):
+            response['result'] = call_operation(request.get('op'), request.get('params'), managers)
+        response['ok'] = True
+    except Exception as e:
+        response['ok'] = False
+        response['error'] = str(e) or type(e).__name__
+    response['messages'] = output.getvalue().splitlines()
+    return response
 
-    def to_dict(self):
-        return {
-            'contact_id': self.contact_id,
-            'name': self.name,
-            'phone': self.phone,
-            'email': self.email,
-        }
 
+SYNC_COLLECTIONS = {'notes': Note, 'tasks': Task, 'contacts': Contact, 'finance': FinanceRecord}
+SYNC_BUCKETS = 1024
+DIGEST_MAGIC = b'PADIG01\n'
 
-class ContactManager:
-    def __init__(self):
-        self.contact_list = []
-        self.load_contacts()
 
-    def find_contact(self, info):
-        for contact in self.contact_list:
-            if contact.name == info or contact.phone == info:
-                return contact
-        return None
+class CollectionDigest:
+    def __init__(self, hashes):
+        self.hashes = hashes
+        self.buckets = None
 
-    def add_contact(self, name, phone, email):
-        max_id = max((contact.contact_id for contact in self.contact_list), default=0) + 1
-        new_contact = Contact(max_id, name, phone, email)
-        self.contact_list.append(new_contact)
-        self.save_contacts()
-        print('Контакт добавлен!')
+    @classmethod
+    def from_rows(cls, rows):
+        import hashlib
 
-    def save_contacts(self):
-        contacts_dicts = [contact.to_dict() for contact in self.contact_list]
-        with open('contacts.json', 'w') as file:
-            json.dump(contacts_dicts, file, indent=4)
+        # Строка уже приведена к to_row из чисел, строк и None - repr однозначен и намного быстрее json.dumps
+        return cls({
+            record_id: hashlib.blake2b(repr(row).encode('utf-8'), digest_size=8).digest()
+            for record_id, row in rows.items()
+        })
 
-    def load_contacts(self):
-        try:
-            with open('contacts.json', 'r') as file:
-                contacts = json.load(file)
-            self.contact_list = [Contact(**contact) for contact in contacts]
-        except FileNotFoundError:
-            print('Нет сохранённых контактов')
+    def bucket_hashes(self):
+        # Сводка в духе дерева Меркла: записи раскладываются по корзинам по id,
+        # хеш корзины меняется только при изменении её записей
+        if self.buckets is None:
+            import hashlib
 
-    def delete_contact(self, info):
-        contact = self.find_contact(info)
-        if contact:
-            self.contact_list.remove(contact)
-            self.save_contacts()
-            print('Контакт удален')
-        else:
-            print('Контакт не найден')
+            buckets = [[] for _ in range(SYNC_BUCKETS)]
+            for record_id in sorted(self.hashes):
+                buckets[record_id % SYNC_BUCKETS].append(struct.pack('<q', record_id) + self.hashes[record_id])
+            self.buckets = [hashlib.blake2b(b''.join(items), digest_size=16).digest() for items in buckets]
+        return self.buckets
 
-    def edit_contact(self, edit_dict, info):
-        contact = self.find_contact(info)
-        if contact:
-            for key, value in edit_dict.items():
-                if key == 'name':
-                    contact.name = value
-                elif key == 'phone':
-                    contact.phone = value
-                elif key == 'email':
-                    contact.email = value
-            self.save_contacts()
-            print('Изменения внесены!')
-        else:
-            print('Задача не найдена')
+    def root(self):
+        import hashlib
 
-    def export_csv(self, filename):
-        contacts_dicts = [contact.to_dict() for contact in self.contact_list]
-        with open(filename, 'w', newline='') as file:
-            dict_writer = csv.DictWriter(file, fieldnames=['contact_id', 'name', 'phone', 'email'])
-            dict_writer.writeheader()
-            dict_writer.writerows(contacts_dicts)
-        print('Данные успешно экспортированы')
+        return hashlib.blake2b(b''.join(self.bucket_hashes()), digest_size=16).hexdigest()
 
-    def import_csv(self, filename):
+    def changed_ids(self, other):
+        # Записи сравниваются только в корзинах, хеши которых разошлись
+        changed = {
+            bucket for bucket, (ours, theirs) in enumerate(zip(self.bucket_hashes(), other.bucket_hashes()))
+            if ours != theirs
+        }
+        if not changed:
+            return set()
+        ids = {record_id for record_id in self.hashes if record_id % SYNC_BUCKETS in changed}
+        ids.update(record_id for record_id in other.hashes if record_id % SYNC_BUCKETS in changed)
+        return {record_id for record_id in ids if self.hashes.get(record_id) != other.hashes.get(record_id)}
+
+    def save(self, filename):
+        ids = array('q', self.hashes)
+        temp_filename = filename + '.tmp'
+        with open(temp_filename, 'wb') as file:
+            file.write(DIGEST_MAGIC)
+            file.write(struct.pack('<Q', len(ids)))
+            ids.tofile(file)
+            file.write(b''.join(self.hashes.values()))
+        os.replace(temp_filename, filename)
+
+    @classmethod
+    def load(cls, filename):
         try:
-            with open(filename, 'r', newline='') as file:
-                dict_reader = csv.DictReader(file)
-                for contact in dict_reader:
-                    self.contact_list.append(Contact(**contact))
-            self.save_contacts()
-            print('Данные успешно импортированы')
+            with open(filename, 'rb') as file:
+                data = file.read()
         except FileNotFoundError:
-            print('Файл не найден...')
+            return None
+        if not data.startswith(DIGEST_MAGIC):
+            raise ValueError(f'{filename} не является файлом хешей')
+        count = struct.unpack_from('<Q', data, len(DIGEST_MAGIC))[0]
+        start = len(DIGEST_MAGIC) + 8
+        ids = array('q')
+        ids.frombytes(data[start:start + count * 8])
+        digests = data[start + count * 8:]
+        return cls({record_id: digests[position * 8:position * 8 + 8] for position, record_id in enumerate(ids)})
 
 
+def read_collection(directory, name):
+    record_class = SYNC_COLLECTIONS[name]
+    storage = open_storage(name, record_class, directory=directory, close_at_exit=False)
+    try:
+        try:
+            rows = storage.load()
+        except FileNotFoundError:
+            rows = []
+        # Строки приводятся к виду to_row, чтобы хеши не зависели от способа хранения
+        return storage, {row[0]: record_class.from_row(row).to_row() for row in rows}
+    except Exception:
+        storage.close()
+        raise
 
 
+def apply_delta(storage, rows, deleted, last_id=0):
+    with storage.locked():
+        with storage.transaction():
+            for row in rows:
+                storage.put(row)
+            for record_id in deleted:
+                storage.delete(record_id)
+            # Новые id на целевой стороне должны выдаваться после перенесённых
+            if last_id > storage.high_water():
+                storage.set_meta('last_id', last_id)
 
-class FinanceRecord:
-    def __init__(self, fin_id, amount, category, date, description):
-        self.fin_id = fin_id
-        self.amount = amount
-        self.category = category
-        self.date = date
-        self.description = description
 
-    def to_dict(self):
-        return {
-            'fin_id': self.fin_id,
-            'amount': self.amount,
-            'category': self.category,
-            'date': self.date,
-            'description': self.description,
+def sync_collection(source, target, name, base_dir, prefer=None, dry_run=False):
+    source_storage, source_rows = read_collection(source, name)
+    target_storage, target_rows = read_collection(target, name)
+    try:
+        source_digest = CollectionDigest.from_rows(source_rows)
+        target_digest = CollectionDigest.from_rows(target_rows)
+        base_filename = os.path.join(base_dir, f'{name}.digest')
+        base = CollectionDigest.load(base_filename)
+        base_hashes = base.hashes if base is not None else {}
+        put, deleted, conflicts = [], [], []
+        for record_id in sorted(source_digest.changed_ids(target_digest)):
+            ours = source_digest.hashes.get(record_id)
+            theirs = target_digest.hashes.get(record_id)
+            common = base_hashes.get(record_id)
+            if theirs == common:
+                take_source = True
+            elif ours == common:
+                # Изменение есть только на целевой стороне - оно сохраняется
+                take_source = False
+            elif prefer is not None:
+                take_source = prefer == 'source'
+            else:
+                conflicts.append(record_id)
+                continue
+            if take_source and ours is None:
+                deleted.append(record_id)
+            elif take_source:
+                put.append(source_rows[record_id])
+        if not dry_run:
+            last_id = source_storage.high_water()
+            apply_delta(target_storage, put, deleted, last_id)
+            # Базой следующей синхронизации становится состояние источника: сохранённые изменения
+            # целевой стороны так и останутся её собственными, а неразрешённые конфликты - конфликтами
+            hashes = dict(source_digest.hashes)
+            for record_id in conflicts:
+                if record_id in base_hashes:
+                    hashes[record_id] = base_hashes[record_id]
+                else:
+                    hashes.pop(record_id, None)
+            os.makedirs(base_dir, exist_ok=True)
+            CollectionDigest(hashes).save(base_filename)
+        return {'updated': len(put), 'deleted': len(deleted), 'conflicts': conflicts, 'root': source_digest.root()}
+    finally:
+        source_storage.close()
+        target_storage.close()
+
+
+def sync_stores(source, target, base_dir=None, prefer=None, dry_run=False, names=None):
+    base_dir = base_dir or os.path.join(target, '.sync')
+    os.makedirs(target, exist_ok=True)
+    return {
+        name: sync_collection(source, target, name, base_dir, prefer, dry_run)
+        for name in (names or SYNC_COLLECTIONS)
+    }
+
+
+def backup_store(directory, backup_dir):
+    os.makedirs(os.path.join(backup_dir, 'manifest'), exist_ok=True)
+    backup = {'created': datetime.datetime.now().isoformat(timespec='seconds'), 'collections': {}}
+    digests = {}
+    for name, record_class in SYNC_COLLECTIONS.items():
+        storage, rows = read_collection(directory, name)
+        try:
+            # Метаданные снимка отстают от счётчика, пока хранилище не сжато
+            last_id = storage.high_water()
+        finally:
+            storage.close()
+        digest = digests[name] = CollectionDigest.from_rows(rows)
+        # Без предыдущего манифеста копия получается полной
+        previous = CollectionDigest.load(os.path.join(backup_dir, 'manifest', f'{name}.digest')) or CollectionDigest({})
+        changed = digest.changed_ids(previous)
+        backup['collections'][name] = {
+            'fields': [field for field, convert in record_class.schema],
+            'meta': {'last_id': last_id},
+            'rows': [rows[record_id] for record_id in sorted(changed) if record_id in rows],
+            'deleted': sorted(record_id for record_id in changed if record_id not in rows),
         }
+    filename = os.path.join(backup_dir, datetime.datetime.now().strftime('%Y%m%d-%H%M%S-%f') + '.pabak')
+    with open(filename, 'w', encoding='utf-8') as file:
+        file.write(json.dumps(backup, ensure_ascii=False, separators=(',', ':')))
+    # Манифесты обновляются только после того, как копия записана целиком
+    for name, digest in digests.items():
+        digest.save(os.path.join(backup_dir, 'manifest', f'{name}.digest'))
+    return filename, backup['collections']
 
 
-class FinanceManager:
-    def __init__(self):
-        self.record_list = []
-        self.load_records()
+def backup_files(backup_dir, until=None):
+    names = sorted(name for name in os.listdir(backup_dir) if name.endswith('.pabak'))
+    if until is not None:
+        names = [name for name in names if name[:len(until)] <= until]
+    return [os.path.join(backup_dir, name) for name in names]
 
-    def find_record(self, record_id):
-        for record in self.record_list:
-            if record.record_id == record_id:
-                return record
-        return None
 
-    def add_record(self, amount, category, date, description):
-        date = datetime.datetime.strptime(date, '%d-%m-%Y')
-        max_id = max((record.record_id for record in self.record_list), default=0) + 1
-        new_record = FinanceRecord(max_id, amount, category, date, description)
-        self.record_list.append(new_record)
-        self.save_records()
-        print('Запись добавлена!')
+def restore_backup(backup_dir, target, until=None):
+    collections = {name: ({}, 0) for name in SYNC_COLLECTIONS}
+    # Полная копия и все последующие приращения накладываются по порядку
+    for filename in backup_files(backup_dir, until):
+        with open(filename, 'r', encoding='utf-8') as file:
+            backup = json.load(file)
+        for name, data in backup['collections'].items():
+            rows, last_id = collections[name]
+            for record_id in data['deleted']:
+                rows.pop(record_id, None)
+            rows.update((row[0], row) for row in data['rows'])
+            collections[name] = rows, max(last_id, data['meta'].get('last_id', 0))
+    os.makedirs(target or '.', exist_ok=True)
+    for name, (rows, last_id) in collections.items():
+        storage = open_storage(name, SYNC_COLLECTIONS[name], directory=target, close_at_exit=False)
+        try:
+            try:
+                existing = storage.load()
+            except FileNotFoundError:
+                existing = []
+            with storage.locked():
+                # Записи, которых нет в копии, удаляются явно: SQLite при сжатии таблицу не очищает
+                for row in existing:
+                    if row[0] not in rows:
+                        storage.delete(row[0])
+                storage.meta['last_id'] = max(last_id, storage.high_water())
+                storage.compact(list(rows.values()))
+        finally:
+            storage.close()
+    return {name: len(rows) for name, (rows, last_id) in collections.items()}
 
-    def list_records(self, category=None, date=None):
-        filtered_records = self.record_list
-        if category is not None:
-            filtered_records = [record for record in filtered_records if record.category == category]
-        if date is not None:
-            filtered_records = [record for record in filtered_records if record.date <= date]
-        for record in filtered_records:
-            print(record)
 
-    def generate_report(self, start_date, end_date):
-        filtered_records = [record for record in self.record_list if start_date <= record.date <= end_date]
-        total_income = sum(record.amount for record in filtered_records if record.amount > 0)
-        total_expenses = sum(record.amount for record in filtered_records if record.amount < 0)
-        balance = total_income + total_expenses
+def print_sync_report(report):
+    for name, result in report.items():
+        print(
+            f'{name}: обновлено {result["updated"]}, удалено {result["deleted"]}, '
+            f'конфликтов {len(result["conflicts"])}'
+        )
+        if result['conflicts']:
+            print(f'  Конфликтующие записи: {result["conflicts"]}')
 
-        print(f'Отчёт за период с {start_date} по {end_date}:')
-        print(f'Общий доход: {total_income}')
-        print(f'Общий расход: {total_expenses}')
-        print(f'Баланс: {balance}')
 
-        category_summary = {}
-        for record in filtered_records:
-            if record.category not in category_summary:
-                category_summary[record.category] = 0
-            category_summary[record.category] += record.amount
+def sync_command(argv):
+    parser = argparse.ArgumentParser(prog='personal_assistant.py sync')
+    parser.add_argument('source', help='каталог хранилища-источника')
+    parser.add_argument('target', help='каталог хранилища, в которое переносятся изменения')
+    parser.add_argument('--base', help='каталог с хешами прошлой синхронизации (по умолчанию TARGET/.sync)')
+    parser.add_argument('--prefer', choices=('source', 'target'), help='как разрешать конфликты')
+    parser.add_argument('--dry-run', action='store_true', help='только показать разницу')
+    args = parser.parse_args(argv)
+    report = sync_stores(args.source, args.target, args.base, args.prefer, args.dry_run)
+    print_sync_report(report)
+    return 1 if any(result['conflicts'] for result in report.values()) else 0
 
-        print('Сводка по категориям:')
-        for category, amount in category_summary.items():
-            print(f'{category}: {amount}')
 
-    def save_records(self):
-        records_dicts = [record.to_dict() for record in self.record_list]
-        with open('finance.json', 'w') as file:
-            json.dump(records_dicts, file, indent=4)
+def backup_command(argv):
+    parser = argparse.ArgumentParser(prog='personal_assistant.py backup')
+    parser.add_argument('store', help='каталог хранилища')
+    parser.add_argument('backup_dir', help='каталог резервных копий')
+    args = parser.parse_args(argv)
+    filename, collections = backup_store(args.store, args.backup_dir)
+    changed = sum(len(data['rows']) + len(data['deleted']) for data in collections.values())
+    print(f'Резервная копия {filename}: изменённых записей {changed}')
+    return 0
 
-    def load_records(self):
-        try:
-            with open('finance.json', 'r') as file:
-                records = json.load(file)
-            self.record_list = [FinanceRecord(**record) for record in records]
-        except FileNotFoundError:
-            print('Нет сохранённых записей')
 
-    def export_csv(self, filename):
-        records_dicts = [record.to_dict() for record in self.record_list]
-        with open(filename, 'w', newline='') as file:
-            dict_writer = csv.DictWriter(file, fieldnames=['record_id', 'amount', 'category', 'date', 'description'])
-            dict_writer.writeheader()
-            dict_writer.writerows(records_dicts)
-        print('Данные успешно экспортированы')
+def restore_command(argv):
+    parser = argparse.ArgumentParser(prog='personal_assistant.py restore')
+    parser.add_argument('backup_dir', help='каталог резервных копий')
+    parser.add_argument('target', help='каталог, в который восстанавливаются данные')
+    parser.add_argument('--until', help='восстановить состояние на момент копии (ГГГГММДД-ЧЧММСС)')
+    args = parser.parse_args(argv)
+    counts = restore_backup(args.backup_dir, args.target, args.until)
+    for name, count in counts.items():
+        print(f'{name}: восстановлено записей {count}')
+    return 0
+
+
+class StorageWriter(threading.Thread):
+    def __init__(self, storages, interval=0.05):
+        super().__init__(daemon=True)
+        self.storages = storages
+        self.interval = interval
+        self.wakeup = threading.Event()
+        self.stopped = False
+
+    def wake(self):
+        self.wakeup.set()
 
-    def import_csv(self, filename):
+    def run(self):
+        # Записи, пришедшие во время fsync, сбрасываются следующим проходом одним fsync
+        while not self.stopped:
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+            for storage in self.storages:
+                storage.flush()
+
+    def stop(self):
+        self.stopped = True
+        self.wake()
+        self.join()
+        for storage in self.storages:
+            storage.flush()
+
+
+class AssistantServer:
+    def __init__(self, host='127.0.0.1', port=8765, path=None, flush_interval=0.05):
+        self.host = host
+        self.port = port
+        self.path = path
+        # Все хранилища загружаются один раз и обслуживают всех клиентов
+        managers = [get_manager(manager_class) for manager_class in (NoteManager, TaskManager, ContactManager, FinanceManager)]
+        storages = [manager.storage for manager in managers]
+        for storage in storages:
+            storage.defer_sync()
+        self.writer = StorageWriter(storages, flush_interval)
+
+    async def handle(self, reader, writer):
         try:
-            with open(filename, 'r', newline='') as file:
-                dict_reader = csv.DictReader(file)
-                for row in dict_reader:
-                    self.record_list.append(FinanceRecord(**row))
-            self.save_records()
-            print('Данные успешно импортированы')
-        except FileNotFoundError:
-            print('Файл не найден...')
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                request = decode_request(line)
+                if request is None:
+                    response = invalid_request()
+                else:
+                    response = execute_request(request)
+                    self.writer.wake()
+                writer.write(json.dumps(response, ensure_ascii=False, default=str).encode('utf-8') + b'\n')
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
 
-    def calculate_balance(self):
-        total_income = sum(record.amount for record in self.record_list if record.amount > 0)
-        total_expenses = sum(record.amount for record in self.record_list if record.amount < 0)
-        balance = total_income + total_expenses
-        print(f'Общий баланс: {balance}')
+    async def serve(self):
+        import asyncio
 
+        if self.path:
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(self.path)
+            server = await asyncio.start_unix_server(self.handle, path=self.path)
+        else:
+            server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.writer.start()
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.writer.stop()
 
 
+def serve(argv):
+    parser = argparse.ArgumentParser(prog='personal_assistant.py serve')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--socket', help='путь к Unix-сокету вместо TCP')
+    parser.add_argument('--flush-interval', type=float, default=0.05)
+    parser.add_argument('--preload', action='store_true', help='загрузить все хранилища при запуске')
+    args = parser.parse_args(argv)
+    if args.preload or PARALLEL_LOADING:
+        load_managers()
+    # asyncio нужен только серверу и не должен замедлять запуск меню и пакетного режима
+    import asyncio
 
+    server = AssistantServer(args.host, args.port, args.socket, args.flush_interval)
+    print(f'Сервер запущен: {args.socket or f"{args.host}:{args.port}"}')
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        print('Сервер остановлен')
 
-class Calculator:
-    def add(self, a, b):
-        return a + b
 
-    def subtract(self, a, b):
-        return a - b
+def request_managers(request):
+    operation = SERVICE_OPERATIONS.get(request.get('op')) if request is not None else None
+    if operation is None:
+        return []
+    if operation[0] is not None:
+        return [operation[0]]
+    # Запрос обращается к источнику и присоединённым источникам
+    params = request.get('params') if isinstance(request.get('params'), dict) else {}
+    joins = params.get('join') if isinstance(params.get('join'), list) else []
+    sources = [params.get('from')] + [join.get('source') for join in joins if isinstance(join, dict)]
+    return [QUERY_SOURCES[source][0] for source in sources if isinstance(source, str) and source in QUERY_SOURCES]
 
-    def multiply(self, a, b):
-        return a * b
 
-    def divide(self, a, b):
-        if b == 0:
-            return "Деление на ноль недопустимо"
-        return a / b
+def run_batch(lines, output, batch_size=10000):
+    lines = iter(lines)
+    total = failed = 0
+    while True:
+        chunk = list(itertools.islice(lines, batch_size))
+        if not chunk:
+            break
+        requests = [decode_request(line) for line in chunk if line.strip()]
+        # Загружаются только хранилища, к которым обращается пачка
+        managers = {}
+        with contextlib.redirect_stdout(sys.stderr):
+            for request in requests:
+                for manager_class in request_managers(request):
+                    if manager_class not in managers:
+                        managers[manager_class] = get_manager(manager_class)
+        journals = [
+            manager.storage for manager in managers.values() if hasattr(getattr(manager, 'storage', None), 'pending')
+        ]
+        responses = []
+        # Для каждой команды - записи журналов, которые она изменила: (файл, id)
+        changed = []
+        conflicts = []
+        # Вся пачка записывается одним коммитом на хранилище
+        with transaction(conflicts):
+            for request in requests:
+                starts = [len(storage.pending) for storage in journals]
+                responses.append(invalid_request() if request is None else execute_request(request, managers))
+                changed.append({
+                    (storage.filename, storage.pending_id(entry))
+                    for storage, start in zip(journals, starts) for entry in storage.pending[start:]
+                })
+        # При конфликте другой процесс успел изменить те же записи: его версия остаётся,
+        # а команды, чьи изменения не записаны, возвращаются с ошибкой
+        lost = {(e.filename, record_id): e for e in conflicts for record_id in e.record_ids}
+        for response, keys in zip(responses, changed):
+            error = next((lost[key] for key in keys if key in lost), None)
+            if error is not None and response['ok']:
+                response.pop('result', None)
+                response['ok'] = False
+                response['error'] = str(error)
+        for response in responses:
+            output.write(json.dumps(response, ensure_ascii=False, default=str) + '\n')
+            failed += not response['ok']
+        output.flush()
+        total += len(responses)
+    return total, failed
 
-    def calculate(self, expression):
-        try:
-            expression = expression.replace(" ", "")
-
-            if '+' in expression:
-                a, b = expression.split('+')
-                return self.add(float(a), float(b))
-            elif '-' in expression:
-                a, b = expression.split('-')
-                return self.subtract(float(a), float(b))
-            elif '*' in expression:
-                a, b = expression.split('*')
-                return self.multiply(float(a), float(b))
-            elif '/' in expression:
-                a, b = expression.split('/')
-                return self.divide(float(a), float(b))
-            else:
-                return "Неверное выражение"
-        except ValueError as e:
-            return str(e)
-        except Exception as e:
-            return f"Ошибка: {e}"
+
+def batch(argv):
+    parser = argparse.ArgumentParser(prog='personal_assistant.py batch')
+    parser.add_argument('input', nargs='?', default='-', help='файл команд в формате JSON lines, - для stdin')
+    parser.add_argument('--output', default='-', help='файл результатов, - для stdout')
+    parser.add_argument('--batch-size', type=int, default=10000, help='число команд в одной транзакции')
+    args = parser.parse_args(argv)
+    with contextlib.ExitStack() as stack:
+        source = sys.stdin if args.input == '-' else stack.enter_context(open(args.input, 'r', encoding='utf-8'))
+        output = sys.stdout if args.output == '-' else stack.enter_context(open(args.output, 'w', encoding='utf-8'))
+        total, failed = run_batch(source, output, args.batch_size)
+    print(f'Выполнено команд: {total}, с ошибками: {failed}', file=sys.stderr)
+    return 1 if failed else 0
 
 
+def page_through(fetch, show):
+    # fetch(курсор) возвращает страницу и курсор следующей; None - страниц больше нет
+    cursor = None
+    shown = 0
+    while True:
+        records, cursor = fetch(cursor)
+        for record in records:
+            show(record)
+        shown += len(records)
+        if cursor is None:
+            break
+        try:
+            answer = input('Enter - следующая страница, q - выход: ')
+        except EOFError:
+            break
+        if answer.strip().lower() == 'q':
+            break
+    if not shown:
+        print('Ничего не найдено')
 
 
 def main_menu():
@@ -508,8 +5020,8 @@ def main_menu():
 
 
 def manage_notes():
-    note_manager = NoteManager()
     while True:
+        note_manager = get_manager(NoteManager)
         print("\nУправление заметками:")
         print("1. Создать новую заметку")
         print("2. Просмотреть список заметок")
@@ -518,7 +5030,10 @@ def manage_notes():
         print("5. Удалить заметку")
         print("6. Импортировать из CSV")
         print("7. Экспортировать в CSV")
-        print("8. Вернуться в главное меню")
+        print("8. Найти заметки")
+        print("9. Последние изменённые заметки")
+        print("10. Заметки за период")
+        print("11. Вернуться в главное меню")
         choice = input("Введите номер действия: ")
         if choice == '1':
             title = input("Введите заголовок новой заметки: ")
@@ -549,13 +5064,36 @@ def manage_notes():
             filename = input('Введите имя файла, из которого хотите импортировать: ')
             note_manager.import_csv(filename)
         elif choice == '8':
+            query = input('Введите слова для поиска (слово* - поиск по началу слова): ')
+            notes = note_manager.search_notes(query)
+            if notes:
+                for note in notes:
+                    note_manager.view_note(note.note_id)
+            else:
+                print('Ничего не найдено...')
+        elif choice == '9':
+            count = input('Сколько заметок показать (Enter - 10): ')
+            notes = note_manager.recent_notes(int(count) if count else 10)
+            for note in notes:
+                note_manager.print_note(note)
+            if not notes:
+                print('Список заметок пуст...')
+        elif choice == '10':
+            start = input('Начало периода (ДД-ММ-ГГГГ [ЧЧ:ММ:СС], Enter - без ограничения): ')
+            end = input('Конец периода (ДД-ММ-ГГГГ [ЧЧ:ММ:СС], Enter - без ограничения): ')
+            notes = note_manager.notes_between(start or None, end or None)
+            for note in notes:
+                note_manager.print_note(note)
+            if not notes:
+                print('Ничего не найдено...')
+        elif choice == '11':
             break
         else:
             print("Неверный выбор. Попробуйте снова...")
 
 def manage_tasks():
-    task_manager = TaskManager()
     while True:
+        task_manager = get_manager(TaskManager)
         print("\nУправление задачами:")
         print("1. Добавить новую задачу")
         print("2. Просмотреть задачи")
@@ -564,7 +5102,9 @@ def manage_tasks():
         print("5. Удалить задачу")
         print("6. Импортировать из CSV")
         print("7. Экспортировать в CSV")
-        print("8. Вернуться в главное меню")
+        print("8. Ближайшие и просроченные задачи")
+        print("9. Сводка по годам")
+        print("10. Вернуться в главное меню")
         choice = input("Введите номер действия: ")
         if choice == '1':
             title = input("Введите название новой задачи: ")
@@ -617,13 +5157,17 @@ def manage_tasks():
             filename = input('Введите имя файла, з которого хотите импортировать: ')
             task_manager.import_csv(filename)
         elif choice == '8':
+            task_manager.show_agenda()
+        elif choice == '9':
+            task_manager.show_yearly_summary()
+        elif choice == '10':
             break
         else:
             print("Неверный выбор. Попробуйте снова...")
 
 def manage_contacts():
-    contact_manager = ContactManager()
     while True:
+        contact_manager = get_manager(ContactManager)
         print("\nУправление контактами:")
         print("1. Добавить новый контакт")
         print("2. Найти контакт")
@@ -639,8 +5183,13 @@ def manage_contacts():
             email = input("Введите email контакта: ")
             contact_manager.add_contact(name, phone, email)
         elif choice == '2':
-            info = input('Введите имя или номер телефона контакта: ')
-            contact_manager.find_contact(info)
+            info = input('Введите имя, email или номер телефона контакта: ')
+            contacts = contact_manager.search_contacts(info)
+            if contacts:
+                for contact in contacts:
+                    contact_manager.view_contact(contact.contact_id)
+            else:
+                print('Контакт не найден')
         elif choice == '3':
             info = input('Введите имя или номер телефона контакта: ')
             new_name = input('Введите новое имя контакта: (если не хотите ничего менять, нажмите Enter): ')
@@ -669,15 +5218,16 @@ def manage_contacts():
             print("Неверный выбор. Попробуйте снова...")
 
 def manage_finance():
-    finance_manager = FinanceManager()
     while True:
+        finance_manager = get_manager(FinanceManager)
         print("\nУправление финансовыми записями:")
         print("1. Добавить новую запись")
         print("2. Просмотреть записи")
         print("3. Сгенерировать отчёт")
         print("4. Импортировать из CSV")
         print("5. Экспортировать в CSV")
-        print("6. Вернуться в главное меню")
+        print("6. Сравнение по годам")
+        print("7. Вернуться в главное меню")
         choice = input("Введите номер действия: ")
         if choice == '1':
             amount = float(input("Введите сумму (положительное число для доходов, отрицательное для расходов): "))
@@ -687,9 +5237,9 @@ def manage_finance():
             finance_manager.add_record(amount, category, date, description)
         elif choice == '2':
             dt = input('Введите дату, до которой хотите посмотреть список операций (ДД-ММ-ГГГГ) (или Enter - если все операции): ')
-            date = datetime.datetime.strptime(dt, '%d-%m-%Y')
+            date = parse_date(dt) if dt else None
             ctg = input('Введите категорию, в которой хотите посмотреть список операций (или Enter - если все операции): ')
-            finance_manager.list_records(ctg, date)
+            finance_manager.list_records(ctg or None, date)
         elif choice == '3':
             st_date = input('Введите начальную дату (ДД-ММ-ГГГГ): ')
             end_date = input('Введите конечную дату (ДД-ММ-ГГГГ): ')
@@ -701,6 +5251,8 @@ def manage_finance():
             filename = input('Введите имя файла, з которого хотите импортировать: ')
             finance_manager.import_csv(filename)
         elif choice == '6':
+            finance_manager.year_over_year_report()
+        elif choice == '7':
             break
         else:
             print("Неверный выбор. Попробуйте снова...")
@@ -722,24 +5274,43 @@ def calculator():
             print("Неверный выбор. Попробуйте снова...")
 
 def main():
+    if PARALLEL_LOADING:
+        load_managers()
     while True:
         choice = main_menu()
-        if choice == '1':
-            manage_notes()
-        elif choice == '2':
-            manage_tasks()
-        elif choice == '3':
-            manage_contacts()
-        elif choice == '4':
-            manage_finance()
-        elif choice == '5':
-            calculator()
-        elif choice == '6':
-            print("Выход... Всего хорошего!)")
-            break
-        else:
-            print("Неверный выбор. Попробуйте снова...")
+        try:
+            if choice == '1':
+                manage_notes()
+            elif choice == '2':
+                manage_tasks()
+            elif choice == '3':
+                manage_contacts()
+            elif choice == '4':
+                manage_finance()
+            elif choice == '5':
+                calculator()
+            elif choice == '6':
+                print("Выход... Всего хорошего!)")
+                break
+            else:
+                print("Неверный выбор. Попробуйте снова...")
+        except ConflictError as e:
+            print(f'{e}. Данные обновлены, повторите действие')
+        except ValueError as e:
+            print(f'Ошибка: {e}')
+
+
+COMMANDS = {
+    'serve': serve,
+    'batch': batch,
+    'sync': sync_command,
+    'backup': backup_command,
+    'restore': restore_command,
+}
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if sys.argv[1:2] and sys.argv[1] in COMMANDS:
+        sys.exit(COMMANDS[sys.argv[1]](sys.argv[2:]))
+    else:
+        main()
\ No newline at end of file
@@ -0,0 +1,33 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'personal_assistant'))
+
+import personal_assistant as pa  # noqa: E402
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Хранилища открываются относительно текущего каталога
+    monkeypatch.chdir(tmp_path)
+    pa._managers.clear()
+    opened = []
+    original = pa.open_storage
+
+    def open_storage(*args, **kwargs):
+        storage = original(*args, **kwargs)
+        opened.append(storage)
+        return storage
+    monkeypatch.setattr(pa, 'open_storage', open_storage)
+    yield tmp_path
+    for storage in reversed(opened):
+        storage.close()
+    pa._managers.clear()
+
+
+@pytest.fixture(params=['json', 'sqlite'])
+def backend(request, monkeypatch, workdir):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', request.param)
+    return request.param
@@ -0,0 +1,89 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import personal_assistant as pa
+
+
+def run(requests, batch_size=10000):
+    lines = [json.dumps(request, ensure_ascii=False) if isinstance(request, dict) else request for request in requests]
+    output = io.StringIO()
+    total, failed = pa.run_batch(lines, output, batch_size)
+    return total, failed, [json.loads(line) for line in output.getvalue().splitlines()]
+
+
+def test_batch_runs_in_one_commit(backend, workdir):
+    requests = [{'id': i, 'op': 'notes.add', 'params': {'title': f'note {i}', 'content': ''}} for i in range(50)]
+    requests += [
+        {'id': 'edit', 'op': 'notes.edit', 'params': {'note_id': 3, 'changes': {'title': 'edited'}}},
+        {'id': 'sum', 'op': 'calculator.calculate', 'params': {'expression': '2 + 2'}},
+        'not json',
+        {'id': 'unknown', 'op': 'notes.fly'},
+    ]
+    total, failed, responses = run(requests)
+    assert total == len(responses) == len(requests) and failed == 2
+    assert [response['result']['note_id'] for response in responses[:50]] == list(range(1, 51))
+    assert responses[50]['result']['title'] == 'edited' and responses[51]['result'] == 4
+    assert not responses[52]['ok'] and not responses[53]['ok']
+    if backend == 'json':
+        journal = (workdir / 'notes.json.log').read_text(encoding='utf-8').splitlines()
+        assert len(journal) == 1
+    # Калькулятору и заметкам хранилища задач и финансов не нужны
+    assert set(pa._managers) == {pa.NoteManager, pa.Calculator}
+
+
+def test_missing_records_are_errors(backend, workdir):
+    total, failed, responses = run([
+        {'id': 'get', 'op': 'notes.get', 'params': {'note_id': 7}},
+        {'id': 'edit', 'op': 'tasks.edit', 'params': {'task_id': 7, 'changes': {'title': 'x'}}},
+        {'id': 'delete', 'op': 'finance.delete', 'params': {'record_id': 7}},
+        {'id': 'contact', 'op': 'contacts.find', 'params': {'info': 'nobody'}},
+    ])
+    assert total == 4 and failed == 4
+    for response in responses:
+        assert response['ok'] is False and response['error'] == 'Запись не найдена' and 'result' not in response
+
+
+def test_conflict_fails_only_the_lost_commands(workdir, monkeypatch):
+    tasks = pa.get_manager(pa.TaskManager)
+    tasks.add_task('first', '', 'Средний', None)
+    tasks.add_task('second', '', 'Средний', None)
+    other = pa.TaskManager()
+    original = pa.execute_request
+
+    def execute_request(request, managers=None):
+        response = original(request, managers)
+        if request['id'] == 'edit':
+            # Другой процесс успевает изменить ту же задачу до записи пачки
+            other.edit_task(1, {'title': 'theirs'})
+        return response
+    monkeypatch.setattr(pa, 'execute_request', execute_request)
+
+    total, failed, responses = run([
+        {'id': 'edit', 'op': 'tasks.edit', 'params': {'task_id': 1, 'changes': {'title': 'ours'}}},
+        {'id': 'other', 'op': 'tasks.edit', 'params': {'task_id': 2, 'changes': {'title': 'kept'}}},
+        {'id': 'add', 'op': 'tasks.add', 'params': {'title': 'new', 'description': '', 'priority': 'Низкий',
+                                                   'due_date': None}},
+    ])
+    # Строк в ответе столько же, сколько команд
+    assert total == len(responses) == 3 and failed == 1
+    assert responses[0]['ok'] is False and 'изменены другим процессом' in responses[0]['error']
+    assert responses[1]['ok'] and responses[2]['ok']
+    assert tasks.find_task(1).title == 'theirs'
+    other.storage.refresh()
+    assert other.find_task(2).title == 'kept' and other.find_task(3).title == 'new'
+
+
+def test_batch_startup_skips_unused_modules(workdir):
+    script = (
+        'import sys; sys.path.insert(0, sys.argv[1]); import personal_assistant as pa, io; '
+        'pa.run_batch([\'{"op": "calculator.calculate", "params": {"expression": "1"}}\'], io.StringIO()); '
+        'print(",".join(name for name in ("sqlite3", "mmap", "hashlib", "concurrent.futures", "csv", "asyncio") '
+        'if name in sys.modules))'
+    )
+    module_dir = os.path.dirname(pa.__file__)
+    result = subprocess.run([sys.executable, '-c', script, module_dir], cwd=workdir, capture_output=True, text=True,
+                            check=True)
+    assert result.stdout.strip() == ''
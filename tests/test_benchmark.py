@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+import benchmark
+
+
+@pytest.fixture
+def environment(monkeypatch):
+    # main() выставляет настройки хранилища через переменные окружения
+    for name in ('PA_STORAGE', 'PA_LAZY', 'PA_FORMAT'):
+        monkeypatch.setenv(name, '')
+
+
+def test_parse_sizes():
+    assert benchmark.parse_sizes('1k, 2.5k,10m,300') == [1000, 2500, 10000000, 300]
+
+
+def test_run_writes_every_phase(workdir, environment):
+    argv = ['--sizes', '200', '--ops', '20', '--workdir', str(workdir), '--output', 'first.json']
+    assert benchmark.main(argv) == 0
+    report = json.loads((workdir / 'first.json').read_text(encoding='utf-8'))
+    assert report['meta']['ops'] == 20 and report['meta']['max_rss_kb'] > 0
+    phases = {(item['manager'], item['operation']) for item in report['results']}
+    for kind in benchmark.MANAGERS:
+        for name in ('load', 'add', 'find', 'edit', 'filter', 'delete', 'save', 'export_csv', 'import_csv'):
+            assert (kind, name) in phases
+    assert ('tasks', 'report') in phases and ('finance', 'report') in phases
+    for item in report['results']:
+        assert item['size'] == 200 and item['per_op_us'] > 0
+        if item['operation'] in ('add', 'find', 'edit', 'filter', 'delete'):
+            assert item['count'] == 20 and item['p50_us'] <= item['p99_us']
+    # Сгенерированные хранилища удаляются после прогона
+    assert sorted(path.name for path in workdir.iterdir()) == ['first.json']
+
+
+def test_baseline_reports_regressions(workdir, environment):
+    argv = ['--sizes', '100', '--ops', '10', '--managers', 'notes', '--workdir', str(workdir)]
+    assert benchmark.main(argv + ['--output', 'first.json']) == 0
+    report = json.loads((workdir / 'first.json').read_text(encoding='utf-8'))
+    for item in report['results']:
+        item['per_op_us'] /= 1000
+    (workdir / 'fast.json').write_text(json.dumps(report), encoding='utf-8')
+    assert benchmark.main(argv + ['--output', 'second.json', '--baseline', 'fast.json']) == 1
+    assert benchmark.main(argv + ['--output', 'third.json', '--baseline', 'first.json', '--tolerance', '1000']) == 0
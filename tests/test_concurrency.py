@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+import personal_assistant as pa
+
+WRITER_SCRIPT = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+import personal_assistant as pa
+manager = pa.NoteManager()
+for i in range(int(sys.argv[2])):
+    manager.add_note(f'note {i}', 'text')
+manager.storage.close()
+'''
+
+
+def test_concurrent_edit_raises_conflict(workdir):
+    first = pa.TaskManager()
+    first.add_task('task', 'desc', 'Высокий', '01-01-2030')
+    second = pa.TaskManager()
+    first.edit_task(1, {'title': 'A'})
+    with pytest.raises(pa.ConflictError):
+        second.edit_task(1, {'title': 'B'})
+    # Побеждает первая запись, и она видна второму менеджеру
+    assert second.find_task(1).title == 'A'
+
+
+def test_refresh_sees_other_writer(workdir):
+    first = pa.NoteManager()
+    second = pa.NoteManager()
+    first.add_note('from first', 'text')
+    second.storage.refresh()
+    assert [note.title for note in second.note_list] == ['from first']
+
+
+def test_refresh_sees_other_process(backend, workdir):
+    manager = pa.NoteManager()
+    manager.add_note('own', 'text')
+    module_dir = os.path.dirname(pa.__file__)
+    env = dict(os.environ, PA_STORAGE=backend)
+    subprocess.run([sys.executable, '-c', WRITER_SCRIPT, module_dir, '2'], cwd=workdir, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    manager.storage.refresh()
+    assert sorted(note.note_id for note in manager.note_list) == [1, 2, 3]
+    assert manager.add_note('after', 'text').note_id == 4
+
+
+def test_concurrent_processes_get_distinct_ids(backend, workdir):
+    module_dir = os.path.dirname(pa.__file__)
+    env = dict(os.environ, PA_STORAGE=backend)
+    processes = [
+        subprocess.Popen([sys.executable, '-c', WRITER_SCRIPT, module_dir, '100'], cwd=workdir, env=env,
+                         stdout=subprocess.DEVNULL)
+        for _ in range(3)
+    ]
+    for process in processes:
+        assert process.wait(timeout=120) == 0
+
+    manager = pa.NoteManager()
+    ids = [note.note_id for note in manager.note_list]
+    assert len(ids) == 300
+    assert sorted(ids) == list(range(1, 301))
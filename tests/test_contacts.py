@@ -0,0 +1,81 @@
+import itertools
+import statistics
+import time
+
+import personal_assistant as pa
+
+FIRST_NAMES = ['Александр', 'Иван', 'Пётр', 'Мария', 'Анна', 'Елена', 'Дмитрий', 'Сергей', 'Ольга', 'Наталья']
+SURNAME_ROOTS = ['Петр', 'Сидор', 'Кузнец', 'Смирн', 'Попов', 'Волк', 'Сокол', 'Лебед', 'Козл', 'Новик',
+                 'Мороз', 'Павл', 'Голуб', 'Виноград', 'Богдан', 'Ворон', 'Фёдор', 'Медвед', 'Зайц', 'Орл']
+SURNAME_ENDINGS = ['ов', 'ова', 'ев', 'ева', 'ин', 'ина', 'ский', 'енко', 'ук', 'ич']
+
+
+def names(manager, query):
+    return [contact.name for contact in manager.search_contacts(query)]
+
+
+def test_typos_prefixes_and_phones(backend, workdir):
+    manager = pa.ContactManager()
+    manager.add_contact('Александр Петров', '+7 900 123-45-67', 'petrov@mail.ru')
+    manager.add_contact('Иван', '8 (901) 000-00-00', 'ivan@ya.ru')
+    manager.add_contact('Иванна Сидорова', '+44 20 7946 0958', 'sidorova@gmail.com')
+
+    assert names(manager, 'Пеьров') == ['Александр Петров']
+    assert names(manager, 'Иаан')[0] == 'Иван'
+    assert names(manager, 'Алекс') == ['Александр Петров']
+    assert names(manager, 'Александр П') == ['Александр Петров']
+    assert names(manager, 'Петров Александр') == ['Александр Петров']
+    assert names(manager, 'sidorova') == ['Иванна Сидорова']
+    assert names(manager, 'Иван') == ['Иван', 'Иванна Сидорова']
+    assert names(manager, 'Игорь') == []
+
+    for query in ['900', '900 123', '+7 900', '8900', '7 (900) 123-45-67']:
+        assert names(manager, query) == ['Александр Петров']
+    assert names(manager, '901') == ['Иван']
+    assert names(manager, '44 20') == ['Иванна Сидорова']
+
+
+def test_lookup_follows_changes(backend, workdir):
+    manager = pa.ContactManager()
+    manager.add_contact('Александр Петров', '+7 900 123-45-67', 'petrov@mail.ru')
+    manager.add_contact('Иван Иванов', '+7 901 000-00-00', 'ivanov@ya.ru')
+    assert names(manager, 'Петров') == ['Александр Петров']
+
+    manager.edit_contact({'name': 'Александр Смирнов', 'phone': '+7 902 555-44-33'}, 'Александр Петров')
+    assert names(manager, 'Петров') == []
+    assert names(manager, 'Смирнов') == ['Александр Смирнов']
+    assert names(manager, '900') == []
+    assert names(manager, '902') == ['Александр Смирнов']
+
+    manager.delete_contact('Иван Иванов')
+    assert names(manager, 'Иванов') == []
+    assert names(manager, '901') == []
+    # Опустевшая ветка номера удаляется из дерева
+    assert list(manager.get_lookup().phone_trie['9']['0']) == ['2']
+
+    (workdir / 'contacts.csv').write_text(
+        'contact_id,name,phone,email\n10,Мария Кузнецова,+7 903 111-22-33,maria@mail.ru\n', encoding='utf-8'
+    )
+    manager.import_csv('contacts.csv')
+    assert names(manager, 'Кузнецва') == ['Мария Кузнецова']
+    assert names(manager, '903') == ['Мария Кузнецова']
+
+
+def test_autocomplete_latency_on_large_book():
+    lookup = pa.ContactLookup()
+    contacts = itertools.product(FIRST_NAMES, SURNAME_ROOTS, SURNAME_ENDINGS, range(100))
+    for contact_id, (first, root, ending, number) in enumerate(contacts, 1):
+        lookup.add(pa.Contact(
+            contact_id, f'{first} {root}{ending}', f'+7 9{contact_id:09d}', f'user{contact_id}@mail.ru',
+        ))
+    assert len(lookup.contact_tokens) == 200000
+    queries = ['Пеьров', 'Иаан', 'Александр Петров', 'Александр Пеьров', 'Ал', 'Иван П', 'Сидорова',
+               '900', '+7 900 000 12', 'Наталья Медвед', 'user1234', 'Дмитрий Зайцв']
+    for query in queries:
+        assert lookup.search(query)
+        timings = []
+        for _ in range(15):
+            started = time.perf_counter()
+            lookup.search(query)
+            timings.append(time.perf_counter() - started)
+        assert statistics.median(timings) < 0.001, query
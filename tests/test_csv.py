@@ -0,0 +1,44 @@
+import personal_assistant as pa
+
+ROWS = ''.join(f'{i},note {i},text,01-01-2024 10:00:00\n' for i in range(10, 16))
+
+
+def write_csv(workdir, body):
+    filename = workdir / 'notes.csv'
+    filename.write_text('note_id,title,content,timestamp\n' + body, encoding='utf-8')
+    return str(filename)
+
+
+def test_bad_row_stops_import_at_chunk_boundary(backend, workdir, capsys):
+    manager = pa.NoteManager()
+    manager.add_note('kept', 'text')
+    filename = write_csv(workdir, ROWS + '20,bad,text,not a date\n21,after,text,\n')
+    manager.import_csv(filename, chunk_size=4)
+    assert 'строке 8' in capsys.readouterr().out
+    # Первая часть файла применена целиком, часть с ошибкой и всё после неё - нет
+    expected = ['kept', 'note 10', 'note 11', 'note 12', 'note 13']
+    assert sorted(note.title for note in manager.note_list) == expected
+    manager.storage.close()
+
+    reopened = pa.NoteManager()
+    assert sorted(note.title for note in reopened.note_list) == expected
+
+
+def test_import_assigns_ids_and_skips_existing(workdir, capsys):
+    manager = pa.NoteManager()
+    manager.add_note('first', 'text')
+    filename = write_csv(workdir, '1,duplicate,text,\n,no id,text,\n' + ROWS)
+    manager.import_csv(filename, chunk_size=2)
+    output = capsys.readouterr().out
+    assert 'импортированы: 7' in output and 'существующим ID: 1' in output
+    assert manager.find_note(1).title == 'first'
+    assert manager.find_note(2).title == 'no id'
+    assert manager.add_note('next', 'text').note_id == 16
+
+
+def test_cli_reports_bad_csv(workdir, monkeypatch, capsys):
+    filename = write_csv(workdir, '1,bad,text,31-02-2024\n')
+    answers = iter(['1', '7', filename, '11', '6'])
+    monkeypatch.setattr('builtins.input', lambda prompt='': next(answers))
+    pa.main()
+    assert 'Ошибка в строке 2' in capsys.readouterr().out
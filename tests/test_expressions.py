@@ -0,0 +1,96 @@
+import math
+import random
+
+import pytest
+
+import personal_assistant as pa
+
+COLUMNS = {
+    'amount': [12.5, -3.0, 0.0, 250.75, -0.5, 1e-3, 7.0, -100.0],
+    'rate': [0.1, 2.0, -1.5, 0.0, 3.0, 1.0, -0.25, 0.5],
+}
+
+
+def scalar_many(expression, bindings, monkeypatch):
+    with monkeypatch.context() as patch:
+        patch.setattr(pa, 'load_numpy', lambda: None)
+        return pa.compile_expression(expression).evaluate_many(bindings)
+
+
+def same(first, second):
+    return all(
+        math.isnan(a) and math.isnan(b) or math.isclose(a, b, rel_tol=1e-9, abs_tol=1e-12)
+        for a, b in zip(first, second)
+    ) and len(first) == len(second)
+
+
+def random_expression(generator, depth=0):
+    choice = generator.randrange(10 if depth < 4 else 3)
+    if choice == 0:
+        return str(generator.choice([0, 1, 2, 3, 0.5, 10]))
+    if choice in (1, 2):
+        return generator.choice(['amount', 'rate'])
+    if choice < 7:
+        operator = generator.choice(['+', '-', '*', '/', '%', '^'])
+        if operator in ('%', '^'):
+            # pow и exp из libm и numpy могут различаться в последнем знаке, а остаток от деления большого числа
+            # это усиливает, поэтому правый операнд здесь постоянный, а exp проверяется отдельными примерами
+            right = str(generator.choice([2, 0.5] if operator == '^' else [2, 3, 0.5, 10]))
+        else:
+            right = random_expression(generator, depth + 1)
+        return f'({random_expression(generator, depth + 1)} {operator} {right})'
+    if choice == 7:
+        return f'-{random_expression(generator, depth + 1)}'
+    function = generator.choice(['abs', 'round', 'min', 'max', 'sqrt', 'log'])
+    if function == 'round':
+        args = [random_expression(generator, depth + 1), str(generator.randrange(3))]
+    elif function in ('min', 'max'):
+        args = [random_expression(generator, depth + 1) for _ in range(generator.randrange(1, 4))]
+    else:
+        args = [random_expression(generator, depth + 1)]
+    return f'{function}({", ".join(args)})'
+
+
+def test_scalar_and_vector_paths_agree(monkeypatch):
+    pytest.importorskip('numpy')
+    generator = random.Random(16)
+    for _ in range(400):
+        expression = random_expression(generator)
+        vector = pa.compile_expression(expression).evaluate_many(COLUMNS).tolist()
+        assert same(vector, scalar_many(expression, COLUMNS, monkeypatch)), expression
+
+
+@pytest.mark.parametrize('expression, expected', [
+    ('round(amount, 2)', [1.23, -2.57, 0.0]),
+    ('min(amount)', [1.234, -2.567, 0.0]),
+    ('min(3)', [3.0, 3.0, 3.0]),
+    ('max(amount, 1, -5)', [1.234, 1.0, 1.0]),
+    ('amount / 0', [math.nan] * 3),
+    ('log(amount)', [math.log(1.234), math.nan, math.nan]),
+    ('2 ^ 3 ^ 2', [512.0] * 3),
+    ('exp(amount * 1000)', [math.nan, 0.0, 1.0]),
+])
+def test_review_cases_on_both_paths(expression, expected, monkeypatch):
+    bindings = {'amount': [1.234, -2.567, 0.0]}
+    assert same(scalar_many(expression, bindings, monkeypatch), expected)
+    if pa.load_numpy() is not None:
+        assert same(pa.compile_expression(expression).evaluate_many(bindings).tolist(), expected)
+
+
+def test_constant_expression_gives_a_value(monkeypatch):
+    assert list(pa.compile_expression('2 + 2').evaluate_many({})) == [4.0]
+    assert scalar_many('2 + 2', {}, monkeypatch) == [4.0]
+    assert list(pa.compile_expression('2 + 2').evaluate_many([])) == []
+
+
+def test_calculator_messages():
+    calculator = pa.Calculator()
+    assert calculator.calculate('round(2.567, 2)') == 2.57
+    assert calculator.calculate('min(3)') == 3
+    assert calculator.calculate('x * (1 + y)', x=10, y=0.5) == 15
+    assert calculator.calculate('1 / 0') == 'Деление на ноль недопустимо'
+    assert calculator.calculate('round(1, 2, 3)') == 'Неверное число аргументов функции round: 3'
+    assert calculator.calculate('min()') == 'Неверное число аргументов функции min: 0'
+    assert calculator.calculate('foo(1)') == 'Неизвестная функция: foo'
+    assert calculator.calculate('2 +') == 'Неверное выражение: неожиданный конец'
+    assert calculator.calculate('x + 1') == 'Не задана переменная: x'
@@ -0,0 +1,92 @@
+import datetime
+import random
+
+import pytest
+
+import personal_assistant as pa
+
+
+def test_totals_match_records(workdir):
+    generator = random.Random(11)
+    manager = pa.FinanceManager()
+    for i in range(200):
+        day = datetime.date(2024, 1, 1) + datetime.timedelta(days=generator.randrange(90))
+        manager.add_record(round(generator.uniform(-100, 100), 2), generator.choice('abc'), day.strftime('%d-%m-%Y'), '')
+    manager.delete_record(5)
+    manager.edit_record(6, {'amount': 1000.0})
+    aggregates = manager.get_aggregates()
+
+    for _ in range(50):
+        start = datetime.datetime(2024, 1, 1) + datetime.timedelta(days=generator.randrange(100))
+        end = start + datetime.timedelta(days=generator.randrange(-10, 40))
+        records = [record for record in manager.record_list if start.date() <= record.date.date() <= end.date()]
+        income, expenses, categories = aggregates.totals(start, end)
+        assert abs(income - sum(record.amount for record in records if record.amount > 0)) < 1e-6
+        assert abs(expenses - sum(record.amount for record in records if record.amount < 0)) < 1e-6
+        expected = {}
+        for record in records:
+            expected[record.category] = expected.get(record.category, 0) + record.amount
+        assert categories.keys() == expected.keys()
+        assert all(abs(categories[name] - expected[name]) < 1e-6 for name in expected)
+
+
+def test_reversed_range_is_empty(workdir):
+    manager = pa.FinanceManager()
+    manager.add_record(50.0, 'a', '10-01-2024', '')
+    manager.add_record(-20.0, 'b', '20-01-2024', '')
+    assert manager.get_aggregates().totals(pa.parse_date('25-01-2024'), pa.parse_date('05-01-2024')) == (0, 0, {})
+    assert pa.finance_report(manager, '20-01-2024', '10-01-2024')['balance'] == 0
+
+
+def test_columns_match_aggregates(workdir, monkeypatch):
+    pytest.importorskip('numpy')
+    generator = random.Random(12)
+    records = [
+        pa.FinanceRecord(
+            i, round(generator.uniform(-100, 100), 2), generator.choice('abcd'),
+            None if i % 17 == 0 else datetime.datetime(2024, 1, 1) + datetime.timedelta(days=generator.randrange(60)), '',
+        )
+        for i in range(1, 1001)
+    ]
+    expected = pa.FinanceAggregates()
+    for record in records:
+        expected.add(record)
+    columns = pa.FinanceColumns.from_records(records)
+    aggregates = pa.FinanceAggregates.from_dict(columns.aggregate())
+    assert aggregates.days.keys() == expected.days.keys()
+    for day, (count, income, expenses, categories) in expected.days.items():
+        totals = aggregates.days[day]
+        assert totals[0] == count and abs(totals[1] - income) < 1e-6 and abs(totals[2] - expenses) < 1e-6
+        assert {name: value[0] for name, value in totals[3].items()} == {name: value[0] for name, value in categories.items()}
+
+    for _ in range(30):
+        start = datetime.datetime(2024, 1, 1) + datetime.timedelta(days=generator.randrange(70))
+        end = start + datetime.timedelta(days=generator.randrange(-5, 30))
+        income, expenses, categories = columns.totals(start, end)
+        expected_income, expected_expenses, expected_categories = expected.totals(start, end)
+        assert abs(income - expected_income) < 1e-6 and abs(expenses - expected_expenses) < 1e-6
+        assert categories.keys() == expected_categories.keys()
+        assert all(abs(categories[name] - expected_categories[name]) < 1e-6 for name in categories)
+    assert abs(sum(columns.totals()[:2]) - expected.balance()) < 1e-6
+
+
+
+def test_large_store_rebuilds_aggregates_from_columns(workdir, monkeypatch):
+    pytest.importorskip('numpy')
+    monkeypatch.setattr(pa, 'COLUMNAR_THRESHOLD', 10)
+    built = []
+    original = pa.FinanceColumns.aggregate
+
+    def aggregate(self):
+        built.append(len(self.amounts))
+        return original(self)
+
+    monkeypatch.setattr(pa.FinanceColumns, 'aggregate', aggregate)
+    manager = pa.FinanceManager()
+    for i in range(30):
+        manager.add_record(float(i - 10), 'ab'[i % 2], f'{i % 28 + 1:02d}-02-2024', '')
+    manager.aggregates = None
+    monkeypatch.setattr(manager.storage, 'load_sidecar', lambda name: None)
+    report = pa.finance_report(manager, '01-02-2024', '10-02-2024')
+    assert built == [30]
+    assert report['balance'] == sum(float(i - 10) for i in range(30) if i % 28 + 1 <= 10)
@@ -0,0 +1,75 @@
+import pytest
+
+import personal_assistant as pa
+
+
+@pytest.fixture
+def lazy(workdir, monkeypatch):
+    monkeypatch.setattr(pa, 'LAZY_LOADING', True)
+    return workdir
+
+
+def reopen_tasks(manager):
+    manager.storage.close()
+    pa._managers.clear()
+    return pa.TaskManager()
+
+
+def test_pack_loads_without_reading_records(lazy, monkeypatch):
+    manager = pa.TaskManager()
+    for i in range(1, 201):
+        manager.add_task(f'task {i}', 'описание', ('Высокий', 'Средний', 'Низкий')[i % 3], None)
+    manager.save_tasks()
+    assert (lazy / 'tasks.json').read_bytes().startswith(pa.PACK_MAGIC)
+
+    reads = []
+    original = pa.PackReader.read
+
+    def read(self, offset):
+        reads.append(offset)
+        return original(self, offset)
+
+    monkeypatch.setattr(pa.PackReader, 'read', read)
+    manager = reopen_tasks(manager)
+    assert isinstance(manager.task_list.reader, pa.PackReader)
+    assert reads == []
+    assert len(manager.task_list) == 200
+
+    assert manager.find_task(150).title == 'task 150'
+    assert len(reads) == 1
+    assert manager.find_task(150).title == 'task 150'
+    assert len(reads) == 1
+    assert manager.find_task(999) is None
+
+
+def test_pack_edits_survive_compaction(lazy):
+    manager = pa.TaskManager()
+    for i in range(1, 51):
+        manager.add_task(f'task {i}', '', 'Средний', None)
+    manager.save_tasks()
+
+    manager = reopen_tasks(manager)
+    manager.edit_task(10, {'title': 'edited'})
+    manager.delete_task(20)
+    manager.add_task('new', '', 'Низкий', None)
+    # Изменения попадают в журнал, непрочитанные записи снимка остаются на диске
+    assert manager.task_list.reader is not None
+    assert len(manager.task_list) == 50
+
+    manager = reopen_tasks(manager)
+    assert manager.find_task(10).title == 'edited'
+    assert manager.find_task(20) is None
+    assert manager.find_task(51).title == 'new'
+    manager.save_tasks()
+
+    manager = reopen_tasks(manager)
+    titles = {task.task_id: task.title for task in manager.task_list}
+    assert len(titles) == 50 and 20 not in titles
+    assert titles[10] == 'edited' and titles[51] == 'new' and titles[11] == 'task 11'
+
+
+def test_manager_is_cached_between_menus(lazy):
+    first = pa.get_manager(pa.NoteManager)
+    first.add_note('a', 'b')
+    assert pa.get_manager(pa.NoteManager) is first
+    assert pa.get_manager(pa.NoteManager).find_note(1).title == 'a'
@@ -0,0 +1,82 @@
+import json
+import pstats
+
+import pytest
+
+import personal_assistant as pa
+
+
+@pytest.fixture
+def measured(workdir):
+    pa.metrics.reset()
+    pa.enable_metrics()
+    yield pa.metrics
+    pa.disable_metrics()
+    pa.metrics.reset()
+
+
+def test_operations_and_counters_are_recorded(measured, workdir):
+    manager = pa.NoteManager()
+    for i in range(30):
+        manager.add_note(f'note {i}', 'текст')
+    for note_id in range(1, 11):
+        manager.find_note(note_id)
+    manager.save_notes()
+
+    data = measured.to_dict()
+    assert data['operations']['NoteManager.add_note']['calls'] == 30
+    find = data['operations']['NoteManager.find_note']
+    assert find['calls'] == 10 and 0 <= find['p50_s'] <= find['p99_s'] <= find['total_s']
+    assert data['counters']['snapshot.bytes_written'] > 0
+
+    measured.dump(str(workdir / 'metrics.json'))
+    assert json.loads((workdir / 'metrics.json').read_text(encoding='utf-8')) == data
+    measured.dump(str(workdir / 'metrics.prom'))
+    text = (workdir / 'metrics.prom').read_text(encoding='utf-8')
+    assert 'pa_operation_seconds_count{operation="NoteManager.add_note"} 30' in text
+    assert '# TYPE pa_snapshot_bytes_written_total counter' in text
+
+
+def test_disabled_metrics_leave_classes_untouched(workdir):
+    original = pa.NoteManager.add_note
+    pa.enable_metrics()
+    assert pa.NoteManager.add_note is not original
+    pa.disable_metrics()
+    assert pa.NoteManager.add_note is original
+
+    pa.metrics.reset()
+    manager = pa.NoteManager()
+    manager.add_note('a', 'b')
+    manager.save_notes()
+    assert pa.metrics.to_dict() == {'operations': {}, 'counters': {}}
+
+
+def test_reservoir_keeps_a_bounded_sample(monkeypatch):
+    metrics = pa.Metrics()
+    monkeypatch.setattr(metrics, 'sample_size', 100)
+    for i in range(1000):
+        metrics.observe('op', i / 1000)
+    calls, total, samples = metrics.timers['op']
+    assert calls == 1000 and len(samples) == 100
+    assert 0.3 < metrics.to_dict()['operations']['op']['p50_s'] < 0.7
+
+
+def test_profile_hooks(workdir):
+    manager = pa.NoteManager()
+    for i in range(20):
+        manager.add_note(f'note {i}', 'текст')
+
+    with pa.profile_method(manager, 'search_notes', 'cprofile', str(workdir / 'search.prof')):
+        manager.search_notes('note')
+    # Обёртка снята с экземпляра, класс не менялся
+    assert 'search_notes' not in vars(manager)
+    assert pstats.Stats(str(workdir / 'search.prof')).total_calls > 0
+
+    with pa.profile_method(pa.NoteManager, 'add_note', 'tracemalloc', str(workdir / 'add.txt')) as hook:
+        manager.add_note('big', 'x' * 100000)
+    assert hook.peak > 0
+    assert (workdir / 'add.txt').read_text(encoding='utf-8').startswith('Пиковая память')
+    assert pa.NoteManager.add_note is hook.original
+
+    with pytest.raises(ValueError):
+        pa.profile_method(manager, 'add_note', 'perf')
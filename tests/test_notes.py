@@ -0,0 +1,92 @@
+import datetime
+import json
+import time
+
+import personal_assistant as pa
+
+LEGACY_TIMES = ['01-02-2024 09:30:00', '15-01-2024 18:00:05', '01-02-2024 23:59:59', '02-02-2024 00:00:00']
+
+
+def epoch(text):
+    return int(datetime.datetime.strptime(text, '%d-%m-%Y %H:%M:%S').timestamp())
+
+
+def write_legacy_notes(workdir):
+    rows = [[i + 1, f'note {i + 1}', 'text', stamp] for i, stamp in enumerate(LEGACY_TIMES)]
+    snapshot = {'meta': {'last_id': 4}, 'fields': ['note_id', 'title', 'content', 'timestamp'], 'rows': rows}
+    (workdir / 'notes.json').write_text(json.dumps(snapshot, ensure_ascii=False), encoding='utf-8')
+
+
+def test_legacy_timestamps_become_epoch_seconds(backend, workdir):
+    write_legacy_notes(workdir)
+    manager = pa.NoteManager()
+    assert {note.note_id: note.timestamp for note in manager.note_list} == {
+        i + 1: epoch(stamp) for i, stamp in enumerate(LEGACY_TIMES)
+    }
+    # Внешний формат остаётся прежним
+    assert manager.find_note(1).to_dict()['timestamp'] == LEGACY_TIMES[0]
+
+    manager.edit_note(2, {'title': 'edited'})
+    manager.save_notes()
+    manager.storage.close()
+    pa._managers.clear()
+    reopened = pa.NoteManager()
+    assert all(isinstance(note.timestamp, int) for note in reopened.note_list)
+    assert reopened.find_note(1).timestamp == epoch(LEGACY_TIMES[0])
+    assert reopened.add_note('new', 'text').note_id == 5
+
+
+def test_notes_between_and_recent(workdir):
+    write_legacy_notes(workdir)
+    manager = pa.NoteManager()
+    ids = lambda notes: [note.note_id for note in notes]
+    # Дата без времени включает весь день
+    assert ids(manager.notes_between('01-02-2024', '01-02-2024')) == [1, 3]
+    assert ids(manager.notes_between('01-02-2024 10:00:00')) == [3, 4]
+    assert ids(manager.notes_between(end=str(epoch(LEGACY_TIMES[0])))) == [2, 1]
+    assert ids(manager.notes_between(limit=2, reverse=True)) == [4, 3]
+    assert ids(manager.notes_between('03-02-2024', '01-01-2024')) == []
+
+    new = manager.add_note('fresh', 'text')
+    assert ids(manager.recent_notes(2)) == [new.note_id, 4]
+    assert ids(manager.modified_since(60)) == [new.note_id]
+    # Правка переносит заметку в конец индекса времени
+    manager.edit_note(2, {'content': 'changed'})
+    assert manager.find_note(2).timestamp >= int(time.time()) - 5
+    assert 2 in ids(manager.recent_notes(2))
+    assert ids(manager.notes_between(limit=2)) == [1, 3]
+
+
+def test_timestamps_accept_dates_like_parse_date(workdir):
+    moment = datetime.datetime(2024, 2, 1, 9, 30)
+    assert pa.parse_timestamp(moment) == epoch('01-02-2024 09:30:00')
+    assert pa.parse_timestamp(datetime.date(2024, 2, 1)) == epoch('01-02-2024 00:00:00')
+    assert pa.parse_timestamp('01-02-2024') == pa.parse_timestamp(datetime.date(2024, 2, 1))
+    assert pa.parse_timestamp(' 1700000000 ') == 1700000000
+    assert pa.parse_timestamp(1700000000.5) == 1700000000
+
+    write_legacy_notes(workdir)
+    manager = pa.NoteManager()
+    ids = lambda notes: [note.note_id for note in notes]
+    day = datetime.date(2024, 2, 1)
+    assert ids(manager.notes_between(day, day)) == ids(manager.notes_between('01-02-2024', '01-02-2024')) == [1, 3]
+    assert ids(manager.notes_between(moment, datetime.datetime(2024, 2, 1, 23, 59, 59))) == [1, 3]
+    assert ids(manager.notes_between(end=moment)) == [2, 1]
+
+
+def test_legacy_csv_import_and_export(workdir):
+    manager = pa.NoteManager()
+    filename = workdir / 'legacy.csv'
+    filename.write_text(
+        'note_id,title,content,timestamp\n'
+        f'7,old,text,{LEGACY_TIMES[1]}\n'
+        f',epoch,text,{epoch(LEGACY_TIMES[0])}\n',
+        encoding='utf-8'
+    )
+    manager.import_csv(str(filename))
+    assert manager.find_note(7).timestamp == epoch(LEGACY_TIMES[1])
+    assert manager.find_note(8).timestamp == epoch(LEGACY_TIMES[0])
+
+    manager.export_csv(str(workdir / 'out.csv'))
+    lines = (workdir / 'out.csv').read_text(encoding='utf-8').splitlines()
+    assert lines[1:] == [f'7,old,text,{LEGACY_TIMES[1]}', f'8,epoch,text,{LEGACY_TIMES[0]}']
@@ -0,0 +1,89 @@
+import datetime
+import random
+
+import pytest
+
+import personal_assistant as pa
+
+
+def walk(page, limit):
+    records, after = [], None
+    while True:
+        chunk, after = page(after, limit)
+        records.extend(chunk)
+        if after is None:
+            return records
+
+
+@pytest.fixture
+def finance(backend):
+    generator = random.Random(3)
+    manager = pa.FinanceManager()
+    for i in range(150):
+        day = datetime.date(2024, 1, 1) + datetime.timedelta(days=generator.randrange(20))
+        # Повторяющиеся суммы и даты проверяют, что курсор различает записи с одинаковым ключом
+        manager.add_record(generator.choice([10.0, 20.0, -5.0, 7.5]), generator.choice('ab'), day.strftime('%d-%m-%Y'), '')
+    return manager
+
+
+@pytest.mark.parametrize('sort', sorted(pa.FINANCE_SORT_KEYS))
+@pytest.mark.parametrize('reverse', [False, True])
+def test_pages_match_sorted_records(finance, sort, reverse):
+    key = pa.FINANCE_SORT_KEYS[sort]
+    expected = sorted(finance.record_list, key=lambda record: (key(record), record.record_id), reverse=reverse)
+    for limit in (1, 7, 150, 200):
+        assert walk(lambda after, limit: finance.page_records(sort=sort, after=after, limit=limit, reverse=reverse),
+                    limit) == expected
+
+
+@pytest.mark.parametrize('sort', ['id', 'amount', 'date'])
+def test_filtered_pages_match_filter(finance, sort):
+    key = pa.FINANCE_SORT_KEYS[sort]
+    expected = sorted(finance.filter_records(category='a'), key=lambda record: (key(record), record.record_id))
+    assert walk(lambda after, limit: finance.page_records(category='a', sort=sort, after=after, limit=limit), 9) == expected
+
+
+def test_cursor_survives_changes_between_pages(finance):
+    key = pa.FINANCE_SORT_KEYS['amount']
+    seen = []
+    page, after = finance.page_records(sort='amount', limit=40)
+    seen.extend(page)
+    cursor_key = tuple(after)
+    # Между страницами: удаляем ещё не показанную запись и запись с уже показанной страницы,
+    # добавляем записи до и после курсора
+    pending = [record for record in finance.record_list if (key(record), record.record_id) > cursor_key]
+    finance.delete_record(pending[0].record_id)
+    finance.delete_record(page[0].record_id)
+    before = finance.add_record(-100.0, 'a', '01-01-2024', 'до курсора')
+    later = finance.add_record(100.0, 'a', '01-01-2024', 'после курсора')
+    while after is not None:
+        page, after = finance.page_records(sort='amount', after=after, limit=40)
+        seen.extend(page)
+
+    ids = [record.record_id for record in seen]
+    assert len(ids) == len(set(ids))
+    assert pending[0].record_id not in ids
+    assert before.record_id not in ids
+    assert later.record_id in ids
+    remaining = {record.record_id for record in finance.record_list} - {before.record_id}
+    assert set(ids) - {seen[0].record_id} == remaining
+
+
+def test_note_and_task_pages(backend):
+    notes = pa.NoteManager()
+    for i in range(30):
+        notes.add_note(f'note {i}', 'text')
+    assert [note.note_id for note in walk(lambda after, limit: notes.page_notes('id', after, limit, True), 4)] == \
+        list(range(30, 0, -1))
+
+    tasks = pa.TaskManager()
+    for i in range(40):
+        tasks.add_task(f'task {i}', '', list(pa.PRIORITY_RANKS)[i % 3], f'{i % 28 + 1:02d}-02-2024')
+        if i % 4 == 0:
+            tasks.change_done(i + 1)
+    key = pa.TASK_SORT_KEYS['due_date']
+    expected = sorted(tasks.filter_tasks(status=False, priority='Средний'),
+                      key=lambda task: (key(task), task.task_id))
+    assert expected
+    assert walk(lambda after, limit: tasks.page_tasks(False, 'Средний', sort='due_date', after=after, limit=limit),
+                3) == expected
@@ -0,0 +1,84 @@
+import datetime
+import json
+import math
+import multiprocessing
+import random
+
+import pytest
+
+import benchmark
+import personal_assistant as pa
+
+BASE = datetime.datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def sharded(monkeypatch):
+    monkeypatch.setattr(pa, 'PARALLEL_THRESHOLD', 100)
+    methods = []
+    original = multiprocessing.get_context
+
+    def get_context(method=None):
+        methods.append(method)
+        return original(method)
+    monkeypatch.setattr(multiprocessing, 'get_context', get_context)
+    return methods
+
+
+def random_day(generator):
+    return BASE + datetime.timedelta(days=generator.randrange(-800, 800))
+
+
+def test_shard_ranges_cover_every_day():
+    days = [0] * 50 + list(range(700000, 739000, 7))
+    ranges = pa.shard_ranges(days, 4)
+    assert len(ranges) == 4 and ranges[0][0] == 0 and ranges[-1][1] == math.inf
+    assert all(first[1] == second[0] for first, second in zip(ranges, ranges[1:]))
+    counts = [sum(start <= day < end for day in days) for start, end in ranges]
+    assert sum(counts) == len(days) and max(counts) < len(days) // 2
+
+
+def test_finance_shards_match_serial_pass(sharded):
+    generator = random.Random(20)
+    records = [
+        pa.FinanceRecord(
+            i, round(generator.uniform(-500, 500), 2), generator.choice('abcdef'),
+            random_day(generator) if i % 7 else None, '',
+        )
+        for i in range(1, 3001)
+    ]
+    serial = pa.aggregate_finance_records(records, 1)
+    parallel = pa.aggregate_finance_records(records, 3)
+    # Процессы запускаются без fork: в сервере работают потоки записи и таймеры
+    assert sharded and 'fork' not in sharded
+    assert sorted(parallel.days) == sorted(serial.days)
+    for start, end in [(None, None), (BASE, BASE + datetime.timedelta(days=90))]:
+        income, expenses, categories = serial.totals(start, end)
+        shard_income, shard_expenses, shard_categories = parallel.totals(start, end)
+        assert math.isclose(income, shard_income) and math.isclose(expenses, shard_expenses)
+        assert categories.keys() == shard_categories.keys()
+        assert all(math.isclose(amount, shard_categories[category]) for category, amount in categories.items())
+
+
+def test_task_yearly_summary_matches_serial_pass(sharded, workdir):
+    generator = random.Random(20)
+    manager = pa.TaskManager()
+    with pa.transaction():
+        for i in range(400):
+            due = random_day(generator).strftime('%d-%m-%Y') if i % 5 else None
+            task = manager.add_task(f'task {i}', '', generator.choice(['Высокий', 'Средний', 'Низкий']), due)
+            if i % 3 == 0:
+                manager.change_done(task.task_id)
+    assert manager.yearly_summary(3) == manager.yearly_summary(1)
+    assert sum(sum(map(sum, priorities.values())) for priorities in manager.yearly_summary(3).values()) == 400
+
+
+def test_benchmark_reports_speedup(sharded, workdir, monkeypatch):
+    for name in ('PA_STORAGE', 'PA_LAZY', 'PA_FORMAT'):
+        monkeypatch.setenv(name, '')
+    argv = ['--sizes', '300', '--ops', '5', '--managers', 'finance', '--workers', '2', '--workdir', str(workdir)]
+    assert benchmark.main(argv + ['--output', 'out.json']) == 0
+    results = json.loads((workdir / 'out.json').read_text(encoding='utf-8'))['results']
+    phases = {item['operation']: item for item in results}
+    assert phases['aggregate_serial']['count'] == 1
+    assert phases['aggregate_parallel']['workers'] == 2 and phases['aggregate_parallel']['speedup'] > 0
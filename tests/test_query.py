@@ -0,0 +1,139 @@
+import datetime
+import random
+
+import pytest
+
+import personal_assistant as pa
+
+CATEGORIES = ['еда', 'транспорт', 'зарплата', 'дом']
+PRIORITIES = list(pa.PRIORITY_RANKS)
+
+
+@pytest.fixture
+def filled(workdir):
+    generator = random.Random(7)
+    start = datetime.date(2024, 1, 1)
+    finance = pa.get_manager(pa.FinanceManager)
+    for i in range(300):
+        day = start + datetime.timedelta(days=generator.randrange(400))
+        finance.add_record(
+            round(generator.uniform(-500, 500), 2), generator.choice(CATEGORIES), day.strftime('%d-%m-%Y'), f'r{i}'
+        )
+    tasks = pa.get_manager(pa.TaskManager)
+    for i in range(200):
+        day = start + datetime.timedelta(days=generator.randrange(60))
+        due = day.strftime('%d-%m-%Y') if generator.random() < 0.8 else None
+        tasks.add_task(f'task {i}', 'desc', generator.choice(PRIORITIES), due)
+        if generator.random() < 0.3:
+            tasks.change_done(i + 1)
+    contacts = pa.get_manager(pa.ContactManager)
+    for name in ('Анна Петрова', 'Борис', 'Вера Ли'):
+        contacts.add_contact(name, '+7900000000', '')
+    notes = pa.get_manager(pa.NoteManager)
+    for i, text in enumerate(['встреча с Анна Петрова и Борис', 'позвонить Борис', 'купить хлеб', 'Вера', 'Ли Вера']):
+        notes.add_note(f'note {i}', text)
+    return generator
+
+
+def brute_force(source, predicates, sort=None, reverse=False, limit=None):
+    manager_class, attribute, sort_keys, fields = pa.QUERY_SOURCES[source]
+    collection = getattr(pa.get_manager(manager_class), attribute)
+    records = [record for record in collection if all(predicate(record) for predicate in predicates)]
+    if sort is not None:
+        key = pa.QueryField(source, sort).sort_key()
+        records.sort(key=lambda record: (key(record), getattr(record, collection.key)), reverse=reverse)
+    else:
+        records.sort(key=lambda record: getattr(record, collection.key))
+    return records[:limit] if limit is not None else records
+
+
+def random_condition(generator, source):
+    if source == 'finance':
+        low = round(generator.uniform(-500, 400), 2)
+        day = datetime.date(2024, 1, 1) + datetime.timedelta(days=generator.randrange(400))
+        return generator.choice([
+            ('amount', generator.choice(['<', '<=', '>', '>=']), low),
+            ('amount', 'between', [low, low + generator.uniform(0, 300)]),
+            ('category', '=', generator.choice(CATEGORIES)),
+            ('category', 'in', generator.sample(CATEGORIES, 2)),
+            ('date', generator.choice(['<', '>=', '=']), day.strftime('%d-%m-%Y')),
+            ('record_id', 'in', generator.sample(range(1, 320), 20)),
+            ('description', 'contains', f'r{generator.randrange(30)}'),
+        ])
+    day = datetime.date(2024, 1, 1) + datetime.timedelta(days=generator.randrange(60))
+    return generator.choice([
+        ('priority', '=', generator.choice(PRIORITIES)),
+        ('done', '=', generator.choice(['true', 'false'])),
+        ('due_date', generator.choice(['<=', '>']), day.strftime('%d-%m-%Y')),
+        ('due_date', 'between', [day.strftime('%d-%m-%Y'), '01-03-2024']),
+        ('task_id', '=', generator.randrange(1, 210)),
+    ])
+
+
+def test_planner_matches_full_scan(filled):
+    generator = filled
+    # Упорядоченные индексы строятся первым постраничным обходом
+    pa.get_manager(pa.FinanceManager).page_records(sort='amount')
+    pa.get_manager(pa.FinanceManager).page_records(sort='date')
+    for attempt in range(300):
+        source = generator.choice(['finance', 'tasks'])
+        conditions = [random_condition(generator, source) for _ in range(generator.randrange(1, 3))]
+        sort = generator.choice([None, *pa.QUERY_SOURCES[source][3]])
+        reverse = generator.random() < 0.5
+        limit = generator.choice([None, 1, 5, 50])
+        spec = {'from': source, 'where': conditions, 'order_by': sort, 'reverse': reverse, 'limit': limit}
+        query = pa.Query.from_dict(spec)
+        result = query.run()
+        if sort is not None:
+            assert result == brute_force(source, query.predicates, sort, reverse, limit), spec
+            continue
+        # Без сортировки порядок и выбор при ограничении определяет путь доступа
+        matching = brute_force(source, query.predicates)
+        assert len(result) == len(matching[:limit] if limit is not None else matching), spec
+        assert all(record in matching for record in result), spec
+        if limit is None:
+            assert len(set(map(id, result))) == len(matching), spec
+
+
+def test_explain_uses_indexes(filled):
+    pa.get_manager(pa.FinanceManager).page_records(sort='amount')
+    plan = pa.run_query({'from': 'finance', 'where': [['amount', '>', 490]]}, explain=True)['plan']
+    assert plan[0].startswith('диапазон упорядоченного индекса amount')
+    plan = pa.run_query({'from': 'tasks', 'where': [['task_id', '=', 5]]}, explain=True)['plan']
+    assert plan[0].startswith('поиск по ключу')
+    plan = pa.run_query({'from': 'tasks', 'where': [['priority', '=', 'Высокий']]}, explain=True)['plan']
+    assert plan[0].startswith('индекс priority')
+    plan = pa.run_query({'from': 'finance', 'order_by': 'amount', 'limit': 3}, explain=True)['plan']
+    assert 'сортировка не нужна' in plan[-2]
+
+
+def test_mentions_join_matches_brute_force(filled):
+    rows = pa.run_query({
+        'from': 'notes',
+        'join': [{'source': 'contacts', 'left': 'content', 'op': 'mentions', 'right': 'name'}],
+        'order_by': 'note_id',
+    })
+    pairs = sorted((row['notes']['note_id'], row['contacts']['name']) for row in rows)
+    expected = sorted(
+        (note.note_id, contact.name)
+        for note in pa.get_manager(pa.NoteManager).note_list
+        for contact in pa.get_manager(pa.ContactManager).contact_list
+        if f' {" ".join(pa.tokenize(contact.name))} ' in f' {" ".join(pa.tokenize(note.content))} '
+    )
+    assert pairs == expected
+    assert (1, 'Анна Петрова') in pairs and (4, 'Вера Ли') not in pairs
+
+
+@pytest.mark.parametrize('spec', [
+    {'from': 'unknown'},
+    {'from': 'tasks', 'where': [['missing', '=', 1]]},
+    {'from': 'tasks', 'where': [['priority', 'like', 'x']]},
+    {'from': 'tasks', 'where': [['due_date', 'contains', '2024']]},
+    {'from': 'finance', 'where': [['amount', 'match', 'x']]},
+    {'from': 'finance', 'where': [['date', '=', 'not a date']]},
+    {'from': 'tasks', 'limit': -1},
+    {'from': 'notes', 'join': [{'source': 'tasks', 'left': 'note_id', 'op': '<', 'right': 'task_id'}]},
+])
+def test_invalid_queries_raise_query_error(workdir, spec):
+    with pytest.raises(pa.QueryError):
+        pa.Query.from_dict(spec)
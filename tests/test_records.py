@@ -0,0 +1,55 @@
+import datetime
+import sys
+
+import pytest
+
+import personal_assistant as pa
+
+
+def sample_records():
+    day = datetime.datetime(2024, 3, 1)
+    return {
+        pa.Note: [pa.Note(i, f'note {i}', 'текст', 1700000000 + i) for i in range(1, 6)],
+        pa.Task: [pa.Task(i, f'task {i}', '', 'Высокий', None if i % 2 else day, i % 3 == 0) for i in range(1, 6)],
+        pa.Contact: [pa.Contact(i, f'name {i}', '+7 900', None if i == 2 else 'a@b.c') for i in range(1, 6)],
+        pa.FinanceRecord: [pa.FinanceRecord(i, i * 1.5 - 4, 'food', None if i == 3 else day, '') for i in range(1, 6)],
+    }
+
+
+def test_table_round_trips_records():
+    for record_class, records in sample_records().items():
+        table = pa.RecordTable.from_records(record_class, records)
+        assert len(table) == len(records)
+        assert [record.to_dict() for record in table] == [record.to_dict() for record in records]
+        assert table[2].to_dict() == records[2].to_dict()
+
+
+def test_table_keeps_numbers_in_arrays():
+    records = sample_records()[pa.FinanceRecord]
+    table = pa.RecordTable.from_records(pa.FinanceRecord, records)
+    assert table.column('amount').typecode == 'd'
+    assert table.column('date').typecode == 'q'
+    assert list(table.column('date'))[2] == 0
+    assert table.column('category')[0] is table.column('category')[4]
+
+    tasks = pa.RecordTable.from_records(pa.Task, sample_records()[pa.Task])
+    assert tasks.column('done').typecode == 'b'
+    assert list(tasks.column('done')) == [0, 0, 1, 0, 0]
+
+
+def test_table_is_smaller_than_objects():
+    records = [pa.FinanceRecord(i, float(i), 'food', datetime.datetime(2024, 1, 1), '') for i in range(10000)]
+    table = pa.RecordTable.from_records(pa.FinanceRecord, records)
+    objects = sum(sys.getsizeof(record) + sys.getsizeof(record.amount) for record in records)
+    columns = sum(sys.getsizeof(column) for column in table.columns)
+    assert columns * 2 < objects
+
+
+def test_finance_columns_from_table_match_records():
+    pytest.importorskip('numpy')
+    records = sample_records()[pa.FinanceRecord]
+    from_table = pa.FinanceColumns.from_table(pa.RecordTable.from_records(pa.FinanceRecord, records))
+    from_records = pa.FinanceColumns.from_records(records)
+    assert from_table.aggregate() == from_records.aggregate()
+    assert from_table.totals() == from_records.totals()
+    assert str(from_table.dates[2]) == 'NaT'
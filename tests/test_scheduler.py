@@ -0,0 +1,76 @@
+import datetime
+import random
+
+import personal_assistant as pa
+
+TODAY = datetime.date(2024, 6, 15)
+PRIORITIES = ['Высокий', 'Средний', 'Низкий']
+
+
+def expected_order(manager, start=None, end=None):
+    # Полный перебор: невыполненные задачи со сроком, по (срок, приоритет, ID)
+    tasks = [
+        task for task in manager.task_list
+        if task.due_ordinal and not task.done
+        and (start is None or task.due_ordinal >= start.toordinal())
+        and (end is None or task.due_ordinal <= end.toordinal())
+    ]
+    tasks.sort(key=lambda task: (task.due_ordinal, PRIORITIES.index(task.priority), task.task_id))
+    return [task.task_id for task in tasks]
+
+
+def ids(tasks):
+    return [task.task_id for task in tasks]
+
+
+def random_day(generator):
+    return (TODAY + datetime.timedelta(days=generator.randrange(-30, 30))).strftime('%d-%m-%Y')
+
+
+def test_agenda_matches_full_scan(backend, workdir):
+    generator = random.Random(4)
+    manager = pa.TaskManager()
+    for i in range(150):
+        due = None if i % 10 == 0 else random_day(generator)
+        manager.add_task(f'task {i}', '', generator.choice(PRIORITIES), due)
+    # Планировщик строится сейчас, дальше он ведётся изменениями
+    assert ids(manager.next_tasks(5, TODAY)) == expected_order(manager, TODAY)[:5]
+
+    for _ in range(120):
+        task_id = generator.randrange(1, 151)
+        if manager.find_task(task_id) is None:
+            continue
+        action = generator.randrange(4)
+        if action == 0:
+            manager.edit_task(task_id, {'due_date': random_day(generator)})
+        elif action == 1:
+            manager.edit_task(task_id, {'priority': generator.choice(PRIORITIES)})
+        elif action == 2:
+            manager.change_done(task_id)
+        else:
+            manager.delete_task(task_id)
+    manager.add_task('late', '', 'Высокий', random_day(generator))
+
+    assert ids(manager.next_tasks(10, TODAY)) == expected_order(manager, TODAY)[:10]
+    assert ids(manager.overdue_tasks(TODAY)) == expected_order(manager, None, TODAY - datetime.timedelta(days=1))
+    for _ in range(30):
+        start = TODAY + datetime.timedelta(days=generator.randrange(-35, 35))
+        end = start + datetime.timedelta(days=generator.randrange(-3, 20))
+        found = manager.tasks_due_between(start.strftime('%d-%m-%Y'), end.strftime('%d-%m-%Y'))
+        assert ids(found) == expected_order(manager, start, end)
+    assert ids(manager.tasks_due_between(limit=7)) == expected_order(manager)[:7]
+
+    # Перестроенный с нуля планировщик совпадает с поддерживаемым по изменениям
+    keys = list(manager.get_scheduler().keys)
+    manager.scheduler = None
+    assert manager.get_scheduler().keys == keys
+
+
+def test_same_day_orders_by_priority(workdir):
+    manager = pa.TaskManager()
+    manager.add_task('low', '', 'Низкий', '20-06-2024')
+    manager.add_task('high', '', 'Высокий', '20-06-2024')
+    manager.add_task('middle', '', 'Средний', '20-06-2024')
+    manager.add_task('earlier', '', 'Низкий', '19-06-2024')
+    assert [task.title for task in manager.next_tasks(10, TODAY)] == ['earlier', 'high', 'middle', 'low']
+    assert manager.overdue_tasks(datetime.date(2024, 6, 20))[0].title == 'earlier'
@@ -0,0 +1,83 @@
+import random
+
+import personal_assistant as pa
+
+WORDS = ['Ёлка', 'ёжик', 'Москва', 'молоко', 'магазин', 'отчёт', 'отчетность', 'report', 'Reports', 'план']
+
+
+def brute_force(manager, query):
+    # Заметки, где каждое слово запроса встречается хотя бы одним токеном
+    found = set()
+    for note in manager.note_list:
+        tokens = set(pa.tokenize(note.text()))
+        for word in query.split():
+            prefix = word.endswith('*')
+            for token in pa.tokenize(word):
+                if any(t.startswith(token) for t in tokens) if prefix else token in tokens:
+                    found.add(note.note_id)
+    return found
+
+
+def test_tokens_fold_case_and_yo():
+    assert pa.tokenize('Ёлка, ОТЧЁТ и Report-2024') == ['елка', 'отчет', 'и', 'report', '2024']
+
+
+def test_search_matches_tokens_and_prefixes(backend, workdir):
+    generator = random.Random(8)
+    manager = pa.NoteManager()
+    for i in range(60):
+        manager.add_note(' '.join(generator.sample(WORDS, 2)), ' '.join(generator.choices(WORDS, k=4)))
+    for note_id in range(1, 61, 7):
+        manager.delete_note(note_id)
+    for note_id in range(2, 61, 5):
+        if manager.find_note(note_id):
+            manager.edit_note(note_id, {'content': 'совсем другое'})
+
+    for query in ['елка', 'ЁЖИК', 'отч*', 'отчет', 'rep*', 'мо* план', 'другое', 'нет']:
+        results = manager.get_text_index().search(query, limit=1000)
+        assert {note_id for note_id, score in results} == brute_force(manager, query)
+        scores = [score for note_id, score in results]
+        assert scores == sorted(scores, reverse=True)
+
+
+def test_ranking_prefers_frequent_and_short(workdir):
+    manager = pa.NoteManager()
+    manager.add_note('пусто', 'ничего интересного здесь нет вообще совсем')
+    manager.add_note('бюджет', 'бюджет на месяц: бюджет')
+    manager.add_note('длинная', 'бюджет ' + 'слово ' * 50)
+    assert [note.note_id for note in manager.search_notes('бюджет')] == [2, 3]
+
+
+def test_index_survives_reopen_and_catches_up(workdir, monkeypatch):
+    manager = pa.NoteManager()
+    manager.add_note('Покупки', 'молоко и хлеб')
+    manager.add_note('Работа', 'квартальный отчёт')
+    manager.search_notes('молоко')
+    manager.save_notes()
+    # После снимка индекса журнал получает ещё изменения
+    manager.add_note('Дача', 'купить молоко')
+    manager.delete_note(1)
+    manager.storage.close()
+    pa._managers.clear()
+
+    loaded = []
+    original = pa.TextIndex.from_dict.__func__
+
+    def from_dict(cls, data):
+        loaded.append(len(data['lengths']))
+        return original(cls, data)
+
+    monkeypatch.setattr(pa.TextIndex, 'from_dict', classmethod(from_dict))
+    reopened = pa.NoteManager()
+    assert [note.note_id for note in reopened.search_notes('молоко')] == [3]
+    assert [note.note_id for note in reopened.search_notes('отч*')] == [2]
+    assert loaded == [2]
+
+
+def test_import_updates_index(workdir):
+    (workdir / 'notes.csv').write_text(
+        'note_id,title,content,timestamp\n1,Импорт,Ёмкость склада,01-01-2024 10:00:00\n', encoding='utf-8'
+    )
+    manager = pa.NoteManager()
+    manager.import_csv('notes.csv')
+    assert [note.note_id for note in manager.search_notes('емкость')] == [1]
@@ -0,0 +1,60 @@
+import io
+import os
+
+import pytest
+
+import personal_assistant as pa
+
+FIELDS = ['id', 'number', 'name', 'flag', 'extra']
+
+ROWS = [
+    [1, 1.5, 'alpha', True, None],
+    [2, -2.25, 'beta', False, 2 ** 63],
+    [3, None, 'alpha', None, -2 ** 63 - 1],
+    [4, 0.0, '', True, 2 ** 100],
+    [2 ** 63 - 1, 1e300, 'юникод', False, 'mixed'],
+    [-2 ** 63, float('inf'), 'alpha', True, [1, 'two', {'three': 3}]],
+]
+
+
+@pytest.mark.parametrize('serializer', [pa.JsonSerializer(), pa.BinarySerializer()])
+def test_round_trip(serializer):
+    file = io.BytesIO()
+    meta = {'last_id': 2 ** 64, 'generation': 3}
+    serializer.dump(file, meta, FIELDS, ROWS)
+    data = file.getvalue()
+
+    assert pa.detect_serializer(data) is pa.SERIALIZERS[serializer.name]
+    loaded = serializer.load(data)
+    assert loaded['meta'] == meta
+    assert loaded['fields'] == FIELDS
+    assert [list(row) for row in loaded['rows']] == ROWS
+
+
+def test_binary_round_trip_without_rows():
+    file = io.BytesIO()
+    pa.BinarySerializer().dump(file, {}, FIELDS, [])
+    loaded = pa.BinarySerializer().load(file.getvalue())
+    assert list(loaded['rows']) == []
+    assert loaded['fields'] == FIELDS
+
+
+def test_storage_switches_format_without_migration(tmp_path):
+    filename = str(tmp_path / 'data.json')
+    rows = [[i, f'title {i}', 'x' * (i % 3), i * 1000] for i in range(1, 50)] + [[50, 'big', '', 2 ** 70]]
+    binary = pa.JournalStorage(filename, ['id', 'title', 'content', 'timestamp'], serializer='binary')
+    binary.compact(rows)
+    binary.close()
+    with open(filename, 'rb') as file:
+        assert file.read(len(pa.BinarySerializer.magic)) == pa.BinarySerializer.magic
+
+    # Формат снимка определяется по содержимому, а не по настройке
+    reader = pa.JournalStorage(filename, ['id', 'title', 'content', 'timestamp'], serializer='json')
+    assert sorted(map(list, reader.load())) == rows
+    reader.put([51, 'new', '', 1])
+    reader.compact(rows + [[51, 'new', '', 1]])
+    reader.close()
+    assert os.path.getsize(filename) > 0
+    again = pa.JournalStorage(filename, ['id', 'title', 'content', 'timestamp'])
+    assert len(again.load()) == 51
+    again.close()
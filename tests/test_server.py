@@ -0,0 +1,91 @@
+import asyncio
+import contextlib
+import json
+import socket
+import threading
+import time
+
+import personal_assistant as pa
+
+CLIENTS = 8
+REQUESTS = 25
+
+
+@contextlib.contextmanager
+def running_server(path):
+    # Менеджеры создаются в потоке цикла событий, как при обычном запуске сервера
+    state = {}
+
+    async def main():
+        state['loop'] = asyncio.get_running_loop()
+        state['task'] = asyncio.current_task()
+        await pa.AssistantServer(path=str(path), flush_interval=0.01).serve()
+
+    def run():
+        with contextlib.suppress(asyncio.CancelledError):
+            asyncio.run(main())
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not path.exists():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        state['loop'].call_soon_threadsafe(state['task'].cancel)
+        thread.join()
+
+
+def client(path, number, responses):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as connection:
+        connection.connect(str(path))
+        stream = connection.makefile('rwb')
+        for i in range(REQUESTS):
+            request_id = f'{number}-{i}'
+            if i % 5 == 4:
+                request = {'id': request_id, 'op': 'calculator.calculate', 'params': {'expression': f'{number} * 10 + {i}'}}
+            else:
+                request = {'id': request_id, 'op': 'notes.add', 'params': {'title': request_id, 'content': 'текст'}}
+            stream.write(json.dumps(request).encode('utf-8') + b'\n')
+            stream.flush()
+            responses.append((request, json.loads(stream.readline())))
+        stream.write(b'not json\n')
+        stream.flush()
+        responses.append((None, json.loads(stream.readline())))
+
+
+def test_concurrent_clients_share_one_store(workdir):
+    path = workdir / 'assistant.sock'
+    responses = []
+    with running_server(path):
+        threads = [threading.Thread(target=client, args=(path, number, responses)) for number in range(CLIENTS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    assert len(responses) == CLIENTS * (REQUESTS + 1)
+    note_ids = {}
+    for request, response in responses:
+        if request is None:
+            assert response['ok'] is False
+            continue
+        assert response['ok'] and response['id'] == request['id']
+        if request['op'] == 'notes.add':
+            assert response['result']['title'] == request['id']
+            note_ids[response['result']['note_id']] = request['id']
+        else:
+            number, i = map(int, request['id'].split('-'))
+            assert response['result'] == number * 10 + i
+    # Номера заметок уникальны и идут подряд, хотя запросы клиентов перемежались
+    assert sorted(note_ids) == list(range(1, CLIENTS * REQUESTS * 4 // 5 + 1))
+
+    # Фоновый писатель сбросил все записи на диск до остановки сервера
+    storage = pa.open_storage('notes', pa.Note, close_at_exit=False)
+    try:
+        rows = storage.load()
+    finally:
+        storage.close()
+    assert {row[0]: row[1] for row in rows} == note_ids
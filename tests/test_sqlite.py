@@ -0,0 +1,124 @@
+import datetime
+import json
+import os
+import random
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+import personal_assistant as pa
+
+WRITER_SCRIPT = '''
+import sys
+sys.path.insert(0, sys.argv[1])
+import personal_assistant as pa
+manager = pa.FinanceManager()
+manager.add_record(500.0, 'бонус', '03-01-2024', '')
+manager.edit_record(1, {'amount': -1.0, 'category': 'еда'})
+manager.delete_record(2)
+manager.storage.close()
+'''
+
+
+@pytest.fixture
+def sqlite_backend(monkeypatch, workdir):
+    monkeypatch.setattr(pa, 'STORAGE_BACKEND', 'sqlite')
+    return workdir
+
+
+def fill(manager, count=60):
+    generator = random.Random(5)
+    for i in range(count):
+        day = datetime.date(2024, 1, 1) + datetime.timedelta(days=generator.randrange(30))
+        manager.add_record(round(generator.uniform(-50, 50), 2), generator.choice(['еда', 'дом', 'зарплата']),
+                           day.strftime('%d-%m-%Y'), '')
+
+
+def reopen():
+    pa._managers.clear()
+    return pa.FinanceManager()
+
+
+def assert_totals_match(manager, records):
+    start, end = datetime.datetime(2024, 1, 5), datetime.datetime(2024, 1, 20)
+    income, expenses, categories = manager.get_aggregates().totals(start, end)
+    selected = [record for record in records if start <= record.date <= end]
+    assert income == pytest.approx(sum(record.amount for record in selected if record.amount > 0))
+    assert expenses == pytest.approx(sum(record.amount for record in selected if record.amount <= 0))
+    assert manager.get_aggregates().balance() == pytest.approx(sum(record.amount for record in records))
+    expected = {}
+    for record in selected:
+        expected[record.category] = expected.get(record.category, 0) + record.amount
+    assert categories == pytest.approx(expected)
+
+
+def test_load_is_lazy_and_reports_skip_records(sqlite_backend):
+    manager = pa.FinanceManager()
+    fill(manager)
+    expected = {record.record_id: record.to_row() for record in manager.record_list}
+    manager.storage.close()
+
+    manager = reopen()
+    # Строки не читаются при запуске, отчёт строится по сводной таблице
+    assert manager.record_list.reader is not None
+    assert not manager.record_list.items
+    assert len(manager.record_list) == 60
+    manager.generate_report('05-01-2024', '20-01-2024')
+    assert manager.find_record(7).to_row() == expected[7]
+    assert manager.record_list.reader is not None and len(manager.record_list.items) == 1
+    assert [record.record_id for record in manager.filter_records(category='еда')] == sorted(
+        record_id for record_id, row in expected.items() if row[2] == 'еда'
+    )
+
+    manager.edit_record(3, {'amount': 1000.0})
+    manager.delete_record(4)
+    manager.add_record(-20.0, 'дом', '10-01-2024', '')
+    assert manager.record_list.reader is not None
+    assert len(manager.record_list) == 60
+    assert_totals_match(manager, list(manager.record_list))
+
+
+def test_summary_follows_other_processes(sqlite_backend):
+    manager = pa.FinanceManager()
+    fill(manager, 10)
+    manager.storage.close()
+    manager = reopen()
+    manager.get_aggregates()
+
+    module_dir = os.path.dirname(pa.__file__)
+    env = dict(os.environ, PA_STORAGE='sqlite')
+    subprocess.run([sys.executable, '-c', WRITER_SCRIPT, module_dir], cwd=sqlite_backend, env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    manager.storage.refresh()
+    records = list(manager.record_list)
+    assert len(records) == 10
+    assert manager.find_record(1).category == 'еда' and manager.find_record(2) is None
+    assert_totals_match(manager, records)
+
+
+def test_summary_is_built_for_existing_database(sqlite_backend):
+    manager = pa.FinanceManager()
+    fill(manager, 30)
+    manager.storage.close()
+    connection = sqlite3.connect(str(sqlite_backend / 'assistant.db'))
+    with connection:
+        for event in ('insert', 'delete', 'update'):
+            connection.execute(f'DROP TRIGGER finance_summary_{event}')
+        connection.execute('DROP TABLE finance_summary')
+    connection.close()
+
+    manager = reopen()
+    assert_totals_match(manager, list(manager.record_list))
+
+
+def test_json_store_is_migrated(sqlite_backend):
+    rows = [[1, 10.0, 'еда', '01-01-2024', 'a'], [2, -5.0, 'дом', '02-01-2024', 'b']]
+    snapshot = {'meta': {'last_id': 2}, 'fields': ['record_id', 'amount', 'category', 'date', 'description'],
+                'rows': rows}
+    (sqlite_backend / 'finance.json').write_text(json.dumps(snapshot, ensure_ascii=False), encoding='utf-8')
+    manager = pa.FinanceManager()
+    assert [record.to_dict()['date'] for record in manager.record_list] == ['01-01-2024', '02-01-2024']
+    assert manager.get_aggregates().balance() == 5.0
+    assert manager.add_record(1.0, 'еда', '03-01-2024', '').record_id == 3
@@ -0,0 +1,77 @@
+import json
+import os
+
+import personal_assistant as pa
+
+FIELDS = ['note_id', 'title', 'content', 'timestamp']
+
+
+def open_journal(workdir, **kwargs):
+    return pa.JournalStorage(str(workdir / 'notes.json'), FIELDS, **kwargs)
+
+
+def test_journal_replay_after_reopen(workdir):
+    storage = open_journal(workdir)
+    storage.put([1, 'a', 'x', 10])
+    storage.put([2, 'b', 'y', 20])
+    storage.put([1, 'a2', 'x', 30])
+    storage.delete(2)
+    storage.close()
+
+    reopened = open_journal(workdir)
+    assert reopened.load() == [[1, 'a2', 'x', 30]]
+    reopened.close()
+
+
+def test_torn_tail_is_ignored_and_truncated(workdir):
+    storage = open_journal(workdir)
+    storage.put([1, 'a', 'x', 10])
+    storage.close()
+    valid_size = os.path.getsize(storage.journal_filename)
+    with open(storage.journal_filename, 'ab') as file:
+        file.write(b'{"op":"put","row":[2,"b"')
+
+    reopened = open_journal(workdir)
+    assert reopened.load() == [[1, 'a', 'x', 10]]
+    assert os.path.getsize(storage.journal_filename) == valid_size
+    # Запись после восстановления продолжает целый журнал
+    reopened.put([3, 'c', 'z', 30])
+    reopened.close()
+    again = open_journal(workdir)
+    assert sorted(again.load()) == [[1, 'a', 'x', 10], [3, 'c', 'z', 30]]
+    again.close()
+
+
+def test_compaction_writes_generation_marker(workdir):
+    first = open_journal(workdir)
+    first.put([1, 'a', 'x', 10])
+    second = open_journal(workdir)
+    second.load()
+    changes = []
+    second.listener = changes.append
+
+    first.compact([[1, 'a', 'x', 10], [2, 'b', 'y', 20]])
+    with open(first.journal_filename, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert [json.loads(line) for line in lines] == [{'op': 'meta', 'name': 'generation', 'value': 1}]
+
+    # Второй процесс видит новое поколение и перечитывает снимок целиком
+    second.refresh()
+    assert changes[0] is None
+    assert sorted(second.load()) == [[1, 'a', 'x', 10], [2, 'b', 'y', 20]]
+    assert second.meta['generation'] == 1
+    first.close()
+    second.close()
+
+
+def test_manager_compaction_keeps_records(backend):
+    manager = pa.NoteManager()
+    manager.storage.compact_threshold = 5
+    for i in range(20):
+        manager.add_note(f'note {i}', 'text')
+    manager.delete_note(3)
+    manager.storage.close()
+
+    reopened = pa.NoteManager()
+    assert sorted(note.note_id for note in reopened.note_list) == [i for i in range(1, 21) if i != 3]
+    assert reopened.add_note('next', 'text').note_id == 21
@@ -0,0 +1,106 @@
+import os
+
+import personal_assistant as pa
+
+
+def write_notes(directory, rows=(), deleted=()):
+    storage = pa.open_storage('notes', pa.Note, directory=str(directory), close_at_exit=False)
+    try:
+        try:
+            storage.load()
+        except FileNotFoundError:
+            pass
+        for row in rows:
+            storage.put(list(row))
+        for record_id in deleted:
+            storage.delete(record_id)
+    finally:
+        storage.close()
+
+
+def read_notes(directory):
+    storage = pa.open_storage('notes', pa.Note, directory=str(directory), close_at_exit=False)
+    try:
+        try:
+            rows = storage.load()
+        except FileNotFoundError:
+            rows = []
+        return {row[0]: list(row) for row in rows}, storage.high_water()
+    finally:
+        storage.close()
+
+
+def sync_notes(source, target, prefer=None):
+    return pa.sync_stores(str(source), str(target), prefer=prefer, names=['notes'])['notes']
+
+
+def test_sync_three_way_merge(backend, workdir):
+    laptop, phone = workdir / 'laptop', workdir / 'phone'
+    os.makedirs(laptop)
+    write_notes(laptop, [[1, 'one', 'a', 100], [2, 'two', 'b', 200], [3, 'three', 'c', 300]])
+
+    result = sync_notes(laptop, phone)
+    assert (result['updated'], result['deleted'], result['conflicts']) == (3, 0, [])
+    assert read_notes(phone)[0] == read_notes(laptop)[0]
+
+    # Изменения только на одной из сторон переносятся без конфликтов
+    write_notes(laptop, [[1, 'one v2', 'a', 110]], deleted=[3])
+    write_notes(phone, [[2, 'two phone', 'b', 210]])
+    result = sync_notes(laptop, phone)
+    assert (result['updated'], result['deleted'], result['conflicts']) == (1, 1, [])
+    rows, last_id = read_notes(phone)
+    assert rows == {1: [1, 'one v2', 'a', 110], 2: [2, 'two phone', 'b', 210]}
+    # Удалённый id не выдаётся снова на целевой стороне
+    assert last_id == 3
+
+    # Правка одной записи на обеих сторонах - конфликт, целевая сторона не меняется
+    write_notes(laptop, [[1, 'laptop', 'a', 120]])
+    write_notes(phone, [[1, 'phone', 'a', 130]])
+    result = sync_notes(laptop, phone)
+    assert result['conflicts'] == [1]
+    assert read_notes(phone)[0][1][1] == 'phone'
+    # Конфликт остаётся конфликтом до явного выбора стороны
+    assert sync_notes(laptop, phone)['conflicts'] == [1]
+    result = sync_notes(laptop, phone, prefer='source')
+    assert (result['updated'], result['conflicts']) == (1, [])
+    assert read_notes(phone)[0][1][1] == 'laptop'
+    assert sync_notes(laptop, phone)['updated'] == 0
+
+
+def test_sync_dry_run_changes_nothing(backend, workdir):
+    source, target = workdir / 'source', workdir / 'target'
+    os.makedirs(source)
+    write_notes(source, [[1, 'one', 'a', 100]])
+    result = pa.sync_stores(str(source), str(target), dry_run=True, names=['notes'])['notes']
+    assert result['updated'] == 1
+    assert read_notes(target)[0] == {}
+    assert not os.path.exists(target / '.sync' / 'notes.digest')
+
+
+def test_backup_and_restore(backend, workdir):
+    data, backups, restored = workdir / 'data', workdir / 'backups', workdir / 'restored'
+    os.makedirs(data)
+    write_notes(data, [[1, 'one', 'a', 100], [2, 'two', 'b', 200]])
+    first, collections = pa.backup_store(str(data), str(backups))
+    assert len(collections['notes']['rows']) == 2
+
+    write_notes(data, [[3, 'three', 'c', 300], [1, 'one v2', 'a', 110]], deleted=[2])
+    second, collections = pa.backup_store(str(data), str(backups))
+    # Приращение содержит только изменённые и удалённые записи
+    assert [row[0] for row in collections['notes']['rows']] == [1, 3]
+    assert collections['notes']['deleted'] == [2]
+    assert collections['tasks']['rows'] == []
+
+    # В целевом каталоге уже есть лишняя запись - после восстановления её быть не должно
+    os.makedirs(restored)
+    write_notes(restored, [[9, 'stale', '', 1]])
+    counts = pa.restore_backup(str(backups), str(restored))
+    assert counts['notes'] == 2
+    rows, last_id = read_notes(restored)
+    assert rows == read_notes(data)[0]
+    assert last_id >= 9
+
+    # Восстановление на момент первой копии
+    until = os.path.basename(first)[:-len('.pabak')]
+    pa.restore_backup(str(backups), str(workdir / 'old'), until=until)
+    assert sorted(read_notes(workdir / 'old')[0]) == [1, 2]
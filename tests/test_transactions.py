@@ -0,0 +1,83 @@
+import pytest
+
+import personal_assistant as pa
+
+
+def reopen(manager_class):
+    for manager in pa._managers.values():
+        manager.storage.close()
+    pa._managers.clear()
+    return pa.get_manager(manager_class)
+
+
+def journal_lines(workdir, name):
+    return (workdir / f'{name}.json.log').read_text(encoding='utf-8').splitlines()
+
+
+def test_failed_transaction_rolls_back_every_manager(backend, workdir):
+    notes = pa.get_manager(pa.NoteManager)
+    tasks = pa.get_manager(pa.TaskManager)
+    notes.add_note('kept', '')
+    tasks.add_task('kept', '', 'Средний', None)
+
+    with pytest.raises(RuntimeError):
+        with pa.transaction():
+            notes.add_note('lost', '')
+            notes.edit_note(1, {'title': 'changed'})
+            tasks.delete_task(1)
+            tasks.add_task('lost', '', 'Высокий', '01-01-2025')
+            raise RuntimeError('stop')
+
+    # Память возвращается к сохранённому состоянию
+    assert [note.title for note in notes.note_list] == ['kept']
+    assert [task.title for task in tasks.task_list] == ['kept']
+    assert notes.search_notes('lost') == []
+    assert tasks.next_tasks(5) == []
+
+    notes.add_note('after', '')
+    notes = reopen(pa.NoteManager)
+    tasks = pa.get_manager(pa.TaskManager)
+    assert sorted(note.title for note in notes.note_list) == ['after', 'kept']
+    assert [task.title for task in tasks.task_list] == ['kept']
+
+
+def test_nested_failure_discards_only_the_block(workdir):
+    manager = pa.get_manager(pa.NoteManager)
+    with pa.transaction():
+        manager.add_note('outer', '')
+        with pytest.raises(KeyError):
+            with manager.storage.transaction():
+                manager.add_note('inner', '')
+                raise KeyError('inner')
+        # Вложенный блок отброшен, внешняя транзакция продолжается
+        assert manager.storage.pending[-1]['row'][1] == 'outer'
+    manager = reopen(pa.NoteManager)
+    assert [note.title for note in manager.note_list] == ['outer']
+
+
+def test_transaction_writes_one_journal_line(workdir):
+    manager = pa.get_manager(pa.NoteManager)
+    manager.add_note('first', '')
+    before = len(journal_lines(workdir, 'notes'))
+    with pa.transaction():
+        for i in range(200):
+            manager.add_note(f'note {i}', '')
+        for note_id in range(2, 50):
+            manager.edit_note(note_id, {'content': 'edited'})
+    lines = journal_lines(workdir, 'notes')
+    assert len(lines) == before + 1
+    manager = reopen(pa.NoteManager)
+    assert len(manager.note_list) == 201
+    assert manager.find_note(49).content == 'edited'
+
+
+def test_writes_are_batched_by_size(workdir, monkeypatch):
+    monkeypatch.setattr(pa, 'WRITE_BATCH_SIZE', 50)
+    manager = pa.get_manager(pa.NoteManager)
+    for i in range(120):
+        manager.add_note(f'note {i}', '')
+    assert len(journal_lines(workdir, 'notes')) == 2
+    assert len(manager.storage.pending) == 20
+    # Остаток сбрасывается при закрытии хранилища
+    manager = reopen(pa.NoteManager)
+    assert len(manager.note_list) == 120